@@ -1,16 +1,59 @@
 import os
+import json
+import argparse
+import contextlib
+import io
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore
+import queue
 import sys
-from collections import defaultdict
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
 from typing import Dict, List, Any
 
+from merger_backends import (AsyncFirestoreBackend, BatchCommitError, BatchWriter, FirestoreBackend,
+                             PartitionedScan, RateLimiter, SnapshotBackend, DEFAULT_ASYNC_CONCURRENCY,
+                             DEFAULT_WRITE_RATE, SNAPSHOT_COLLECTIONS)
+from merger_cache import CachedBackend, SnapshotCache
+from merger_index import DiskLocationIndex, allocation_status
+from merger_journal import CheckpointJournal, file_digest
+from merger_matching import (DEFAULT_FUZZY_THRESHOLD, DEFAULT_LAYOUT_THRESHOLD, group_names,
+                             split_by_layout)
+from merger_model import Hostel
+from merger_placement import floor_key, plan_placements
+from merger_report import NORMAL, QUIET, VERBOSE, reporter
+from merger_stats import campus_stats, load_numpy
+from merger_trace import traced, tracer
+from merger_watch import OccupancyIndex
+
 # Load environment variables
 load_dotenv()
 
-def initialize_firebase():
-    """Initialize Firebase Admin SDK"""
+# The only roomAllocations fields the merger reads
+ALLOCATION_FIELDS = ('studentRegNumber', 'hostelId', 'roomId')
+
+# Documents per page when streaming a whole collection
+DEFAULT_PAGE_SIZE = 300
+
+# Allocations checked, and fixes written, per round of a disk-backed validation
+DEFAULT_VALIDATION_CHUNK = 5000
+
+COMMANDS = ('merge', 'plan', 'apply', 'watch', 'stats')
+
+# Plan files: format version and the (record type, plan key) of each line after the header
+PLAN_VERSION = 1
+PLAN_RECORDS = (('group', 'groups'), ('move', 'moves'), ('write', 'writes'), ('fix', 'fixes'))
+
+def initialize_firebase(use_async=False):
+    """Initialize Firebase Admin SDK
+    
+    Returns the asyncio Firestore client instead of the blocking one if use_async is set.
+    """
+    # Imported lazily so snapshot runs work without the Admin SDK installed
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
     service_account_path = os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH')
     
     if service_account_path and os.path.exists(service_account_path):
@@ -23,99 +66,487 @@ def initialize_firebase():
             'projectId': os.getenv('NEXT_PUBLIC_FIREBASE_PROJECT_ID')
         })
     
+    if use_async:
+        from firebase_admin import firestore_async
+        return firestore_async.client()
     return firestore.client()
 
-def get_all_hostels(db):
-    """Fetch all hostels from the database."""
-    hostels_ref = db.collection("hostels")
+def initialize_backend(args):
+    """Create the datastore backend selected on the command line."""
+    if args.snapshot:
+        backend = SnapshotBackend(args.snapshot, output_dir=args.write_snapshot)
+        print(f"📂 Using local snapshot: {args.snapshot}")
+        if args.write_snapshot:
+            print(f"   Results will be written to: {args.write_snapshot}")
+        return backend
+    
+    db = initialize_firebase(use_async=args.use_async)
+    print("✅ Firebase connected successfully")
+    if args.use_async:
+        print(f"⚡ Async mode: up to {args.concurrency} concurrent requests")
+        return AsyncFirestoreBackend(db, concurrency=args.concurrency)
+    return FirestoreBackend(db)
+
+@traced
+def sync_cache(backend, cache_path, page_size=DEFAULT_PAGE_SIZE):
+    """Bring the local snapshot cache up to date with the backend.
+    
+    Only documents that changed since the last sync are downloaded.
+    
+    Returns:
+        CachedBackend: reads from the cache, writes to backend
+    """
+    print(f"🗄️ Syncing local cache {cache_path}...")
+    cache = SnapshotCache(cache_path)
+    try:
+        for collection in SNAPSHOT_COLLECTIONS:
+            stats = cache.sync(backend, collection, page_size=page_size)
+            print(f"   {collection}: {stats['listed']} documents, {stats['fetched']} fetched, "
+                  f"{stats['deleted']} removed, {stats['unchanged']} unchanged ({stats['seconds']:.2f}s)")
+        return CachedBackend(backend, cache)
+    finally:
+        cache.close()
+
+def prepare_hostel(hostel_id, data):
+    """Convert a hostel document to the compact model and fill in its bookkeeping."""
+    hostel = Hostel.from_dict(hostel_id, data)
+    hostel.occupant_count = count_hostel_occupants(hostel)  # Store for later use
+    build_room_index(hostel)
+    return hostel
+
+def display_hostel_details(hostels):
+    """Print each hostel with its occupant count."""
+    if hostels and reporter.verbose:
+        print("\nHostel Details:")
+        for hostel_id, hostel in hostels.items():
+            print(f"  - {hostel_name(hostel)} (ID: {hostel_id[:8]}...): {hostel.occupant_count} occupants")
+
+@traced
+def get_all_hostels(backend, page_size=DEFAULT_PAGE_SIZE):
+    """Fetch all hostels from the database, page by page."""
     hostels = {}
     
     print("🔍 Fetching hostels from database...")
-    for doc in hostels_ref.stream():
-        hostels[doc.id] = doc.to_dict()
-        hostels[doc.id]['id'] = doc.id  # Store ID within the hostel object for convenience
+    for doc_id, data in backend.stream("hostels", page_size=page_size):
+        hostels[doc_id] = prepare_hostel(doc_id, data)
     
     print(f"📊 Found {len(hostels)} hostels")
     
     # Display hostel information in a table format
-    if hostels:
-        print("\nHostel Details:")
-        for hostel_id, hostel in hostels.items():
-            occupant_count = count_hostel_occupants(hostel)
-            hostel['occupant_count'] = occupant_count  # Store for later use
-            print(f"  - {hostel.get('name', 'Unnamed')} (ID: {hostel_id[:8]}...): {occupant_count} occupants")
+    display_hostel_details(hostels)
     
     return hostels
 
+@traced
+def get_hostel_names(backend, page_size=DEFAULT_PAGE_SIZE):
+    """Fetch only the name of every hostel, enough to detect duplicates.
+    
+    Returns:
+        dict: hostel ID -> Hostel with only its name loaded
+    """
+    hostels = {}
+    
+    print("🔍 Fetching hostel names from database...")
+    for doc_id, data in backend.stream("hostels", fields=['name'], page_size=page_size):
+        hostels[doc_id] = Hostel.from_dict(doc_id, data)
+    
+    print(f"📊 Found {len(hostels)} hostels")
+    return hostels
+
+@traced
+def get_hostels_by_id(backend, hostel_ids):
+    """Fetch full documents for the given hostels only."""
+    hostels = {}
+    
+    print(f"🔍 Fetching {len(hostel_ids)} hostels in duplicate groups...")
+    for doc_id, data in backend.get_many("hostels", hostel_ids):
+        hostels[doc_id] = prepare_hostel(doc_id, data)
+    
+    display_hostel_details(hostels)
+    
+    return hostels
+
+class AllocationIndex:
+    """Room allocations held in memory, indexed by hostel and by student.
+    
+    Each allocation is a dict with the ALLOCATION_FIELDS. Updates made through
+    `update` keep both indexes in step with the writes queued for the database.
+    """
+    
+    def __init__(self):
+        self.allocations = {}  # allocation ID -> allocation
+        self.by_hostel = defaultdict(dict)  # hostel ID -> {allocation ID: allocation}
+        self.by_student = defaultdict(dict)  # reg number -> {allocation ID: allocation}
+    
+    def add(self, alloc_id, alloc_data):
+        self.allocations[alloc_id] = alloc_data
+        self.by_hostel[alloc_data.get('hostelId', '')][alloc_id] = alloc_data
+        self.by_student[alloc_data.get('studentRegNumber', '')][alloc_id] = alloc_data
+    
+    def for_hostel(self, hostel_id):
+        """Return (allocation ID, allocation) pairs for a hostel."""
+        return list(self.by_hostel.get(hostel_id, {}).items())
+    
+    def get(self, alloc_id):
+        return self.allocations.get(alloc_id)
+    
+    def for_student(self, student_reg):
+        """Return (allocation ID, allocation) pairs for a student."""
+        return list(self.by_student.get(student_reg, {}).items())
+    
+    def update(self, alloc_id, fields):
+        """Apply a field update to an allocation, re-indexing it if needed."""
+        alloc_data = self.allocations[alloc_id]
+        old_hostel_id = alloc_data.get('hostelId', '')
+        alloc_data.update(fields)
+        new_hostel_id = alloc_data.get('hostelId', '')
+        if new_hostel_id != old_hostel_id:
+            del self.by_hostel[old_hostel_id][alloc_id]
+            self.by_hostel[new_hostel_id][alloc_id] = alloc_data
+    
+    def items(self):
+        return self.allocations.items()
+    
+    def __len__(self):
+        return len(self.allocations)
+
+def allocation_scan(backend, partitions=1, page_size=None):
+    """Return an iterable over every room allocation, projected to the fields the merger uses.
+    
+    With more than one partition, the collection is read as that many
+    document ID ranges concurrently (a PartitionedScan); pass the iterable to
+    display_partition_report once it is consumed.
+    """
+    if partitions > 1:
+        return PartitionedScan(backend, "roomAllocations", partitions, fields=ALLOCATION_FIELDS)
+    return backend.stream("roomAllocations", fields=ALLOCATION_FIELDS, page_size=page_size)
+
+def display_partition_report(scan):
+    """Display per-partition read timing of a partitioned allocation scan."""
+    if not isinstance(scan, PartitionedScan) or not scan.stats:
+        return
+    
+    print("\n┌─────────────┬────────────┬──────────────┬──────────────┐")
+    print("│ Partition # │ Documents  │ Time (ms)    │ Docs/s       │")
+    print("├─────────────┼────────────┼──────────────┼──────────────┤")
+    for stats in scan.stats:
+        rate = stats.documents / stats.seconds if stats.seconds else 0
+        print(f"│ {stats.index + 1:11} │ {stats.documents:10} │ {stats.seconds * 1000:12.1f} │ {rate:12.0f} │")
+    print("└─────────────┴────────────┴──────────────┴──────────────┘")
+    
+    slowest = max(scan.stats, key=lambda s: s.seconds)
+    print(f"   ⏱️ {sum(s.documents for s in scan.stats)} allocations read in {len(scan.stats)} partitions "
+          f"by {scan.workers} workers; slowest partition #{slowest.index + 1} took {slowest.seconds * 1000:.1f} ms")
+
+@traced
+def load_allocations(backend, hostel_ids=None, partitions=1):
+    """Load room allocations once, projected to the fields the merger uses.
+    
+    Args:
+        backend: Datastore backend instance
+        hostel_ids: Optional hostel IDs to load allocations for; the backend
+            queries them together (concurrently on the async backend).
+            Every allocation is loaded if omitted.
+        partitions: When loading every allocation, read the collection as
+            this many ID ranges in parallel
+    """
+    allocations = AllocationIndex()
+    if hostel_ids is None:
+        print("🔍 Loading room allocations..." if partitions <= 1 else
+              f"🔍 Loading room allocations in {partitions} partitions...")
+        docs = allocation_scan(backend, partitions)
+    else:
+        print(f"🔍 Loading room allocations for {len(hostel_ids)} hostels...")
+        docs = backend.query_many("roomAllocations", "hostelId", hostel_ids, fields=ALLOCATION_FIELDS)
+    
+    for alloc_id, alloc_data in docs:
+        allocations.add(alloc_id, alloc_data)
+    display_partition_report(docs)
+    
+    print(f"📊 Loaded {len(allocations)} room allocations across {len(allocations.by_hostel)} hostels")
+    return allocations
+
+@traced
+def load_student_allocations(backend, allocations, students):
+    """Add the allocations of the given students that the index does not hold yet.
+    
+    A student moved by the merge may have an allocation pointing at a hostel
+    outside the duplicate groups, which load_allocations did not read.
+    
+    Returns:
+        int: Number of allocations added
+    """
+    students = sorted(set(students))
+    if not students:
+        return 0
+    added = 0
+    for alloc_id, alloc_data in backend.query_many("roomAllocations", "studentRegNumber", students,
+                                                   fields=ALLOCATION_FIELDS):
+        if allocations.get(alloc_id) is None:
+            allocations.add(alloc_id, alloc_data)
+            added += 1
+    if added:
+        print(f"📊 Loaded {added} more allocation(s) of students moved by the merge")
+    return added
+
 def count_hostel_occupants(hostel):
     """Count the total number of students in a hostel."""
-    count = 0
-    for floor in hostel.get('floors', []):
-        for room in floor.get('rooms', []):
-            count += len(room.get('occupants', []))
-    return count
+    return sum(len(room.occupants) for _, room in hostel.rooms())
 
-def identify_duplicate_hostels(hostels):
-    """Group hostels by name to identify duplicates."""
-    hostel_groups = defaultdict(list)
-    
-    # Group hostels by name
-    for hostel_id, hostel in hostels.items():
-        name = hostel.get('name', 'Unnamed')
-        hostel_groups[name].append(hostel_id)
+def hostel_name(hostel, default='Unnamed'):
+    """Display name of a hostel."""
+    return hostel.name if hostel.name is not None else default
+
+def unique_group_name(groups, name):
+    """Return name, or name with a counter if a group already uses it."""
+    candidate, n = name, 2
+    while candidate in groups:
+        candidate, n = f"{name} #{n}", n + 1
+    return candidate
+
+@traced
+def identify_duplicate_hostels(hostels, fuzzy=False, threshold=DEFAULT_FUZZY_THRESHOLD):
+    """Group hostels by name to identify duplicates.
     
-    # Filter out non-duplicates (groups with only one hostel)
-    duplicate_groups = {name: ids for name, ids in hostel_groups.items() if len(ids) > 1}
+    Names match if they are equal after normalization (case, accents,
+    punctuation and spacing), or, with fuzzy set, if their similarity ratio
+    is at least threshold (see merger_matching).
     
+    Returns:
+        dict: group name (the first hostel's name) -> hostel IDs
+    """
     print("\n🔍 Scanning for duplicate hostels...")
+    names = {hostel_id: hostel_name(hostel) for hostel_id, hostel in hostels.items()}
+    groups, stats = group_names(names, fuzzy=fuzzy, threshold=threshold)
+    
+    duplicate_groups = {}
+    for ids in groups:
+        duplicate_groups[unique_group_name(duplicate_groups, names[ids[0]])] = ids
+    
+    print(f"   ⏱️ Matched {stats['names']} names ({stats['keys']} distinct after normalization) "
+          f"in {stats['seconds'] * 1000:.1f} ms")
+    if fuzzy:
+        print(f"   🔎 Fuzzy matching at {threshold:.2f}: {stats['candidate_pairs']} candidate pairs, "
+              f"{stats['compared']} compared, {stats['fuzzy_matches']} matched")
+    
     if duplicate_groups:
         print(f"✅ Found {len(duplicate_groups)} groups of duplicate hostels:")
         for name, ids in duplicate_groups.items():
-            print(f"  - '{name}': {len(ids)} instances")
+            variants = sorted({names[hid] for hid in ids} - {names[ids[0]]})
+            also = f" (also named {', '.join(repr(v) for v in variants)})" if variants else ""
+            print(f"  - '{name}': {len(ids)} instances{also}")
     else:
         print("ℹ️ No duplicate hostels found.")
     
     return duplicate_groups
 
+def split_groups_by_layout(duplicate_groups, hostels, threshold=DEFAULT_LAYOUT_THRESHOLD):
+    """Keep only hostels whose room layouts match within each duplicate group.
+    
+    Returns:
+        dict: group name -> hostel IDs, with groups split by layout
+    """
+    layout_groups = {}
+    for name, ids in duplicate_groups.items():
+        subgroups = split_by_layout(ids, hostels, threshold)
+        for subgroup in subgroups:
+            layout_groups[unique_group_name(layout_groups, name)] = subgroup
+        dropped = len(ids) - sum(len(subgroup) for subgroup in subgroups)
+        if dropped or len(subgroups) != 1:
+            print(f"  📐 '{name}': {len(subgroups)} group(s) with matching room layouts, "
+                  f"{dropped} hostel(s) left out")
+    return layout_groups
+
 def find_primary_hostel_in_group(hostels, hostel_ids):
     """Find the hostel with the most occupants within a group."""
     primary_id = None
     max_occupants = -1
     
     for hostel_id in hostel_ids:
-        occupant_count = hostels[hostel_id].get('occupant_count', 0)
+        occupant_count = hostels[hostel_id].occupant_count
         
         if occupant_count > max_occupants:
             max_occupants = occupant_count
             primary_id = hostel_id
     
     primary_hostel = hostels[primary_id]
-    print(f"🏠 Primary hostel selected: {primary_hostel.get('name')} (ID: {primary_id[:8]}...) "
-          f"with {primary_hostel.get('occupant_count')} occupants")
+    reporter.detail(f"🏠 Primary hostel selected: {primary_hostel.name} (ID: {primary_id[:8]}...) "
+                    f"with {primary_hostel.occupant_count} occupants")
             
     return primary_id
 
+def build_room_index(hostel):
+    """Index a hostel's rooms by number: room number -> (floor, room).
+    
+    The index holds references to the floor and room objects themselves, so the
+    in-place occupant updates made while merging are always visible through it.
+    When a hostel has several rooms with the same number the first one wins,
+    matching the order of a floor-by-floor scan.
+    """
+    index = {}
+    for floor, room in hostel.rooms():
+        index.setdefault(room.number, (floor, room))
+    hostel.room_index = index
+    return index
+
+def get_room_entry(hostel, room_number):
+    """Find a room and its floor in a hostel by room number.
+    
+    Returns:
+        tuple: (floor, room), or None if the hostel has no such room
+    """
+    index = hostel.room_index
+    if index is None:
+        index = build_room_index(hostel)
+    return index.get(room_number)
+
 def get_room_by_number(hostel, room_number):
     """Find a room in a hostel by its number."""
-    for floor in hostel.get('floors', []):
-        for room in floor.get('rooms', []):
-            if room.get('number') == room_number:
-                return room
-    return None
-
-def merge_hostel_group(primary_id, hostel_ids, hostels):
-    """Merge a group of duplicate hostels into the primary hostel."""
+    entry = get_room_entry(hostel, room_number)
+    return entry[1] if entry else None
+
+def get_occupant_set(occupant_sets, room):
+    """Return the membership set for a room's occupants, creating it on first use.
+    
+    The set mirrors the room's occupants list, which stays the source of truth
+    for ordering and is what gets written back to the database.
+    """
+    occupants = occupant_sets.get(id(room))
+    if occupants is None:
+        occupants = occupant_sets[id(room)] = set(room.occupants)
+    return occupants
+
+def merge_room_occupants(primary_room, room_occupants, occupant_set):
+    """Move a room's occupants into a primary room if they all fit.
+    
+    Students already in the primary room (or listed twice in the source room)
+    are not counted against capacity and are not added again.
+    
+    Returns:
+        list: the students added to the primary room, or None if they do not fit
+    """
+    primary_occupants = primary_room.occupants
+    capacity = primary_room.capacity or 0
+    
+    new_students = [s for s in dict.fromkeys(room_occupants) if s not in occupant_set]
+    if len(primary_occupants) + len(new_students) > capacity:
+        return None
+    
+    primary_occupants.extend(new_students)
+    occupant_set.update(new_students)
+    
+    primary_room.is_available = len(primary_occupants) < capacity
+    return new_students
+
+def record_hostel_result(merge_results, hostel_id, hostel, remaining_occupants, conflicts):
+    """Classify a secondary hostel as completely, partially or not merged."""
+    if remaining_occupants == 0 and not conflicts:
+        merge_results['completely_merged'].append(hostel_id)
+        reporter.detail(f"  ✅ Result: COMPLETELY MERGED")
+    elif remaining_occupants < hostel.occupant_count:
+        merge_results['partially_merged'].append(hostel_id)
+        reporter.detail(f"  ⚠️ Result: PARTIALLY MERGED")
+    else:
+        reporter.detail(f"  ❌ Result: NOT MERGED")
+
+def place_overflow_students(primary_id, hostels, overflow, occupant_sets, merge_results):
+    """Place overflow students in free beds across the primary hostel.
+    
+    Args:
+        primary_id: ID of the primary hostel
+        hostels: Dictionary of all hostels
+        overflow: list of (hostel_id, floor key, room) for rooms that could
+            not be merged into the primary's room with the same number
+        occupant_sets: Occupant sets of the primary's rooms (see get_occupant_set)
+        merge_results: Group merge results, updated in place
+    
+    Returns:
+        dict: hostel ID -> number of its overflow students left unplaced
+    """
+    primary_hostel = hostels[primary_id]
+    entries = [(key, room, list(room.occupants)) for _, key, room in overflow]
+    placements = plan_placements(primary_hostel, entries)
+    
+    reporter.detail(f"\n↪️ Placing overflow from {len(overflow)} room(s) in free beds of "
+                    f"{primary_hostel.name} (ID: {primary_id[:8]}...)")
+    if reporter.verbose:
+        print("\n┌─────────┬──────────┬──────────────────────────┬──────────────────┐")
+        print("│ Room #  │ Students │ Placed In                │ Status           │")
+        print("├─────────┼──────────┼──────────────────────────┼──────────────────┤")
+    
+    unplaced = defaultdict(int)
+    placed_count = 0
+    for (hostel_id, _, room), (assigned, already, waiting) in zip(overflow, placements):
+        hostel = hostels[hostel_id]
+        moved = list(already)
+        for target, students in assigned:
+            merge_room_occupants(target, students, get_occupant_set(occupant_sets, target))
+            primary_hostel.mark_changed(target)
+            moved.extend(students)
+            merge_results['placed_rooms'].update((student, target.id) for student in students)
+            merge_results['room_moves'].append({
+                'from_hostel': hostel_id,
+                'to_hostel': primary_id,
+                'room_number': room.number,
+                'to_room': target.number,
+                'students': list(students)
+            })
+        
+        if moved:
+            moved_set = set(moved)
+            room.occupants = [s for s in room.occupants if s not in moved_set]
+            room.is_available = not room.occupants or len(room.occupants) < (room.capacity or 0)
+            hostel.mark_changed(room)
+            merge_results['successful_merges'] += len(moved)
+            merge_results['moved_students'].extend(moved)
+        
+        placed_count += len(moved)
+        if waiting:
+            unplaced[hostel_id] += len(waiting)
+            merge_results['conflicts'] += 1
+            status, label = ("part_placed", "⚠️ Part placed") if moved else ("no_free_beds", "❌ No free beds")
+        else:
+            status, label = "placed", "↪️ Placed"
+        targets = ", ".join(str(target.number) for target, _ in assigned) or "-"
+        reporter.record('placement', hostel_id=hostel_id, target_hostel_id=primary_id, room_number=room.number,
+                        target_room=targets, count=len(moved), status=status, detail=f"{len(waiting)} unplaced")
+        if reporter.verbose:
+            placed = f"{len(moved)}/{len(moved) + len(waiting)}"
+            print(f"│ {str(room.number):7} │ {placed:8} │ {targets[:24]:24} │ {label:16} │")
+    
+    if reporter.verbose:
+        print("└─────────┴──────────┴──────────────────────────┴──────────────────┘")
+    reporter.detail(f"   ↪️ Placed {placed_count} student(s); {sum(unplaced.values())} left without a free bed")
+    return unplaced
+
+@traced
+def merge_hostel_group(primary_id, hostel_ids, hostels, place_overflow=False):
+    """Merge a group of duplicate hostels into the primary hostel.
+    
+    Each secondary room is merged into the primary's room with the same
+    number when it fits. With place_overflow, rooms that do not fit are
+    placed in free beds elsewhere in the primary once every same-number merge
+    in the group is done (see merger_placement), instead of being left behind
+    as conflicts.
+    """
     primary_hostel = hostels[primary_id]
-    primary_name = primary_hostel.get('name')
+    primary_name = primary_hostel.name
+    occupant_sets = {}  # id(primary room) -> set of occupants
     
     merge_results = {
         'successful_merges': 0,
         'conflicts': 0,
         'completely_merged': [],
-        'partially_merged': []
+        'partially_merged': [],
+        'moved_students': [],  # students whose room changed
+        'room_moves': [],  # one entry per secondary room emptied into the primary
+        'placed_rooms': {}  # student -> primary room ID, for students placed in another room
     }
     
-    print(f"\n🔄 Starting merge for '{primary_name}' group with primary (ID: {primary_id[:8]}...)")
+    overflow = []  # (hostel_id, floor key, room) left for placement
+    pending = []  # hostel IDs classified once overflow has been placed
+    
+    reporter.detail(f"\n🔄 Starting merge for '{primary_name}' group with primary (ID: {primary_id[:8]}...)")
     
     # For each non-primary hostel in this group
     for hostel_id in hostel_ids:
@@ -123,23 +554,33 @@ def merge_hostel_group(primary_id, hostel_ids, hostels):
             continue
             
         hostel = hostels[hostel_id]
-        print(f"\nProcessing: {hostel.get('name')} (ID: {hostel_id[:8]}...)")
+        reporter.detail(f"\nProcessing: {hostel.name} (ID: {hostel_id[:8]}...)")
         
         # Track whether this hostel can be completely merged
-        remaining_occupants = hostel['occupant_count']
+        remaining_occupants = hostel.occupant_count
         conflicts = False
+        room_statuses = Counter()
+        
+        def report_room(room_number, students, status, row):
+            """Count and record a room's outcome; its table row is printed at verbose level."""
+            room_statuses[status] += 1
+            reporter.record('room', hostel_id=hostel_id, target_hostel_id=primary_id,
+                            room_number=room_number, count=students, status=status)
+            if reporter.verbose:
+                print(row)
         
         # Print table header for affected rooms
-        print("\n┌─────────┬─────────────────┬─────────────────┬────────────┬──────────────────┐")
-        print("│ Room #  │ Source Occupants │ Target Occupants │ Capacity   │ Status           │")
-        print("├─────────┼─────────────────┼─────────────────┼────────────┼──────────────────┤")
+        if reporter.verbose:
+            print("\n┌─────────┬─────────────────┬─────────────────┬────────────┬──────────────────┐")
+            print("│ Room #  │ Source Occupants │ Target Occupants │ Capacity   │ Status           │")
+            print("├─────────┼─────────────────┼─────────────────┼────────────┼──────────────────┤")
         
         # For each floor in the non-primary hostel
-        for floor in hostel.get('floors', []):
+        for floor_index, floor in enumerate(hostel.floors):
             # For each room in the floor
-            for room in floor.get('rooms', []):
-                room_number = room.get('number')
-                room_occupants = room.get('occupants', [])
+            for room in floor.rooms:
+                room_number = room.number
+                room_occupants = room.occupants
                 
                 if not room_occupants:
                     continue  # Skip empty rooms
@@ -148,58 +589,90 @@ def merge_hostel_group(primary_id, hostel_ids, hostels):
                 primary_room = get_room_by_number(primary_hostel, room_number)
                 
                 if primary_room is None:
-                    conflicts = True
-                    status = "❌ No matching room"
-                    print(f"│ {room_number:7} │ {len(room_occupants):15} │ {'-':15} │ {'-':10} │ {status:16} │")
-                    merge_results['conflicts'] += 1
+                    if place_overflow:
+                        overflow.append((hostel_id, floor_key(floor, floor_index), room))
+                        status, label = "overflow", "⏳ Overflow"
+                    else:
+                        conflicts = True
+                        merge_results['conflicts'] += 1
+                        status, label = "no_matching_room", "❌ No matching room"
+                    report_room(room_number, len(room_occupants), status,
+                                f"│ {room_number:7} │ {len(room_occupants):15} │ {'-':15} │ {'-':10} │ {label:16} │")
                     continue
                 
-                # Check if merging would exceed capacity
-                primary_occupants = primary_room.get('occupants', [])
-                capacity = primary_room.get('capacity', 0)
+                # Merge unless it would exceed capacity
+                capacity = primary_room.capacity or 0
+                occupant_set = get_occupant_set(occupant_sets, primary_room)
+                added = merge_room_occupants(primary_room, room_occupants, occupant_set)
+                primary_occupants = primary_room.occupants
                 
-                if len(primary_occupants) + len(room_occupants) <= capacity:
-                    # Merge is possible - add students to primary
-                    for student in room_occupants:
-                        if student not in primary_occupants:
-                            primary_occupants.append(student)
-                    
-                    primary_room['occupants'] = primary_occupants
-                    primary_room['isAvailable'] = len(primary_occupants) < capacity
+                if added is not None:
+                    primary_hostel.mark_changed(primary_room)
                     
                     # Clear the room in the secondary hostel
-                    room['occupants'] = []
-                    room['isAvailable'] = True
+                    room.occupants = []
+                    room.is_available = True
+                    hostel.mark_changed(room)
                     
                     remaining_occupants -= len(room_occupants)
                     merge_results['successful_merges'] += len(room_occupants)
+                    merge_results['moved_students'].extend(room_occupants)
+                    merge_results['room_moves'].append({
+                        'from_hostel': hostel_id,
+                        'to_hostel': primary_id,
+                        'room_number': room_number,
+                        'students': list(room_occupants)
+                    })
                     
                     status = "✅ Merged"
-                    print(f"│ {room_number:7} │ {len(room_occupants):15} │ {len(primary_occupants):15} │ {capacity:10} │ {status:16} │")
+                    report_room(room_number, len(room_occupants), "merged",
+                                f"│ {room_number:7} │ {len(room_occupants):15} │ {len(primary_occupants):15} │ {capacity:10} │ {status:16} │")
+                elif place_overflow:
+                    overflow.append((hostel_id, floor_key(floor, floor_index), room))
+                    status = "⏳ Overflow"
+                    report_room(room_number, len(room_occupants), "overflow",
+                                f"│ {room_number:7} │ {len(room_occupants):15} │ {len(primary_occupants)}/{capacity:8} │ {capacity:10} │ {status:16} │")
                 else:
                     # Conflict - can't merge this room
                     conflicts = True
                     merge_results['conflicts'] += 1
                     
                     status = "❌ Capacity exceeded"
-                    print(f"│ {room_number:7} │ {len(room_occupants):15} │ {len(primary_occupants)}/{capacity:8} │ {capacity:10} │ {status:16} │")
+                    report_room(room_number, len(room_occupants), "capacity_exceeded",
+                                f"│ {room_number:7} │ {len(room_occupants):15} │ {len(primary_occupants)}/{capacity:8} │ {capacity:10} │ {status:16} │")
         
-        print("└─────────┴─────────────────┴─────────────────┴────────────┴──────────────────┘")
+        if reporter.verbose:
+            print("└─────────┴─────────────────┴─────────────────┴────────────┴──────────────────┘")
+        room_summary = ", ".join(f"{count} {status.replace('_', ' ')}" for status, count in room_statuses.items())
+        reporter.detail(f"  Rooms: {room_summary or 'none occupied'}")
         
-        # Check if hostel was completely merged
-        if remaining_occupants == 0 and not conflicts:
-            merge_results['completely_merged'].append(hostel_id)
-            print(f"  ✅ Result: COMPLETELY MERGED")
-        elif remaining_occupants < hostel['occupant_count']:
-            merge_results['partially_merged'].append(hostel_id)
-            print(f"  ⚠️ Result: PARTIALLY MERGED")
+        if place_overflow:
+            pending.append(hostel_id)
         else:
-            print(f"  ❌ Result: NOT MERGED")
+            # Check if hostel was completely merged
+            record_hostel_result(merge_results, hostel_id, hostel, remaining_occupants, conflicts)
+    
+    if place_overflow:
+        unplaced = {}
+        if overflow:
+            unplaced = place_overflow_students(primary_id, hostels, overflow, occupant_sets, merge_results)
+        # Merged rooms were emptied, so overflow rooms hold whatever is left of each hostel
+        remaining_occupants = defaultdict(int)
+        for hostel_id, _, room in overflow:
+            remaining_occupants[hostel_id] += len(room.occupants)
+        reporter.detail()
+        for hostel_id in pending:
+            hostel = hostels[hostel_id]
+            reporter.detail(f"{hostel.name} (ID: {hostel_id[:8]}...):")
+            record_hostel_result(merge_results, hostel_id, hostel, remaining_occupants[hostel_id],
+                                 unplaced.get(hostel_id, 0) > 0)
     
     return merge_results
 
-def display_group_merge_summary(merge_results, hostels, primary_id, group_name):
+def display_group_merge_summary(merge_results, hostels, primary_id, group_name, hostel_ids):
     """Display a summary of the merge results for a group"""
+    if reporter.quiet:
+        return
     print("\n" + "-"*60)
     print(f"📊 MERGE SUMMARY FOR '{group_name}'")
     print("-"*60)
@@ -209,25 +682,30 @@ def display_group_merge_summary(merge_results, hostels, primary_id, group_name):
     
     print("\nHostel Status:")
     # First show primary hostel
-    print(f"  🏠 {hostels[primary_id].get('name')} (ID: {primary_id[:8]}...): PRIMARY HOSTEL")
+    print(f"  🏠 {hostels[primary_id].name} (ID: {primary_id[:8]}...): PRIMARY HOSTEL")
     
     # Then show all other hostels in this group
-    for hostel_id in [hid for hid in hostels.keys() if hostels[hid].get('name') == group_name and hid != primary_id]:
+    for hostel_id in [hid for hid in hostel_ids if hid != primary_id]:
         status = "COMPLETELY MERGED" if hostel_id in merge_results['completely_merged'] else \
                 "PARTIALLY MERGED" if hostel_id in merge_results['partially_merged'] else "NOT MERGED"
         
         icon = "✅" if status == "COMPLETELY MERGED" else "⚠️" if status == "PARTIALLY MERGED" else "❌"
         will_delete = "Yes" if hostel_id in merge_results['completely_merged'] else "No"
         
-        print(f"  {icon} {hostels[hostel_id].get('name')} (ID: {hostel_id[:8]}...): {status}, Will Delete: {will_delete}")
+        print(f"  {icon} {hostels[hostel_id].name} (ID: {hostel_id[:8]}...): {status}, Will Delete: {will_delete}")
 
-def update_hostels_for_group(db, hostels, merge_results, batch=None):
+def update_hostels_for_group(backend, hostels, merge_results, batch=None):
     """Update the hostels in the database for a group.
-    Uses an existing batch if provided, otherwise creates a new one."""
+    Uses an existing batch if provided, otherwise creates a new one.
+    
+    Only hostels with changed rooms are written, and only their 'floors'
+    field. Change flags are cleared once queued, so passing the same hostels
+    again for a later group does not queue them twice.
+    """
     
     # Create a new batch if one wasn't provided
     if batch is None:
-        batch = db.batch()
+        batch = BatchWriter(backend)
         commit_batch = True
     else:
         commit_batch = False
@@ -235,23 +713,23 @@ def update_hostels_for_group(db, hostels, merge_results, batch=None):
     # Track operations
     operations = {
         'updated': [],
-        'to_delete': []
+        'to_delete': [],
+        'rooms_changed': 0
     }
     
-    # First, update the primary hostel and any partially merged hostels
+    # First, update the primary hostel and any partially merged hostels that changed
     for hostel_id, hostel in hostels.items():
-        if hostel_id not in merge_results['completely_merged']:
-            hostel_ref = db.collection("hostels").document(hostel_id)
-            # Remove the 'id' field before updating
-            hostel_data = {k: v for k, v in hostel.items() if k != 'id'}
-            batch.update(hostel_ref, hostel_data)
-            operations['updated'].append(hostel.get('name', 'Unnamed'))
+        if hostel.dirty and hostel_id not in merge_results['completely_merged']:
+            operations['rooms_changed'] += len(hostel.changed_rooms())
+            batch.update("hostels", hostel_id, hostel.to_update())
+            operations['updated'].append(hostel_name(hostel))
+            hostel.clear_changes()
     
     # Mark completely merged hostels for deletion
     for hostel_id in merge_results['completely_merged']:
-        hostel_ref = db.collection("hostels").document(hostel_id)
-        batch.delete(hostel_ref)
-        operations['to_delete'].append(hostels[hostel_id].get('name', 'Unnamed'))
+        batch.delete("hostels", hostel_id)
+        operations['to_delete'].append(hostel_name(hostels[hostel_id]))
+        hostels[hostel_id].clear_changes()
     
     # If we created the batch here, commit it
     if commit_batch:
@@ -259,223 +737,426 @@ def update_hostels_for_group(db, hostels, merge_results, batch=None):
     
     return operations, batch
 
-def update_student_allocations(db, merge_results, primary_id, hostels, batch=None):
+@traced
+def update_student_allocations(backend, merge_results, primary_id, hostels, batch=None, allocations=None):
     """Update student hostel allocations records after merging hostels.
     
     Args:
-        db: Firestore database instance
+        backend: Datastore backend instance
         merge_results: Dictionary containing merge operation results
         primary_id: ID of the primary hostel
         hostels: Dictionary of all hostels
-        batch: Optional existing batch operation
+        batch: Optional existing batch (or BatchWriter) to queue the rewrites on.
+            If omitted, a BatchWriter is created and committed before returning.
+        allocations: Optional AllocationIndex; loaded from the backend if omitted.
+            Queued rewrites are applied to it so later phases see them.
     
     Returns:
-        tuple: (updated_count, batch)
+        tuple: (queued_count, batch)
     """
     # Get completely merged hostels
     merged_hostels = merge_results['completely_merged']
     if not merged_hostels:
-        print("ℹ️ No allocation updates needed - no hostels were completely merged")
+        reporter.detail("ℹ️ No allocation updates needed - no hostels were completely merged")
         return 0, batch
     
+    # Queue rewrites on the caller's batch so they commit together with the hostel updates
+    if batch is None:
+        batch = BatchWriter(backend)
+        commit_batch = True
+    else:
+        commit_batch = False
+    
+    if allocations is None:
+        allocations = load_allocations(backend)
+    
     # Set up tracking
     updated_count = 0
     errors = 0
     
-    print("\n🔄 Processing student allocations...")
-    print(f"   Primary hostel: {hostels[primary_id]['name']} ({primary_id[:8]}...)")
+    reporter.detail("\n🔄 Processing student allocations...")
+    reporter.detail(f"   Primary hostel: {hostels[primary_id].name} ({primary_id[:8]}...)")
     
     # For each merged hostel
     for hostel_id in merged_hostels:
-        hostel_name = hostels[hostel_id]['name']
-        print(f"\n   📍 Processing {hostel_name} ({hostel_id[:8]}...)")
-        
         try:
             # Get all allocations for this hostel
-            alloc_query = db.collection("roomAllocations").where("hostelId", "==", hostel_id)
-            allocations = list(alloc_query.stream())
+            hostel_allocations = allocations.for_hostel(hostel_id)
             
-            print(f"      Found {len(allocations)} allocations to update")
+            if not reporter.quiet:
+                print(f"\n   📍 Processing {hostels[hostel_id].name} ({hostel_id[:8]}...)")
+                print(f"      Found {len(hostel_allocations)} allocations to update")
             
-            if not allocations:
-                print(f"      ⚠️ No allocations found")
+            if not hostel_allocations:
+                reporter.detail("      ⚠️ No allocations found")
                 continue
             
-            # Process each allocation individually (like changeRoomAllocation does)
-            for alloc in allocations:
+            # Queue an update for each allocation (same fields as changeRoomAllocation)
+            for alloc_id, alloc_data in hostel_allocations:
                 try:
-                    alloc_data = alloc.to_dict()
                     student_reg = alloc_data.get('studentRegNumber', '')
                     room_id = alloc_data.get('roomId', '')
                     
                     # Basic validation
                     if not all([student_reg, room_id]):
-                        print(f"      ⚠️ Skipping invalid allocation {alloc.id}")
+                        print(f"      ⚠️ Skipping invalid allocation {alloc_id}")
+                        reporter.record('allocation_rewrite', allocation_id=alloc_id, hostel_id=hostel_id,
+                                        student=student_reg, status='skipped', detail="missing student or room")
                         continue
                     
-                    # Update allocation document with specific fields (like changeRoomAllocation)
-                    alloc_ref = db.collection("roomAllocations").document(alloc.id)
-                    
-                    # Use the same approach as changeRoomAllocation - update specific fields
-                    from firebase_admin import firestore as admin_firestore
-                    alloc_ref.update({
-                        'hostelId': primary_id,
-                    })
+                    update = {'hostelId': primary_id}
+                    # Students placed in a different room also get that room's ID
+                    placed_room = merge_results.get('placed_rooms', {}).get(student_reg)
+                    if placed_room is not None:
+                        update['roomId'] = placed_room
+                    batch.update("roomAllocations", alloc_id, update)
+                    allocations.update(alloc_id, update)
                     
                     updated_count += 1
-                    print(f"      ✓ Student {student_reg}: Room {room_id}")
+                    reporter.record('allocation_rewrite', allocation_id=alloc_id, hostel_id=hostel_id,
+                                    target_hostel_id=primary_id, student=student_reg,
+                                    target_room=update.get('roomId', room_id), status='queued')
+                    if reporter.verbose:
+                        print(f"      ✓ Student {student_reg}: Room {room_id}")
                     
                 except Exception as e:
                     errors += 1
-                    print(f"      ❌ Failed to update allocation {alloc.id}: {str(e)}")
+                    print(f"      ❌ Failed to queue update for allocation {alloc_id}: {str(e)}")
                     
         except Exception as e:
             print(f"   ❌ Error processing hostel {hostel_id}: {str(e)}")
             continue
     
+    if commit_batch:
+        batch.commit()
+    
     # Print summary
-    print(f"\n📊 Allocation updates summary:")
-    print(f"   ✅ {updated_count} allocations updated immediately")
+    reporter.detail(f"\n📊 Allocation updates summary:")
+    if commit_batch:
+        reporter.detail(f"   ✅ {updated_count} allocations updated")
+    else:
+        reporter.detail(f"   ✅ {updated_count} allocation updates queued (saved with the hostel changes)")
     if errors > 0:
         print(f"   ⚠️ {errors} errors encountered")
     
     return updated_count, batch
 
-def validate_and_fix_allocation_hostel_ids(db, hostels, merge_mapping):
+def display_commit_report(results):
+    """Display per-chunk commit latency for a BatchWriter commit."""
+    if not results:
+        return
+    
+    print("\n┌─────────┬──────────┬────────────┬──────────┬──────────────┬──────────────┐")
+    print("│ Batch # │ Writes   │ Size (KB)  │ Attempts │ Latency (ms) │ Status       │")
+    print("├─────────┼──────────┼────────────┼──────────┼──────────────┼──────────────┤")
+    for result in sorted(results, key=lambda r: r.index):
+        status = "✅ Committed" if result.ok else "❌ Failed"
+        print(f"│ {result.index + 1:7} │ {result.operations:8} │ {result.size / 1024:10.1f} │ "
+              f"{result.attempts:8} │ {result.latency * 1000:12.1f} │ {status:12} │")
+    print("└─────────┴──────────┴────────────┴──────────┴──────────────┴──────────────┘")
+    
+    latencies = sorted(r.latency for r in results)
+    print(f"   ⏱️ Batch latency: median {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"max {latencies[-1] * 1000:.1f} ms over {len(results)} batch(es)")
+
+def display_phase_report(phases, totals):
+    """Display wall time and requests per traced phase.
+    
+    Phases may nest (a validation applies its fixes), and then the outer
+    phase's figures include the inner one's.
+    """
+    if not phases:
+        return
+    
+    print("\n┌────────────────────────────────────────┬───────┬──────────┬─────────┬─────────┬───────┬───────────┬────────────┐")
+    print("│ Phase                                  │ Calls │ Time (s) │ Reads   │ Writes  │ RPCs  │ KB read   │ KB written │")
+    print("├────────────────────────────────────────┼───────┼──────────┼─────────┼─────────┼───────┼───────────┼────────────┤")
+    for phase in phases:
+        print(f"│ {phase['name'][:38]:38} │ {phase['calls']:5} │ {phase['seconds']:8.2f} │ {phase['reads']:7} │ "
+              f"{phase['writes']:7} │ {phase['rpcs']:5} │ {phase['bytes_read'] / 1024:9.1f} │ "
+              f"{phase['bytes_written'] / 1024:10.1f} │")
+    print("└────────────────────────────────────────┴───────┴──────────┴─────────┴─────────┴───────┴───────────┴────────────┘")
+    print(f"   📡 Run total: {totals['reads']} reads, {totals['writes']} writes in {totals['rpcs']} RPCs, "
+          f"{totals['bytes_read'] / 1024:.1f} KB read, {totals['bytes_written'] / 1024:.1f} KB written")
+
+def get_incremental_validation_scope(allocations, merge_mapping, moved_students):
+    """Find the allocations a merge could have invalidated.
+    
+    These are the allocations pointing at any hostel in a merged group (old or
+    primary) plus every allocation of a student whose room changed.
+    
+    Returns:
+        set: allocation IDs to re-check
+    """
+    scope = set()
+    for hostel_id in set(merge_mapping) | set(merge_mapping.values()):
+        scope.update(alloc_id for alloc_id, _ in allocations.for_hostel(hostel_id))
+    for student_reg in set(moved_students):
+        scope.update(alloc_id for alloc_id, _ in allocations.for_student(student_reg))
+    return scope
+
+def write_fix_log(path, outcomes):
+    """Write one JSON line per allocation fix with its outcome."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for outcome in outcomes:
+            f.write(json.dumps(outcome) + "\n")
+    os.replace(tmp_path, path)
+
+def load_fix_log(path):
+    """Read a fix log written by write_fix_log."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+@traced
+def apply_allocation_fixes(backend, fixes, commit_workers=4, rate_limiter=None, on_commit=None):
+    """Write allocation fixes in bulk and record the outcome of each one.
+    
+    Fixes are packed into batches committed concurrently by a BatchWriter,
+    optionally throttled by a RateLimiter. on_commit is passed to the
+    BatchWriter (see CheckpointJournal.record_fixes).
+    
+    Returns:
+        list: a copy of each fix with 'status' ('applied', 'failed' or 'skipped')
+            and 'error' set
+    """
+    writer = BatchWriter(backend, workers=commit_workers, rate_limiter=rate_limiter, on_commit=on_commit)
+    fix_chunks = []
+    for fix_item in fixes:
+        fix_chunks.append(writer.update("roomAllocations", fix_item['doc_id'], {
+            'hostelId': fix_item['new_hostel_id'],
+            'roomId': fix_item['room_id'],  # Also update room ID
+        }))
+    
+    try:
+        results = writer.commit()
+    except BatchCommitError as e:
+        results = e.results
+    display_commit_report(results)
+    
+    chunk_results = {result.index: result for result in results}
+    outcomes = []
+    for fix_item, chunk in zip(fixes, fix_chunks):
+        result = chunk_results.get(chunk)
+        outcome = dict(fix_item)
+        if result is None:
+            outcome.update(status='skipped', error="not attempted after an earlier batch failed")
+        elif result.ok:
+            outcome.update(status='applied', error=None)
+        else:
+            outcome.update(status='failed', error=str(result.error))
+        reporter.record('fix', allocation_id=fix_item['doc_id'], student=fix_item['student_reg'],
+                        hostel_id=fix_item['old_hostel_id'], target_hostel_id=fix_item['new_hostel_id'],
+                        target_room=fix_item['room_id'], status=outcome['status'], detail=outcome['error'])
+        outcomes.append(outcome)
+    return outcomes
+
+def retry_failed_fixes(backend, fix_log, commit_workers=4, rate_limiter=None):
+    """Re-apply the fixes a previous run could not write, without rescanning allocations.
+    
+    The fix log is rewritten in place with the new outcomes.
+    
+    Returns:
+        tuple: (applied_count, still_failing_count)
+    """
+    entries = load_fix_log(fix_log)
+    pending = [entry for entry in entries if entry.get('status') != 'applied']
+    print(f"\n🔁 Retrying {len(pending)} of {len(entries)} allocation fix(es) from {fix_log}")
+    if not pending:
+        return 0, 0
+    
+    outcomes = {outcome['doc_id']: outcome
+                for outcome in apply_allocation_fixes(backend, pending, commit_workers, rate_limiter)}
+    entries = [outcomes.get(entry['doc_id'], entry) if entry.get('status') != 'applied' else entry
+               for entry in entries]
+    write_fix_log(fix_log, entries)
+    
+    applied = sum(1 for outcome in outcomes.values() if outcome['status'] == 'applied')
+    failing = len(outcomes) - applied
+    print(f"   ✅ {applied} fix(es) applied")
+    if failing:
+        print(f"   ❌ {failing} fix(es) still failing; run --retry-fixes {fix_log} again")
+    return applied, failing
+
+def display_validation_table_start():
+    """Print the head of the verbose per-allocation validation table."""
+    print("\n┌─────────────────┬─────────────────┬─────────────────┬──────────────────┐")
+    print("│ Student RegNo   │ Current Hostel  │ Correct Hostel  │ Status           │")
+    print("├─────────────────┼─────────────────┼─────────────────┼──────────────────┤")
+
+def display_validation_table_end():
+    print("└─────────────────┴─────────────────┴─────────────────┴──────────────────┘")
+
+def report_allocation(alloc_id, student_reg, current_hostel_id, correct_hostel_id, status, label):
+    """Record an allocation that is not valid; its table row is printed at verbose level."""
+    reporter.record('validation', allocation_id=alloc_id, student=student_reg, hostel_id=current_hostel_id,
+                    target_hostel_id=correct_hostel_id, status=status)
+    if reporter.verbose:
+        print(f"│ {student_reg[:15]:15} │ {current_hostel_id[:15]:15} │ "
+              f"{(correct_hostel_id or 'Not Found')[:15]:15} │ {label:16} │")
+
+def record_allocation_error(alloc_id, error, validation_results, keep_details=True):
+    """Count an allocation that could not be checked."""
+    validation_results['errors'] += 1
+    if keep_details:
+        validation_results['issues'].append(f"Error processing allocation {alloc_id}: {str(error)}")
+    reporter.record('validation', allocation_id=alloc_id, status='error', detail=str(error))
+    if reporter.verbose:
+        print(f"│ {'ERROR':15} │ {'N/A':15} │ {'N/A':15} │ {'❌ Error':16} │")
+
+def check_allocation(alloc_id, alloc_data, hostel_exists, actual_location, validation_results, keep_details=True):
+    """Check one allocation against the room its student actually occupies.
+    
+    Args:
+        alloc_id: Allocation document ID
+        alloc_data: Allocation fields
+        hostel_exists: Whether the allocation's hostel ID is a current hostel
+        actual_location: Dict with the student's 'hostel_id', 'hostel_name',
+            'room_id' and 'room_number', or None if no room lists the student
+        validation_results: Validation summary to count the allocation in
+        keep_details: Also add an issue message for each unmatched allocation
+    
+    Returns:
+        dict: the fix the allocation needs, or None
+    """
+    student_reg = alloc_data.get('studentRegNumber', 'N/A')
+    current_hostel_id = alloc_data.get('hostelId', '')
+    status = allocation_status(current_hostel_id, hostel_exists, actual_location)
+    
+    if status is None:
+        validation_results['valid_allocations'] += 1
+        return None
+    
+    if status == 'no_match':
+        # Student not found in any room - don't delete, just mark as issue
+        validation_results['orphaned_allocations'] += 1
+        report_allocation(alloc_id, student_reg, current_hostel_id, None, 'no_match', "❌ No Match")
+        if keep_details:
+            validation_results['issues'].append(
+                f"Student {student_reg} has allocation but not found in any room occupants (allocation kept)"
+            )
+        return None
+    
+    validation_results['invalid_allocations'] += 1
+    if status == 'needs_fix':
+        # Student is in a different hostel than their allocation shows
+        report_allocation(alloc_id, student_reg, current_hostel_id, actual_location['hostel_id'],
+                          'needs_fix', "🔄 Needs Fix")
+    else:
+        # Current hostel ID is invalid, but the student was found in a room
+        report_allocation(alloc_id, student_reg, current_hostel_id, actual_location['hostel_id'],
+                          'found_match', "🔄 Found Match")
+        if keep_details:
+            validation_results['issues'].append(
+                f"Found correct hostel for {student_reg}: {actual_location['hostel_name']} Room {actual_location['room_number']}"
+            )
+    return {
+        'doc_id': alloc_id,
+        'student_reg': student_reg,
+        'old_hostel_id': current_hostel_id,
+        'new_hostel_id': actual_location['hostel_id'],
+        'room_id': actual_location['room_id'],
+        'room_number': actual_location['room_number'],
+        'hostel_name': actual_location['hostel_name']
+    }
+
+@traced
+def validate_and_fix_allocation_hostel_ids(backend, hostels, merge_mapping, allocations=None,
+                                           allocation_ids=None, fix_log=None, commit_workers=4,
+                                           rate_limiter=None, dry_run=False, scan_partitions=1, hostel_ids=None):
     """
     Validate and fix hostel IDs in room allocations after merging.
     Checks that all room allocations have correct hostel IDs and updates mismatched ones.
     
     Args:
-        db: Firestore database instance
-        hostels: Dictionary of all current hostels after merging
+        backend: Datastore backend instance
+        hostels: Dictionary of current hostels after merging. For a full audit
+            this must be every hostel; for an incremental check the merged
+            groups are enough, since students are only looked up among them.
         merge_mapping: Dictionary mapping old hostel IDs to primary hostel IDs
+        allocations: Optional AllocationIndex already in memory (e.g. the one used
+            for the merge rewrites); loaded from the backend if omitted
+        allocation_ids: Optional set of allocation IDs to check (see
+            get_incremental_validation_scope); all allocations if omitted
+        fix_log: Optional path of a JSON lines file recording each fix and its
+            outcome, used by retry_failed_fixes
+        commit_workers: Number of fix batches committed concurrently
+        rate_limiter: Optional RateLimiter throttling the fix writes
+        dry_run: If set, work out the fixes but do not write them; they are
+            returned under 'pending_fixes' (used by `merger.py plan`)
+        scan_partitions: If allocations are loaded here, read them as this
+            many ID ranges in parallel
+        hostel_ids: IDs of every current hostel, to tell whether an
+            allocation's hostel exists; the keys of hostels if omitted. An
+            incremental check must pass them, since an allocation in scope may
+            point at a hostel outside the merged groups.
     
     Returns:
         dict: Summary of validation and fixes
     """
     print("\n🔍 Validating hostel IDs in room allocations...")
     
-    validation_results = {
-        'total_allocations': 0,
-        'valid_allocations': 0,
-        'invalid_allocations': 0,
-        'fixed_allocations': 0,
-        'orphaned_allocations': 0,
-        'errors': 0,
-        'issues': [],
-        'fixes': []
-    }
+    validation_results = new_validation_results()
+    if fix_log and not dry_run:
+        # Replace the previous run's log now, so --retry-fixes never re-applies
+        # its fixes if this run has none
+        write_fix_log(fix_log, [])
     
     try:
         # Get all room allocations
-        allocations_ref = db.collection("roomAllocations")
-        all_allocations = list(allocations_ref.stream())
-        validation_results['total_allocations'] = len(all_allocations)
-        
-        print(f"📊 Found {len(all_allocations)} total room allocations to validate")
+        if allocations is None:
+            allocations = load_allocations(backend, partitions=scan_partitions)
+        if allocation_ids is None:
+            allocations_to_check = list(allocations.items())
+            print(f"📊 Found {len(allocations)} total room allocations to validate")
+        else:
+            allocations_to_check = [(alloc_id, allocations.get(alloc_id)) for alloc_id in sorted(allocation_ids)]
+            print(f"📊 Validating {len(allocations_to_check)} of {len(allocations)} room allocations "
+                  f"touched by the merge")
+        validation_results['total_allocations'] = len(allocations_to_check)
         
-        if not all_allocations:
+        if not allocations_to_check:
             print("ℹ️ No allocations found to validate")
             return validation_results
         
         # Get list of valid hostel IDs (after merging)
-        valid_hostel_ids = set(hostels.keys())
+        valid_hostel_ids = set(hostels.keys()) if hostel_ids is None else set(hostel_ids)
         
         # Create a map of student registration numbers to their actual hostel locations
         student_to_hostel_map = {}
         
         print("🗺️ Building student-to-hostel map from room occupants...")
         for hostel_id, hostel in hostels.items():
-            for floor in hostel.get('floors', []):
-                for room in floor.get('rooms', []):
-                    for student_reg in room.get('occupants', []):
-                        student_to_hostel_map[student_reg] = {
-                            'hostel_id': hostel_id,
-                            'hostel_name': hostel.get('name', 'Unknown'),
-                            'room_id': room.get('id', ''),
-                            'room_number': room.get('number', '')
-                        }
+            for _, room in hostel.rooms():
+                for student_reg in room.occupants:
+                    student_to_hostel_map[student_reg] = {
+                        'hostel_id': hostel_id,
+                        'hostel_name': hostel_name(hostel, 'Unknown'),
+                        'room_id': room.id if room.id is not None else '',
+                        'room_number': room.number if room.number is not None else ''
+                    }
         
         print(f"   📋 Built map with {len(student_to_hostel_map)} student entries")
         
         # Track allocations that need fixing
         allocations_to_fix = []
-        allocations_to_delete = []
         
-        print("\n┌─────────────────┬─────────────────┬─────────────────┬──────────────────┐")
-        print("│ Student RegNo   │ Current Hostel  │ Correct Hostel  │ Status           │")
-        print("├─────────────────┼─────────────────┼─────────────────┼──────────────────┤")
+        if reporter.verbose:
+            display_validation_table_start()
         
-        for alloc_doc in all_allocations:
+        for alloc_id, alloc_data in allocations_to_check:
             try:
-                alloc_data = alloc_doc.to_dict()
-                alloc_id = alloc_doc.id
-                student_reg = alloc_data.get('studentRegNumber', 'N/A')
-                current_hostel_id = alloc_data.get('hostelId', '')
-                room_id = alloc_data.get('roomId', '')
-                
-                # Check if current hostel ID exists in valid hostels
-                if current_hostel_id in valid_hostel_ids:
-                    # Hostel ID is valid, but verify student is actually in this hostel
-                    actual_location = student_to_hostel_map.get(student_reg)
-                    
-                    if actual_location and actual_location['hostel_id'] != current_hostel_id:
-                        # Student is in a different hostel than their allocation shows
-                        allocations_to_fix.append({
-                            'doc_id': alloc_id,
-                            'student_reg': student_reg,
-                            'old_hostel_id': current_hostel_id,
-                            'new_hostel_id': actual_location['hostel_id'],
-                            'room_id': actual_location['room_id'],
-                            'room_number': actual_location['room_number'],
-                            'hostel_name': actual_location['hostel_name']
-                        })
-                        validation_results['invalid_allocations'] += 1
-                        
-                        status = "🔄 Needs Fix"
-                        print(f"│ {student_reg[:15]:15} │ {current_hostel_id[:15]:15} │ {actual_location['hostel_id'][:15]:15} │ {status:16} │")
-                    else:
-                        validation_results['valid_allocations'] += 1
-                    continue
-                
-                # Current hostel ID is invalid, try to find the correct one
-                actual_location = student_to_hostel_map.get(student_reg)
-                
-                if actual_location:
-                    # Found the student in a room, update their allocation
-                    allocations_to_fix.append({
-                        'doc_id': alloc_id,
-                        'student_reg': student_reg,
-                        'old_hostel_id': current_hostel_id,
-                        'new_hostel_id': actual_location['hostel_id'],
-                        'room_id': actual_location['room_id'],
-                        'room_number': actual_location['room_number'],
-                        'hostel_name': actual_location['hostel_name']
-                    })
-                    validation_results['invalid_allocations'] += 1
-                    
-                    status = "🔄 Found Match"
-                    print(f"│ {student_reg[:15]:15} │ {current_hostel_id[:15]:15} │ {actual_location['hostel_id'][:15]:15} │ {status:16} │")
-                    validation_results['issues'].append(
-                        f"Found correct hostel for {student_reg}: {actual_location['hostel_name']} Room {actual_location['room_number']}"
-                    )
-                else:
-                    # Student not found in any room - don't delete, just mark as issue
-                    validation_results['orphaned_allocations'] += 1
-                    
-                    status = "❌ No Match"
-                    print(f"│ {student_reg[:15]:15} │ {current_hostel_id[:15]:15} │ {'Not Found':15} │ {status:16} │")
-                    validation_results['issues'].append(
-                        f"Student {student_reg} has allocation but not found in any room occupants (allocation kept)"
-                    )
-                    
+                fix_item = check_allocation(
+                    alloc_id, alloc_data, alloc_data.get('hostelId', '') in valid_hostel_ids,
+                    student_to_hostel_map.get(alloc_data.get('studentRegNumber', 'N/A')), validation_results)
             except Exception as e:
-                validation_results['errors'] += 1
-                validation_results['issues'].append(f"Error processing allocation {alloc_doc.id}: {str(e)}")
-                print(f"│ {'ERROR':15} │ {'N/A':15} │ {'N/A':15} │ {'❌ Error':16} │")
+                record_allocation_error(alloc_id, e, validation_results)
+                continue
+            if fix_item:
+                allocations_to_fix.append(fix_item)
         
-        print("└─────────────────┴─────────────────┴─────────────────┴──────────────────┘")
+        if reporter.verbose:
+            display_validation_table_end()
         
         # Print validation summary
         print(f"\n📊 Validation Summary:")
@@ -484,18 +1165,25 @@ def validate_and_fix_allocation_hostel_ids(db, hostels, merge_mapping):
         print(f"   ❌ Unmatched allocations (kept): {validation_results['orphaned_allocations']}")
         print(f"   ⚠️ Errors encountered: {validation_results['errors']}")
         
+        if dry_run:
+            validation_results['pending_fixes'] = allocations_to_fix
+            if allocations_to_fix:
+                print(f"\n📝 {len(allocations_to_fix)} allocation fix(es) added to the plan, not written")
+            return validation_results
+        
         # Fix invalid allocations if any
         if allocations_to_fix:
             print(f"\n🔧 Fixing {len(allocations_to_fix)} allocation(s) with incorrect hostel IDs...")
             
-            from firebase_admin import firestore as admin_firestore
+            outcomes = apply_allocation_fixes(backend, allocations_to_fix, commit_workers, rate_limiter)
+            if fix_log:
+                write_fix_log(fix_log, outcomes)
             
-            for fix_item in allocations_to_fix:
-                try:
-                    alloc_ref = db.collection("roomAllocations").document(fix_item['doc_id'])
-                    alloc_ref.update({
+            for fix_item in outcomes:
+                if fix_item['status'] == 'applied':
+                    allocations.update(fix_item['doc_id'], {
                         'hostelId': fix_item['new_hostel_id'],
-                        'roomId': fix_item['room_id'],  # Also update room ID
+                        'roomId': fix_item['room_id'],
                     })
                     
                     validation_results['fixed_allocations'] += 1
@@ -504,14 +1192,18 @@ def validate_and_fix_allocation_hostel_ids(db, hostels, merge_mapping):
                         f"{fix_item['old_hostel_id'][:8]}... → {fix_item['new_hostel_id'][:8]}... "
                         f"({fix_item['hostel_name']} Room {fix_item['room_number']})"
                     )
-                    print(f"   ✓ Fixed {fix_item['student_reg']}: {fix_item['hostel_name']} Room {fix_item['room_number']}")
-                    
-                except Exception as e:
+                    if reporter.verbose:
+                        print(f"   ✓ Fixed {fix_item['student_reg']}: {fix_item['hostel_name']} Room {fix_item['room_number']}")
+                else:
                     validation_results['errors'] += 1
                     validation_results['issues'].append(
-                        f"Failed to fix allocation {fix_item['doc_id']} for {fix_item['student_reg']}: {str(e)}"
+                        f"Failed to fix allocation {fix_item['doc_id']} for {fix_item['student_reg']}: {fix_item['error']}"
                     )
-                    print(f"   ❌ Failed to fix {fix_item['student_reg']}: {str(e)}")
+                    if reporter.verbose:
+                        print(f"   ❌ Failed to fix {fix_item['student_reg']}: {fix_item['error']}")
+            
+            if fix_log:
+                print(f"   📝 Fix results written to {fix_log}")
         
         # Don't delete orphaned allocations - just report them
         if validation_results['orphaned_allocations'] > 0:
@@ -536,153 +1228,1112 @@ def validate_and_fix_allocation_hostel_ids(db, hostels, merge_mapping):
     
     return validation_results
 
-def main():
-    """Main function to execute the hostel merger."""
+def new_validation_results():
+    return {
+        'total_allocations': 0,
+        'valid_allocations': 0,
+        'invalid_allocations': 0,
+        'fixed_allocations': 0,
+        'orphaned_allocations': 0,
+        'errors': 0,
+        'issues': [],
+        'fixes': [],
+        'pending_fixes': []
+    }
+
+def chunked(items, size):
+    """Yield lists of up to size items from an iterable."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+@traced
+def validate_allocations_on_disk(backend, page_size=DEFAULT_PAGE_SIZE, chunk_size=DEFAULT_VALIDATION_CHUNK,
+                                 fix_log=None, commit_workers=4, rate_limiter=None, scan_partitions=1):
+    """Full audit of allocation hostel IDs in bounded memory.
+    
+    Works like validate_and_fix_allocation_hostel_ids on every hostel and
+    allocation, but hostels are streamed into a DiskLocationIndex instead of
+    being held in memory, allocations are streamed and checked chunk_size at
+    a time, and fixes are written whenever chunk_size of them are pending.
+    Only counts are kept: issue and fix messages go to the report file.
+    With scan_partitions > 1, allocations are read as that many ID ranges in
+    parallel.
+    
+    Returns:
+        dict: Summary of validation and fixes, as validate_and_fix_allocation_hostel_ids
+    """
+    print("\n🔍 Validating hostel IDs in room allocations (disk-backed index)...")
+    validation_results = new_validation_results()
+    index = DiskLocationIndex()
+    log_file = open(fix_log + ".tmp", "w", encoding="utf-8") if fix_log else None
     try:
-        # Initialize Firebase
-        db = initialize_firebase()
-        print("✅ Firebase connected successfully")
+        print("🗺️ Building student-to-hostel index on disk from room occupants...")
+        for doc_id, data in backend.stream("hostels", page_size=page_size):
+            hostel = Hostel.from_dict(doc_id, data)
+            index.add_hostel(hostel, hostel_name(hostel, 'Unknown'))
+        index.commit()
+        print(f"   📋 Indexed {index.student_count} students in {index.hostel_count} hostels ({index.path})")
         
-        print("\n🔄 Starting duplicate hostel merger process...")
+        pending = []
         
-        # Get all hostels
-        hostels = get_all_hostels(db)
-        
-        if not hostels:
-            print("❌ No hostels found. Exiting.")
-            return
+        def write_fixes():
+            """Write the pending fixes, outside the verbose table."""
+            if reporter.verbose:
+                display_validation_table_end()
+            print(f"\n🔧 Fixing {len(pending)} allocation(s) with incorrect hostel IDs...")
+            outcomes = apply_allocation_fixes(backend, pending, commit_workers, rate_limiter)
+            for outcome in outcomes:
+                if outcome['status'] == 'applied':
+                    validation_results['fixed_allocations'] += 1
+                else:
+                    validation_results['errors'] += 1
+                if log_file:
+                    log_file.write(json.dumps(outcome) + "\n")
+            pending.clear()
+            if reporter.verbose:
+                display_validation_table_start()
         
-        # Identify duplicate hostels
-        duplicate_groups = identify_duplicate_hostels(hostels)
+        if reporter.verbose:
+            display_validation_table_start()
+        allocation_docs = allocation_scan(backend, scan_partitions, page_size)
+        for chunk in chunked(allocation_docs, chunk_size):
+            validation_results['total_allocations'] += len(chunk)
+            for alloc_id, alloc_data, hostel_exists, actual_location in index.resolve(chunk):
+                try:
+                    fix_item = check_allocation(alloc_id, alloc_data, hostel_exists, actual_location,
+                                                validation_results, keep_details=False)
+                except Exception as e:
+                    record_allocation_error(alloc_id, e, validation_results, keep_details=False)
+                    continue
+                if fix_item:
+                    pending.append(fix_item)
+            if len(pending) >= chunk_size:
+                write_fixes()
+        if pending:
+            write_fixes()
+        if reporter.verbose:
+            display_validation_table_end()
+        display_partition_report(allocation_docs)
         
-        if not duplicate_groups:
-            print("ℹ️ No duplicate hostels to merge. Exiting.")
-            return
+        if log_file:
+            log_file.close()
+            os.replace(log_file.name, fix_log)
+            print(f"   📝 Fix results written to {fix_log}")
         
-        # Ask for confirmation
-        confirm = input("\n❓ Do you want to proceed with merging duplicate hostels? (y/n): ")
-        if confirm.lower() != 'y':
-            print("⏹️ Merge cancelled by user. Exiting.")
-            return
+        if validation_results['orphaned_allocations'] > 0:
+            print(f"\n⚠️ Found {validation_results['orphaned_allocations']} allocation(s) with no matching room occupants")
+            print("   These allocations were kept for manual review.")
         
-        # Process each group of duplicates
-        all_merge_results = {
-            'successful_merges': 0,
-            'conflicts': 0,
-            'completely_merged': [],
-            'partially_merged': [],
-            'processed_groups': [],
-            'allocation_updates': 0  # Add tracking for allocation updates
+        print(f"\n✅ Validation and fixes completed:")
+        print(f"   📊 Total allocations checked: {validation_results['total_allocations']}")
+        print(f"   ✅ Valid allocations: {validation_results['valid_allocations']}")
+        print(f"   🔧 Fixed allocations: {validation_results['fixed_allocations']}")
+        print(f"   ⚠️ Unmatched allocations (kept): {validation_results['orphaned_allocations']}")
+        if validation_results['errors'] > 0:
+            print(f"   ❌ Errors encountered: {validation_results['errors']}")
+    except Exception as e:
+        print(f"❌ Error during allocation validation: {str(e)}")
+        validation_results['errors'] += 1
+        validation_results['issues'].append(f"Validation process error: {str(e)}")
+    finally:
+        if log_file and not log_file.closed:
+            log_file.close()
+        index.close()
+    
+    return validation_results
+
+class PlanWriter:
+    """Stands in for a BatchWriter while planning: records writes instead of sending them."""
+
+    def __init__(self):
+        self.writes = []
+
+    def update(self, collection, doc_id, data):
+        self.writes.append({'op': 'update', 'collection': collection, 'id': doc_id, 'data': data})
+
+    def delete(self, collection, doc_id):
+        self.writes.append({'op': 'delete', 'collection': collection, 'id': doc_id})
+
+    def __len__(self):
+        return len(self.writes)
+
+def plan_group(group_name, hostel_ids, hostels, allocations, place_overflow=False):
+    """Merge one group of duplicates in memory and record the writes it needs.
+    
+    Only the group's own hostels and allocations are read or changed.
+    
+    Returns:
+        dict: 'group' summary, 'merge_mapping', room 'moves' and recorded 'writes'
+    """
+    reporter.detail(f"\n{'='*60}")
+    reporter.detail(f"🏠 PROCESSING DUPLICATE GROUP: '{group_name}'")
+    reporter.detail(f"{'='*60}")
+    
+    # Record writes in merge order; they are replayed into a BatchWriter on apply
+    writer = PlanWriter()
+    
+    # Find the primary hostel in this group
+    primary_id = find_primary_hostel_in_group(hostels, hostel_ids)
+    
+    # Track the mapping for all hostels in this group
+    merge_mapping = {hostel_id: primary_id for hostel_id in hostel_ids if hostel_id != primary_id}
+    
+    # Merge this group
+    merge_results = merge_hostel_group(primary_id, hostel_ids, hostels, place_overflow=place_overflow)
+    
+    # Display merge summary for this group
+    display_group_merge_summary(merge_results, hostels, primary_id, group_name, hostel_ids)
+    
+    # Record hostel writes for this group
+    group_hostels = {hostel_id: hostels[hostel_id] for hostel_id in hostel_ids}
+    operations, writer = update_hostels_for_group(None, group_hostels, merge_results, writer)
+    
+    reporter.detail("\n📝 Updating student allocations...")
+    # Record allocation rewrites for merged hostels
+    allocation_updates, writer = update_student_allocations(
+        None, merge_results, primary_id, hostels, writer, allocations)
+    
+    return {
+        'merge_mapping': merge_mapping,
+        'moves': [dict(move, group=group_name) for move in merge_results['room_moves']],
+        'writes': writer.writes,
+        'group': {
+            'name': group_name,
+            'primary_id': primary_id,
+            'hostel_ids': list(hostel_ids),
+            'successful_merges': merge_results['successful_merges'],
+            'conflicts': merge_results['conflicts'],
+            'completely_merged': merge_results['completely_merged'],
+            'partially_merged': merge_results['partially_merged'],
+            'updated': len(operations['updated']),
+            'rooms_changed': operations['rooms_changed'],
+            'deleted': len(operations['to_delete']),
+            'allocations_updated': allocation_updates
         }
-        
-        # Track hostel ID mappings for validation
-        merge_mapping = {}  # old_hostel_id -> primary_hostel_id
-        
-        # Create a batch for all operations
-        batch = db.batch()
-        
+    }
+
+def _plan_group_job(job):
+    """Run plan_group in a worker process, capturing its console output.
+    
+    Returns:
+        tuple: (group plan, captured output, captured report rows, the group's
+            merged hostels, captured trace phases)
+    """
+    group_name, hostel_ids, hostels, allocation_items, place_overflow, report_level, tracing = job
+    allocations = AllocationIndex()
+    for alloc_id, alloc_data in allocation_items:
+        allocations.add(alloc_id, alloc_data)
+    
+    reporter.level = report_level
+    tracer.enabled = tracing
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), reporter.capture() as report_rows, tracer.capture() as trace:
+        group_plan = plan_group(group_name, hostel_ids, hostels, allocations, place_overflow)
+    return group_plan, output.getvalue(), report_rows, hostels, trace
+
+def plan_groups(duplicate_groups, hostels, allocations, args):
+    """Plan every duplicate group, in a process pool if args.workers > 1.
+    
+    Workers get a copy of their group's hostels and allocations. Their
+    output is printed, their report rows and trace phases recorded, and their
+    merged hostels and allocation rewrites are copied back, one group at a
+    time in group order, so the console output and the plan are the same as
+    a sequential run.
+    
+    Yields:
+        dict: plan_group result for each group, in group order
+    """
+    if args.workers <= 1 or len(duplicate_groups) <= 1:
         for group_name, hostel_ids in duplicate_groups.items():
-            print(f"\n{'='*60}")
-            print(f"🏠 PROCESSING DUPLICATE GROUP: '{group_name}'")
-            print(f"{'='*60}")
-            
-            # Find the primary hostel in this group
-            primary_id = find_primary_hostel_in_group(hostels, hostel_ids)
-            
-            # Track the mapping for all hostels in this group
-            for hostel_id in hostel_ids:
-                if hostel_id != primary_id:
-                    merge_mapping[hostel_id] = primary_id
-            
-            # Merge this group
-            merge_results = merge_hostel_group(primary_id, hostel_ids, hostels)
-            
-            # Display merge summary for this group
-            display_group_merge_summary(merge_results, hostels, primary_id, group_name)
-            
-            # Update database batch with operations for this group
-            operations, batch = update_hostels_for_group(db, hostels, merge_results, batch)
-            
-            print("\n📝 Updating student allocations...")
-            # Update student allocations for merged hostels
-            allocation_updates, batch = update_student_allocations(db, merge_results, primary_id, hostels, batch)
-
-            # Track overall results
-            all_merge_results['successful_merges'] += merge_results['successful_merges']
-            all_merge_results['conflicts'] += merge_results['conflicts']
-            all_merge_results['completely_merged'].extend(merge_results['completely_merged'])
-            all_merge_results['partially_merged'].extend(merge_results['partially_merged'])
-            all_merge_results['allocation_updates'] += allocation_updates
-            all_merge_results['processed_groups'].append({
-                'name': group_name,
-                'primary_id': primary_id,
-                'updated': len(operations['updated']),
-                'deleted': len(operations['to_delete']),
-                'allocations_updated': allocation_updates
-            })
-        
-        # Display overall summary
+            yield plan_group(group_name, hostel_ids, hostels, allocations, args.place_overflow)
+        return
+    
+    def jobs():
+        for group_name, hostel_ids in duplicate_groups.items():
+            allocation_items = [item for hostel_id in hostel_ids for item in allocations.for_hostel(hostel_id)]
+            yield (group_name, hostel_ids, {hid: hostels[hid] for hid in hostel_ids},
+                   allocation_items, args.place_overflow, reporter.level, tracer.enabled)
+    
+    print(f"\n⚙️ Planning {len(duplicate_groups)} groups on {args.workers} worker processes...")
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for group_plan, output, report_rows, group_hostels, trace in pool.map(_plan_group_job, jobs(),
+                                                                              chunksize=4):
+            sys.stdout.write(output)
+            reporter.extend(report_rows)
+            tracer.merge(trace)
+            hostels.update(group_hostels)
+            for write in group_plan['writes']:
+                if write['collection'] == 'roomAllocations':
+                    allocations.update(write['id'], write['data'])
+            yield group_plan
+
+def build_merge_plan(backend, args, interactive=True):
+    """Read hostels and allocations and work out every write the merge needs.
+    
+    Nothing is written: hostel updates and deletes and allocation rewrites are
+    recorded in the plan, and the merge is only applied to the in-memory
+    hostels and allocation index.
+    
+    Args:
+        backend: Datastore backend instance
+        args: Parsed command line options
+        interactive: Ask for confirmation before merging
+    
+    Returns:
+        tuple: (plan, hostels, allocations, hostel_ids), where hostel_ids holds
+            every hostel that still exists after the merge, or None if there is
+            nothing to merge
+    """
+    print("\n🔄 Starting duplicate hostel merger process...")
+    
+    # Get hostel names only; duplicates are detected from these
+    hostel_names = get_hostel_names(backend, page_size=args.page_size)
+    
+    if not hostel_names:
+        print("❌ No hostels found. Exiting.")
+        return None
+    
+    # Identify duplicate hostels
+    duplicate_groups = identify_duplicate_hostels(hostel_names, fuzzy=args.fuzzy, threshold=args.fuzzy_threshold)
+    
+    if not duplicate_groups:
+        print("ℹ️ No duplicate hostels to merge. Exiting.")
+        return None
+    
+    # Fetch full documents only for hostels that take part in a merge
+    hostels = get_hostels_by_id(backend, [hid for ids in duplicate_groups.values() for hid in ids])
+    
+    if args.match_layout:
+        print("\n📐 Checking room layouts within duplicate groups...")
+        duplicate_groups = split_groups_by_layout(duplicate_groups, hostels)
+        if not duplicate_groups:
+            print("ℹ️ No duplicate hostels with matching room layouts. Exiting.")
+            return None
+        grouped = {hid for ids in duplicate_groups.values() for hid in ids}
+        hostels = {hid: hostel for hid, hostel in hostels.items() if hid in grouped}
+    
+    # Ask for confirmation
+    if interactive and not confirm_step(args, "\n❓ Do you want to proceed with merging duplicate hostels? (y/n): "):
+        print("⏹️ Merge cancelled by user. Exiting.")
+        return None
+    
+    plan = {
+        'version': PLAN_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'source': backend.name,
+        'merge_mapping': {},  # old_hostel_id -> primary_hostel_id
+        'groups': [],
+        'moves': [],
+        'writes': [],
+        'fixes': []
+    }
+    
+    # Load allocations for the duplicate groups once; both the rewrites and the
+    # incremental validation work from this index
+    allocations = load_allocations(backend, list(hostels))
+    
+    # Groups touch disjoint hostels, so they can be planned in parallel; results
+    # are combined in group order so the plan does not depend on scheduling
+    for group_plan in plan_groups(duplicate_groups, hostels, allocations, args):
+        plan['merge_mapping'].update(group_plan['merge_mapping'])
+        plan['moves'].extend(group_plan['moves'])
+        plan['groups'].append(group_plan['group'])
+        plan['writes'].extend(group_plan['writes'])
+    
+    # The incremental validation re-checks every allocation of a moved student,
+    # including ones pointing outside the groups
+    load_student_allocations(backend, allocations, plan_moved_students(plan))
+    
+    deleted = {hid for g in plan['groups'] for hid in g['completely_merged']}
+    return plan, hostels, allocations, set(hostel_names) - deleted
+
+def plan_moved_students(plan):
+    """Return the registration numbers of every student the plan moves."""
+    return [student for move in plan['moves'] for student in move['students']]
+
+def display_plan_summary(plan):
+    """Display the overall summary of a merge plan."""
+    groups = plan['groups']
+    print("\n" + "="*60)
+    print("📊 OVERALL MERGE SUMMARY")
+    print("="*60)
+    
+    print(f"\n✅ Successfully merged {sum(g['successful_merges'] for g in groups)} students")
+    print(f"❌ Encountered {sum(g['conflicts'] for g in groups)} room conflicts")
+    print(f"🏠 Processed {len(groups)} groups of duplicate hostels")
+    print(f"🗑️ Will delete {sum(g['deleted'] for g in groups)} completely merged hostels")
+    print(f"✏️ Will update {sum(g['updated'] for g in groups)} hostels "
+          f"({sum(g['rooms_changed'] for g in groups)} rooms changed)")
+    print(f"🔄 Will update {sum(g['allocations_updated'] for g in groups)} student hostel allocations")
+    if plan['fixes']:
+        print(f"🔧 Will fix {len(plan['fixes'])} allocation(s) found by validation")
+
+def save_plan(path, plan):
+    """Write a merge plan as JSON lines.
+    
+    The first line is a header (version, creation time, source, merge
+    mapping), followed by one line per group, room move, write and allocation
+    fix, each tagged with its 'type'.
+    """
+    def line(record):
+        return json.dumps(record, separators=(',', ':')) + "\n"
+    
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(line({'type': 'header', 'version': plan['version'], 'created_at': plan['created_at'],
+                      'source': plan['source'], 'merge_mapping': plan['merge_mapping']}))
+        for kind, key in PLAN_RECORDS:
+            for record in plan[key]:
+                f.write(line({'type': kind, **record}))
+    os.replace(tmp_path, path)
+
+def load_plan(path):
+    """Read a merge plan written by save_plan."""
+    plan = {key: [] for _, key in PLAN_RECORDS}
+    sections = dict(PLAN_RECORDS)
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.pop('type', None)
+            if kind == 'header':
+                if record.get('version') != PLAN_VERSION:
+                    raise ValueError(f"{path}: unsupported plan version {record.get('version')}")
+                plan.update(record)
+            elif kind in sections:
+                plan[sections[kind]].append(record)
+            else:
+                raise ValueError(f"{path}:{line_number}: unknown plan record type {kind!r}")
+    if 'version' not in plan:
+        raise ValueError(f"{path}: missing plan header")
+    return plan
+
+def queue_plan_writes(writer, plan):
+    """Queue a plan's hostel and allocation writes on a BatchWriter, in plan order."""
+    for write in plan['writes']:
+        if write['op'] == 'update':
+            writer.update(write['collection'], write['id'], write['data'])
+        else:
+            writer.delete(write['collection'], write['id'])
+    return writer
+
+@traced
+def commit_writes(writer):
+    """Commit a BatchWriter and print its report.
+    
+    Returns:
+        bool: True if every write was saved
+    """
+    print(f"\n🔄 Updating database ({len(writer)} writes in {writer.chunk_count} batches, "
+          f"{writer.workers} at a time)...")
+    try:
+        commit_results = writer.commit()
+    except BatchCommitError as e:
+        display_commit_report(e.results)
+        print(f"❌ Database update stopped: {e}")
+        print(f"   {len(writer)} write(s) in {writer.chunk_count} batch(es) were not saved.")
+        return False
+    display_commit_report(commit_results)
+    return True
+
+def display_validation_report(validation_results):
+    """Display the final report of a post-merge validation."""
+    print(f"\n📋 Final Validation Report:")
+    print(f"   📊 Total allocations validated: {validation_results['total_allocations']}")
+    print(f"   ✅ Valid allocations: {validation_results['valid_allocations']}")
+    print(f"   🔧 Fixed allocations: {validation_results['fixed_allocations']}")
+    print(f"   🗑️ Orphaned allocations: {validation_results['orphaned_allocations']}")
+    
+    if validation_results['errors'] > 0:
+        print(f"   ⚠️ Errors during validation: {validation_results['errors']}")
+    
+    if not reporter.verbose:
+        if validation_results['issues'] or validation_results['fixes']:
+            print(f"   📝 {len(validation_results['issues'])} issue(s) and {len(validation_results['fixes'])} fix(es) "
+                  f"not listed; use --verbose or --report to see them")
+        return
+    
+    if validation_results['issues']:
+        print("   📝 Issues encountered:")
+        for issue in validation_results['issues']:
+            print(f"      - {issue}")
+    
+    if validation_results['fixes']:
+        print("   ✅ Fixes applied:")
+        for fix in validation_results['fixes']:
+            print(f"      - {fix}")
+
+def run_full_validation(backend, merge_mapping, args, rate_limiter):
+    """Re-read both collections and check every allocation."""
+    if args.disk_index:
+        return validate_allocations_on_disk(
+            backend, page_size=args.page_size, chunk_size=args.validation_chunk, fix_log=args.fix_log,
+            commit_workers=args.commit_workers, rate_limiter=rate_limiter, scan_partitions=args.scan_partitions)
+    updated_hostels = get_all_hostels(backend, page_size=args.page_size)
+    return validate_and_fix_allocation_hostel_ids(
+        backend, updated_hostels, merge_mapping, fix_log=args.fix_log,
+        commit_workers=args.commit_workers, rate_limiter=rate_limiter, scan_partitions=args.scan_partitions)
+
+def merge_command(backend, args, rate_limiter):
+    """Plan the merge, then write it and validate the result (the default command)."""
+    if args.retry_fixes:
+        retry_failed_fixes(backend, args.retry_fixes, args.commit_workers, rate_limiter)
+        return
+    
+    if args.journal:
+        journaled_merge(backend, args, rate_limiter)
+        return
+    
+    planned = build_merge_plan(backend, args)
+    if planned is None:
+        return
+    plan, hostels, allocations, hostel_ids = planned
+    
+    # Display overall summary
+    display_plan_summary(plan)
+    
+    # Ask for confirmation before updating database
+    if not confirm_step(args, "\n❓ Do you want to save these changes to the database? (y/n): "):
+        print("⏹️ Changes not saved. Exiting.")
+        return
+    
+    # Queue all writes; they are split into Firestore-sized batches on commit
+    writer = queue_plan_writes(BatchWriter(backend, workers=args.commit_workers), plan)
+    if not commit_writes(writer):
+        return
+    
+    # Show final results
+    print("\n✅ Database update complete!")
+    print(f"🗑️ Deleted {sum(g['deleted'] for g in plan['groups'])} completely merged hostels")
+    print(f"✅ Updated {sum(g['allocations_updated'] for g in plan['groups'])} hostel allocation records")
+    
+    # After merging, validate and fix any remaining allocation issues
+    merge_mapping = plan['merge_mapping']
+    if merge_mapping:
         print("\n" + "="*60)
-        print("📊 OVERALL MERGE SUMMARY")
+        print("🔍 POST-MERGE VALIDATION")
         print("="*60)
         
-        print(f"\n✅ Successfully merged {all_merge_results['successful_merges']} students")
-        print(f"❌ Encountered {all_merge_results['conflicts']} room conflicts")
-        print(f"🏠 Processed {len(all_merge_results['processed_groups'])} groups of duplicate hostels")
-        print(f"🗑️ Will delete {len(all_merge_results['completely_merged'])} completely merged hostels")
-        print(f"🔄 Updated {all_merge_results['allocation_updates']} student hostel allocations")
+        if args.full_validation:
+            # Full audit: re-read both collections and check every allocation
+            validation_results = run_full_validation(backend, merge_mapping, args, rate_limiter)
+        else:
+            # Reuse the merged in-memory state and only re-check what the merge touched
+            merged_hostels = {hid: h for hid, h in hostels.items() if hid in hostel_ids}
+            scope = get_incremental_validation_scope(allocations, merge_mapping, plan_moved_students(plan))
+            validation_results = validate_and_fix_allocation_hostel_ids(
+                backend, merged_hostels, merge_mapping, allocations, allocation_ids=scope,
+                fix_log=args.fix_log, commit_workers=args.commit_workers, rate_limiter=rate_limiter,
+                hostel_ids=hostel_ids)
         
-        # Ask for confirmation before updating database
-        confirm = input("\n❓ Do you want to save these changes to the database? (y/n): ")
-        if confirm.lower() != 'y':
-            print("⏹️ Changes not saved. Exiting.")
+        display_validation_report(validation_results)
+    
+    print("\n🎉 Duplicate hostel merger and validation complete!")
+
+def add_planned_fixes(backend, plan, hostels, allocations, hostel_ids):
+    """Validate the merged in-memory state and add the allocation fixes it needs to the plan."""
+    if not plan['merge_mapping']:
+        return
+    print("\n" + "="*60)
+    print("🔍 PLANNED VALIDATION")
+    print("="*60)
+    merged_hostels = {hid: h for hid, h in hostels.items() if hid in hostel_ids}
+    scope = get_incremental_validation_scope(allocations, plan['merge_mapping'], plan_moved_students(plan))
+    validation_results = validate_and_fix_allocation_hostel_ids(
+        backend, merged_hostels, plan['merge_mapping'], allocations, allocation_ids=scope, dry_run=True,
+        hostel_ids=hostel_ids)
+    plan['fixes'] = validation_results['pending_fixes']
+
+def plan_command(backend, args):
+    """Work out the merge and the allocation fixes it leads to, and save them as a plan file."""
+    planned = build_merge_plan(backend, args, interactive=False)
+    if planned is None:
+        return
+    plan, hostels, allocations, hostel_ids = planned
+    add_planned_fixes(backend, plan, hostels, allocations, hostel_ids)
+    display_plan_summary(plan)
+    save_plan(args.out, plan)
+    print(f"\n📝 Plan written to {args.out}: {len(plan['writes'])} writes, {len(plan['moves'])} room moves, "
+          f"{len(plan['fixes'])} allocation fixes")
+    print(f"   Review it, then run: python merger.py apply {args.out}")
+
+def journal_plan_path(journal_path):
+    """Return where a journaled merge keeps its plan: next to the journal."""
+    return os.path.splitext(journal_path)[0] + ".plan.jsonl"
+
+def open_journal(journal_path, plan_path):
+    """Open the checkpoint journal for writing the plan at plan_path.
+    
+    An unfinished journal for the same plan is resumed; otherwise a new one
+    is started.
+    
+    Returns:
+        CheckpointJournal, or None if the journal shows this plan was already written
+    """
+    journal = CheckpointJournal(journal_path)
+    digest = file_digest(plan_path)
+    if journal.started and journal.plan_digest == digest:
+        if journal.finished:
+            print(f"ℹ️ {journal_path} shows this plan was already written. Nothing to do.")
+            return None
+        print(f"⏯️ Resuming from {journal_path}: {len(journal.chunks)} batch(es) and "
+              f"{len(journal.fixes)} fix(es) already written")
+    elif journal.started and not journal.finished:
+        raise ValueError(f"{journal_path} belongs to an unfinished run of {journal.plan_path}; "
+                         f"finish it or remove the journal first")
+    else:
+        journal.start(plan_path, digest)
+    return journal
+
+def run_plan(backend, plan, args, rate_limiter, journal=None):
+    """Write a plan's hostel and allocation writes, then its allocation fixes.
+    
+    With a journal, batches and fixes it records as written are skipped, and
+    newly committed ones are recorded as they complete.
+    
+    Returns:
+        bool: True if everything in the plan has been written
+    """
+    writer = BatchWriter(backend, workers=args.commit_workers,
+                         on_commit=journal.record_chunk if journal else None)
+    queue_plan_writes(writer, plan)
+    if journal:
+        skipped = writer.discard(journal.chunks)
+        if skipped:
+            print(f"⏭️ Skipping {skipped} batch(es) committed by an earlier run")
+    if len(writer) and not commit_writes(writer):
+        if journal:
+            print(f"   Rerun with --journal {journal.path} to resume.")
+        return False
+    print("\n✅ Database update complete!")
+    
+    fixes = plan['fixes']
+    if journal:
+        fixes = [fix_item for fix_item in fixes if fix_item['doc_id'] not in journal.fixes]
+        if len(fixes) < len(plan['fixes']):
+            print(f"⏭️ Skipping {len(plan['fixes']) - len(fixes)} allocation fix(es) applied by an earlier run")
+    failed = 0
+    if fixes:
+        print(f"\n🔧 Applying {len(fixes)} planned allocation fix(es)...")
+        outcomes = apply_allocation_fixes(backend, fixes, args.commit_workers, rate_limiter,
+                                          on_commit=journal.record_fixes if journal else None)
+        write_fix_log(args.fix_log, outcomes)
+        failed = sum(1 for outcome in outcomes if outcome['status'] != 'applied')
+        print(f"   ✅ {len(outcomes) - failed} fix(es) applied")
+        if failed:
+            print(f"   ❌ {failed} fix(es) not applied; run --retry-fixes {args.fix_log}")
+        print(f"   📝 Fix results written to {args.fix_log}")
+    elif not plan['fixes']:
+        # Replace an earlier run's log, so --retry-fixes never re-applies its fixes
+        write_fix_log(args.fix_log, [])
+    
+    if journal and not failed:
+        journal.finish()
+    return not failed
+
+def apply_command(backend, args, rate_limiter):
+    """Write a plan saved by `merger.py plan`: its hostel and allocation writes, then its fixes."""
+    plan = load_plan(args.plan)
+    print(f"\n📄 Loaded plan {args.plan} (created {plan['created_at']} from {plan['source']})")
+    display_plan_summary(plan)
+    
+    if not plan['writes'] and not plan['fixes']:
+        print("ℹ️ The plan has no writes. Exiting.")
+        return
+    
+    journal = None
+    if args.journal:
+        journal = open_journal(args.journal, args.plan)
+        if journal is None:
+            return
+    
+    try:
+        print("   ⚠️ Hostel updates overwrite each hostel's floors with their state when the plan was made.")
+        if not confirm_step(args, "\n❓ Do you want to apply this plan to the database? (y/n): "):
+            print("⏹️ Plan not applied. Exiting.")
             return
         
-        # Commit all changes
-        print("\n🔄 Updating database...")
-        batch.commit()
-        
-        # Show final results
-        print("\n✅ Database update complete!")
-        print(f"🗑️ Deleted {len(all_merge_results['completely_merged'])} completely merged hostels")
-        print(f"✅ Updated {all_merge_results['allocation_updates']} hostel allocation records")
-        
-        # After merging, validate and fix any remaining allocation issues
-        if merge_mapping:
-            print("\n" + "="*60)
-            print("🔍 POST-MERGE VALIDATION")
-            print("="*60)
-            
-            # Refresh hostels data after merge
-            updated_hostels = get_all_hostels(db)
-            
-            # Run validation and fix any issues
-            validation_results = validate_and_fix_allocation_hostel_ids(db, updated_hostels, merge_mapping)
+        if not run_plan(backend, plan, args, rate_limiter, journal):
+            return
+    finally:
+        if journal:
+            journal.close()
+    
+    if args.full_validation and plan['merge_mapping']:
+        print("\n" + "="*60)
+        print("🔍 POST-MERGE VALIDATION")
+        print("="*60)
+        display_validation_report(run_full_validation(backend, plan['merge_mapping'], args, rate_limiter))
+    
+    print("\n🎉 Plan applied!")
+
+def describe_drift(index, alloc_id):
+    """Return a one-line description of a drifted allocation."""
+    status, student, hostel_id, location = index.drift[alloc_id]
+    if status == 'needs_fix':
+        return (f"{student}: allocated to {index.hostel_names.get(hostel_id, 'Unknown')} ({hostel_id[:8]}...) "
+                f"but in {location['hostel_name']} Room {location['room_number']}")
+    if status == 'found_match':
+        return (f"{student}: allocated to missing hostel {hostel_id[:8]}... "
+                f"but in {location['hostel_name']} Room {location['room_number']}")
+    return f"{student}: allocated to missing hostel {hostel_id[:8]}... and in no room"
+
+def record_drift(index, alloc_id):
+    status, student, hostel_id, location = index.drift[alloc_id]
+    reporter.record('drift', allocation_id=alloc_id, student=student, hostel_id=hostel_id,
+                    target_hostel_id=location['hostel_id'] if location else '',
+                    target_room=location['room_id'] if location else '', status=status)
+
+def display_drift_counts(index):
+    counts = index.drift_counts()
+    labels = (('needs_fix', 'need a fix'), ('found_match', 'point at a missing hostel (room found)'),
+              ('no_match', 'point at a missing hostel (no room)'))
+    print(f"   🔄 Drifted allocations: {sum(counts.values())}")
+    for status, label in labels:
+        if counts.get(status):
+            print(f"      {counts[status]} {label}")
+
+def display_watch_baseline(index):
+    """Print the state of the campus once both collections have been listed."""
+    over_capacity = sorted((index.hostel_names[hostel_id], number, occupants, capacity)
+                           for hostel_id, rooms in index.over_capacity.items()
+                           for number, (occupants, capacity) in rooms.items())
+    print(f"\n📊 Baseline at {datetime.now():%H:%M:%S}:")
+    print(f"   🏠 {len(index.hostel_names)} hostels, {sum(index.occupant_counts.values())} occupants, "
+          f"{index.student_count} students in rooms")
+    print(f"   📋 {len(index.allocations)} allocations")
+    display_drift_counts(index)
+    print(f"   ⚠️ Over-capacity rooms: {len(over_capacity)}")
+    
+    drifted = sorted(index.drift)
+    shown = drifted if reporter.verbose else drifted[:10]
+    for alloc_id in shown:
+        print(f"      • {alloc_id[:8]}... {describe_drift(index, alloc_id)}")
+    if len(shown) < len(drifted):
+        print(f"      ... and {len(drifted) - len(shown)} more (use -v to list all)")
+    for alloc_id in drifted:
+        record_drift(index, alloc_id)
+    if reporter.verbose:
+        for name, number, occupants, capacity in over_capacity:
+            print(f"      • {name} Room {number}: {occupants}/{capacity}")
+
+def display_watch_update(index, report, change_count):
+    """Print what a batch of document changes did to occupancy and drift."""
+    print(f"\n[{datetime.now():%H:%M:%S}] {change_count} document change(s)")
+    for hostel_id, name, before, after in report['occupancy']:
+        if before is None:
+            print(f"   🏠 {name} ({hostel_id[:8]}...) added with {after} occupants")
+        elif after is None:
+            print(f"   🗑️ {name} ({hostel_id[:8]}...) removed ({before} occupants)")
+        else:
+            print(f"   🏠 {name} ({hostel_id[:8]}...): {before} → {after} occupants")
+    for hostel_id, number, occupants, capacity in report['over_capacity']:
+        print(f"   ⚠️ {index.hostel_names[hostel_id]} Room {number} is over capacity: {occupants}/{capacity}")
+    for alloc_id in report['drifted']:
+        print(f"   🔄 Drift in {alloc_id[:8]}...: {describe_drift(index, alloc_id)}")
+        record_drift(index, alloc_id)
+    for alloc_id in report['resolved']:
+        print(f"   ✅ Resolved: {alloc_id[:8]}...")
+        reporter.record('drift', allocation_id=alloc_id, status='resolved')
+    if report['drifted'] or report['resolved']:
+        counts = index.drift_counts()
+        print(f"   📊 {sum(counts.values())} drifted allocation(s) open")
+
+def watch_command(backend, args):
+    """Follow changes to both collections and report occupancy and allocation drift as they happen."""
+    if backend.remote:
+        print(f"\n👀 Watching hostels and roomAllocations with snapshot listeners ({backend.name})")
+    else:
+        print(f"\n👀 Watching {args.snapshot} for changes every {args.interval:g}s")
+    print("   Press Ctrl+C to stop." if not args.duration else f"   Stopping after {args.duration:g}s.")
+    
+    index = OccupancyIndex()
+    events = queue.Queue()
+    pending = set(SNAPSHOT_COLLECTIONS)
+    watch = backend.watch(SNAPSHOT_COLLECTIONS, lambda collection, changes: events.put((collection, changes)),
+                          interval=args.interval)
+    deadline = time.monotonic() + args.duration if args.duration else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            timeout = 0.5 if deadline is None else max(0.0, min(0.5, deadline - time.monotonic()))
+            try:
+                batch = [events.get(timeout=timeout)]
+            except queue.Empty:
+                continue
+            # Report a burst of changes (e.g. a merge committing many batches) together
+            while True:
+                try:
+                    batch.append(events.get_nowait())
+                except queue.Empty:
+                    break
             
-            # Display validation summary
-            print(f"\n📋 Final Validation Report:")
-            print(f"   📊 Total allocations validated: {validation_results['total_allocations']}")
-            print(f"   ✅ Valid allocations: {validation_results['valid_allocations']}")
-            print(f"   🔧 Fixed allocations: {validation_results['fixed_allocations']}")
-            print(f"   🗑️ Orphaned allocations: {validation_results['orphaned_allocations']}")
+            report = {'occupancy': [], 'drifted': [], 'resolved': [], 'over_capacity': []}
+            for collection, changes in batch:
+                for key, items in index.apply(collection, changes).items():
+                    report[key].extend(items)
             
-            if validation_results['errors'] > 0:
-                print(f"   ⚠️ Errors during validation: {validation_results['errors']}")
-                print("   📝 Issues encountered:")
-                for issue in validation_results['issues']:
-                    print(f"      - {issue}")
+            if pending:
+                # Until both collections are listed, drift against a half-loaded index is meaningless
+                pending -= {collection for collection, _ in batch}
+                if not pending:
+                    display_watch_baseline(index)
+                    reporter.flush()
+                continue
             
-            if validation_results['fixes']:
-                print("   ✅ Fixes applied:")
-                for fix in validation_results['fixes']:
-                    print(f"      - {fix}")
+            # A document changed more than once in the burst is reported in its final state
+            report['drifted'] = [alloc_id for alloc_id in dict.fromkeys(report['drifted']) if alloc_id in index.drift]
+            report['resolved'] = [alloc_id for alloc_id in dict.fromkeys(report['resolved'])
+                                  if alloc_id not in index.drift]
+            display_watch_update(index, report, sum(len(changes) for _, changes in batch))
+            reporter.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watch.stop()
+    
+    print("\n⏹️ Stopped watching.")
+    if not pending:
+        display_drift_counts(index)
+
+def occupancy_percent(row):
+    return f"{100 * row['occupants'] / row['beds']:.1f}%" if row['beds'] else "-"
+
+def display_stats_totals(totals, seconds):
+    print(f"\n📊 Campus: {totals['hostels']} hostels, {totals['floors']} floors, {totals['rooms']} rooms "
+          f"(computed in {seconds * 1000:.1f} ms)")
+    print(f"   🛏️ {totals['beds']} beds: {totals['occupants']} occupied ({occupancy_percent(totals)}), "
+          f"{totals['free_beds']} free")
+    print(f"   🚪 {totals['empty_rooms']} empty rooms, {totals['full_rooms']} full rooms")
+    print(f"   ⚠️ {totals['over_capacity_rooms']} rooms over capacity, "
+          f"{totals['overflow']} students beyond their room's capacity")
+
+def display_occupancy_table(label, rows):
+    """Display rooms, beds and occupancy for (name, aggregate row) pairs."""
+    print("\n┌──────────────────────────────────────────┬───────┬───────┬───────────┬───────┬───────────┬──────┐")
+    print(f"│ {label:40} │ Rooms │ Beds  │ Occupants │ Free  │ Occupancy │ Over │")
+    print("├──────────────────────────────────────────┼───────┼───────┼───────────┼───────┼───────────┼──────┤")
+    for name, row in rows:
+        print(f"│ {name[:40]:40} │ {row['rooms']:5} │ {row['beds']:5} │ {row['occupants']:9} │ "
+              f"{row['free_beds']:5} │ {occupancy_percent(row):>9} │ {row['over_capacity_rooms']:4} │")
+    print("└──────────────────────────────────────────┴───────┴───────┴───────────┴───────┴───────────┴──────┘")
+
+def display_group_capacity(stats, hostel_list):
+    """Display, per duplicate group, whether the primary has beds for everyone it would take in."""
+    print("\n┌──────────────────────────────────┬─────────┬───────────┬─────────┬──────────────┬──────┐")
+    print("│ Duplicate group                  │ Hostels │ Occupants │ To move │ Primary free │ Fits │")
+    print("├──────────────────────────────────┼─────────┼───────────┼─────────┼──────────────┼──────┤")
+    for row in stats['groups']:
+        name = hostel_name(hostel_list[row['primary']])
+        fits = "yes" if row['to_move'] <= row['primary_free_beds'] else "no"
+        print(f"│ {name[:32]:32} │ {len(row['hostels']):7} │ {row['occupants']:9} │ {row['to_move']:7} │ "
+              f"{row['primary_free_beds']:12} │ {fits:4} │")
+    print("└──────────────────────────────────┴─────────┴───────────┴─────────┴──────────────┴──────┘")
+    print("   ℹ️ Counts beds only; the merge keeps students in matching room numbers, so a group that "
+          "fits may still need --place-overflow")
+
+def stats_command(backend, args):
+    """Print occupancy, free beds, over-capacity rooms and duplicate groups for the whole campus."""
+    load_numpy()  # Fail before reading the campus if NumPy is missing
+    hostels = get_all_hostels(backend, page_size=args.page_size)
+    duplicate_groups = identify_duplicate_hostels(hostels, fuzzy=args.fuzzy, threshold=args.fuzzy_threshold)
+    hostel_list = list(hostels.values())
+    positions = {hostel_id: n for n, hostel_id in enumerate(hostels)}
+    stats = campus_stats(hostel_list, [[positions[hostel_id] for hostel_id in ids]
+                                       for ids in duplicate_groups.values()])
+    
+    display_stats_totals(stats['totals'], stats['seconds'])
+    by_name = sorted(range(len(hostel_list)), key=lambda n: (hostel_name(hostel_list[n]), hostel_list[n].id))
+    for n in by_name:
+        row = stats['hostels'][n]
+        reporter.record('occupancy', hostel_id=hostel_list[n].id, count=row['occupants'],
+                        detail=f"{row['beds']} beds, {row['free_beds']} free, "
+                               f"{row['over_capacity_rooms']} over capacity")
+    for room in stats['over_capacity']:
+        reporter.record('over_capacity', hostel_id=hostel_list[room['hostel']].id, room_number=room['room_number'],
+                        count=room['occupants'], detail=f"capacity {room['capacity']}")
+    
+    if not reporter.quiet and hostel_list:
+        display_occupancy_table("Hostel", [(f"{hostel_name(hostel_list[n])} ({hostel_list[n].id[:8]}...)",
+                                            stats['hostels'][n]) for n in by_name])
+    if reporter.verbose and stats['floors']:
+        floors = defaultdict(list)
+        for row in stats['floors']:
+            hostel = hostel_list[row['hostel']]
+            floor = hostel.floors[row['floor']]
+            floors[row['hostel']].append((f"{hostel_name(hostel)[:16]} ({hostel.id[:8]}...) / "
+                                          f"{floor.get('name') or floor.get('number') or row['floor']}", row))
+        display_occupancy_table("Hostel / floor", [item for n in by_name for item in floors[n]])
+    
+    over_capacity = stats['over_capacity']
+    if over_capacity and not reporter.quiet:
+        shown = over_capacity if reporter.verbose else over_capacity[:10]
+        print("\n⚠️ Rooms over capacity (most overfull first):")
+        for room in shown:
+            print(f"   • {hostel_name(hostel_list[room['hostel']])} Room {room['room_number']}: "
+                  f"{room['occupants']}/{room['capacity']}")
+        if len(shown) < len(over_capacity):
+            print(f"   ... and {len(over_capacity) - len(shown)} more (use -v to list all)")
+    
+    if stats['groups'] and not reporter.quiet:
+        display_group_capacity(stats, hostel_list)
+    
+    if args.json:
+        summary = dict(stats, hostel_ids=[hostel.id for hostel in hostel_list],
+                       generated_at=datetime.now(timezone.utc).isoformat(), source=backend.source)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
+        print(f"📝 Statistics written to {args.json}")
+
+def journaled_merge(backend, args, rate_limiter):
+    """Merge with a checkpoint journal so an interrupted run can be resumed.
+    
+    The plan, including the allocation fixes, is worked out up front and
+    saved next to the journal. A rerun with an unfinished journal loads that
+    plan instead of re-reading the collections and writes only what is left.
+    """
+    plan_path = journal_plan_path(args.journal)
+    journal = CheckpointJournal(args.journal)
+    resuming = journal.started and not journal.finished
+    journal.close()
+    
+    if resuming:
+        plan_path = journal.plan_path
+        plan = load_plan(plan_path)
+        print(f"\n📄 Loaded plan {plan_path} of the interrupted run (created {plan['created_at']})")
+    else:
+        planned = build_merge_plan(backend, args)
+        if planned is None:
+            return
+        plan, hostels, allocations, hostel_ids = planned
+        add_planned_fixes(backend, plan, hostels, allocations, hostel_ids)
+        save_plan(plan_path, plan)
+        print(f"\n📝 Plan written to {plan_path}")
+    
+    display_plan_summary(plan)
+    journal = open_journal(args.journal, plan_path)
+    if journal is None:
+        return
+    try:
+        if not confirm_step(args, "\n❓ Do you want to save these changes to the database? (y/n): "):
+            print("⏹️ Changes not saved. Exiting.")
+            return
+        if not run_plan(backend, plan, args, rate_limiter, journal):
+            return
+    finally:
+        journal.close()
+    
+    if args.full_validation and plan['merge_mapping']:
+        print("\n" + "="*60)
+        print("🔍 POST-MERGE VALIDATION")
+        print("="*60)
+        display_validation_report(run_full_validation(backend, plan['merge_mapping'], args, rate_limiter))
+    
+    print("\n🎉 Duplicate hostel merger and validation complete!")
+
+def create_rate_limiter(args, backend):
+    """Create the write rate limiter for allocation fixes, if one applies."""
+    rate = args.max_write_rate
+    if rate is None:
+        rate = DEFAULT_WRITE_RATE if backend.remote else 0
+    return RateLimiter(rate) if rate > 0 else None
+
+def confirm_step(args, prompt):
+    """Ask the user to confirm a step, unless --yes was given."""
+    if args.yes:
+        print(f"{prompt}y (--yes)")
+        return True
+    return input(prompt).lower() == 'y'
+
+def parse_args(argv=None):
+    """Parse command line options.
+    
+    The command defaults to `merge`, so `merger.py [options]` works as before.
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] not in COMMANDS + ('-h', '--help'):
+        argv.insert(0, 'merge')
+    
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--snapshot", metavar="DIR",
+                        help="run against local hostels/roomAllocations JSON or NDJSON exports instead of Firestore")
+    common.add_argument("--write-snapshot", metavar="DIR",
+                        help="with --snapshot, write the merged collections to DIR as NDJSON")
+    common.add_argument("--async", dest="use_async", action="store_true",
+                        help="use the asyncio Firestore client so queries and batch commits run concurrently")
+    common.add_argument("--concurrency", type=int, default=DEFAULT_ASYNC_CONCURRENCY, metavar="N",
+                        help=f"with --async, maximum requests in flight (default: {DEFAULT_ASYNC_CONCURRENCY})")
+    common.add_argument("-y", "--yes", action="store_true",
+                        help="answer yes to all confirmation prompts")
+    verbosity = common.add_mutually_exclusive_group()
+    verbosity.add_argument("-v", "--verbose", dest="report_level", action="store_const", const=VERBOSE,
+                           default=NORMAL, help="print every room, allocation and fix as a table row")
+    verbosity.add_argument("-q", "--quiet", dest="report_level", action="store_const", const=QUIET,
+                           help="print only overall summaries, warnings and errors")
+    common.add_argument("--report", metavar="PATH",
+                        help="write a row per room, allocation and fix to PATH (CSV if it ends in .csv, "
+                             "JSON lines otherwise)")
+    common.add_argument("--cache", metavar="PATH",
+                        help="keep a local SQLite copy of both collections at PATH, download only the "
+                             "documents changed since the last run, and read from it (each sync still "
+                             "lists every document, billed as one read per document)")
+    common.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, metavar="N",
+                        help=f"documents per page when streaming hostels (default: {DEFAULT_PAGE_SIZE})")
+    common.add_argument("--fix-log", default="allocation-fixes.jsonl", metavar="PATH",
+                        help="JSON lines file recording each allocation fix and its outcome "
+                             "(default: allocation-fixes.jsonl)")
+    common.add_argument("--max-write-rate", type=int, metavar="N",
+                        help=f"initial allocation fix writes per second, ramped up 50%% every 5 minutes "
+                             f"(default: {DEFAULT_WRITE_RATE} on Firestore, unlimited on snapshots; 0 disables)")
+    common.add_argument("--commit-workers", type=int, default=4, metavar="N",
+                        help="number of write batches committed concurrently (default: 4)")
+    common.add_argument("--timings", action="store_true",
+                        help="print wall time, reads, writes, RPCs and bytes per phase at the end of the run")
+    common.add_argument("--trace", metavar="PATH",
+                        help="like --timings, and also write the phases as a JSON trace to PATH "
+                             "(Chrome trace event format, opens in chrome://tracing or Perfetto)")
+    common.add_argument("--profile", metavar="PATH",
+                        help="run under cProfile and save the stats to PATH (main thread only; "
+                             "view with: python -m pstats PATH)")
+    
+    run_options = argparse.ArgumentParser(add_help=False)
+    run_options.add_argument("--full-validation", action="store_true",
+                             help="after merging, re-read all hostels and check every allocation "
+                                  "instead of only those touched by the merge")
+    run_options.add_argument("--disk-index", action="store_true",
+                             help="run the full validation in bounded memory: keep the student index in a "
+                                  "temporary SQLite file and check allocations in chunks (implies "
+                                  "--full-validation)")
+    run_options.add_argument("--validation-chunk", type=int, default=DEFAULT_VALIDATION_CHUNK, metavar="N",
+                             help=f"with --disk-index, allocations checked and fixes written per round "
+                                  f"(default: {DEFAULT_VALIDATION_CHUNK})")
+    run_options.add_argument("--scan-partitions", type=int, default=1, metavar="N",
+                             help="in the full validation, read roomAllocations as N document ID ranges "
+                                  "concurrently and report timing per partition (default: 1, a single stream)")
+    run_options.add_argument("--journal", metavar="PATH",
+                             help="record committed batches and fixes in a checkpoint journal; rerunning "
+                                  "with the same journal resumes an interrupted run")
+    
+    matching = argparse.ArgumentParser(add_help=False)
+    matching.add_argument("--fuzzy", action="store_true",
+                          help="also treat hostels with similar (not just equal) names as duplicates")
+    matching.add_argument("--fuzzy-threshold", type=float, default=DEFAULT_FUZZY_THRESHOLD, metavar="RATIO",
+                          help=f"with --fuzzy, minimum name similarity from 0 to 1 "
+                               f"(default: {DEFAULT_FUZZY_THRESHOLD})")
+    
+    planning = argparse.ArgumentParser(add_help=False, parents=[matching])
+    planning.add_argument("--match-layout", action="store_true",
+                          help="only merge hostels whose room numbers mostly match")
+    planning.add_argument("--workers", type=int, default=1, metavar="N",
+                          help="plan duplicate groups in N worker processes (default: 1)")
+    planning.add_argument("--place-overflow", action="store_true",
+                          help="place students whose room does not fit in the primary's matching room "
+                               "in free beds elsewhere in the primary hostel")
+    
+    parser = argparse.ArgumentParser(description="Merge duplicate hostels and fix room allocations.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    
+    merge = commands.add_parser("merge", parents=[common, planning, run_options],
+                                help="merge duplicates and write the result (default)")
+    merge.add_argument("--retry-fixes", metavar="PATH",
+                       help="re-apply the failed fixes recorded in a fix log, then exit")
+    
+    plan = commands.add_parser("plan", parents=[common, planning],
+                               help="work out the merge and save it to a plan file without writing")
+    plan.add_argument("-o", "--out", default="merge-plan.jsonl", metavar="PATH",
+                      help="plan file to write (default: merge-plan.jsonl)")
+    
+    apply = commands.add_parser("apply", parents=[common, run_options],
+                                help="write a plan file saved by the plan command")
+    apply.add_argument("plan", metavar="PLAN", help="plan file to apply")
+    
+    watch = commands.add_parser("watch", parents=[common],
+                                help="follow live changes and report occupancy and allocation drift")
+    watch.add_argument("--interval", type=float, default=1.0, metavar="SECONDS",
+                       help="with --snapshot, how often to check the files for changes (default: 1); "
+                            "Firestore pushes changes through snapshot listeners")
+    watch.add_argument("--duration", type=float, default=0, metavar="SECONDS",
+                       help="stop after SECONDS (default: run until interrupted)")
+    
+    stats = commands.add_parser("stats", parents=[common, matching],
+                                help="summarise occupancy, free beds, over-capacity rooms and duplicate groups "
+                                     "(needs NumPy)")
+    stats.add_argument("--json", metavar="PATH",
+                       help="also write the totals and the per-hostel, per-floor, per-room and per-group "
+                            "figures to PATH as JSON")
+    
+    args = parser.parse_args(argv)
+    if args.command == 'watch' and args.use_async:
+        watch.error("--async is not supported: the asyncio client has no snapshot listeners; "
+                    "run watch without it")
+    if getattr(args, 'disk_index', False):
+        args.full_validation = True
+    return args
+
+def main(argv=None):
+    """Main function to execute the hostel merger."""
+    args = parse_args(argv)
+    backend = None
+    reporter.level = args.report_level
+    if args.report:
+        reporter.open(args.report)
+    if args.timings or args.trace:
+        tracer.enable()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        # Initialize the datastore (Firestore or a local snapshot)
+        if args.use_async:
+            # Commit threads only hand batches to the event loop, which caps requests in flight
+            args.commit_workers = max(args.commit_workers, args.concurrency)
+        backend = initialize_backend(args)
+        if tracer.enabled:
+            backend.observer = tracer.count
+        if args.cache:
+            backend = sync_cache(backend, args.cache, page_size=args.page_size)
+            backend.observer = backend.source_backend.observer
+        rate_limiter = create_rate_limiter(args, backend)
         
-        print("\n🎉 Duplicate hostel merger and validation complete!")
+        if args.command == 'plan':
+            plan_command(backend, args)
+        elif args.command == 'apply':
+            apply_command(backend, args, rate_limiter)
+        elif args.command == 'watch':
+            watch_command(backend, args)
+        elif args.command == 'stats':
+            stats_command(backend, args)
+        else:
+            merge_command(backend, args, rate_limiter)
         
     except Exception as e:
         print(f"❌ Error: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        if backend is not None:
+            backend.close()
+        if args.report:
+            reporter.close()
+            print(f"📝 Report written to {args.report} ({reporter.rows_written} rows)")
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"📝 Profile written to {args.profile}")
+        if tracer.enabled:
+            display_phase_report(tracer.summary(), tracer.totals)
+        if args.trace:
+            tracer.write(args.trace, {'command': args.command,
+                                      'backend': backend.name if backend is not None else None})
+            print(f"📝 Trace written to {args.trace} ({len(tracer.events)} phase calls)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
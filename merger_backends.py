@@ -0,0 +1,1015 @@
+"""Datastore backends used by merger.py.
+
+The merger only needs a handful of datastore operations: stream a collection,
+query it by a single field, and write or delete documents in batches.
+``FirestoreBackend`` maps these onto the Firebase Admin SDK client, while
+``SnapshotBackend`` serves them from local JSON/NDJSON exports so that merges
+can be rehearsed, timed and profiled offline without touching the live project.
+``AsyncFirestoreBackend`` runs the same operations on the asyncio client so
+independent reads and batch commits overlap.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SNAPSHOT_COLLECTIONS = ("hostels", "roomAllocations")
+SNAPSHOT_EXTENSIONS = (".ndjson", ".jsonl", ".json")
+
+# Firestore's "500/50/5" guidance: start at 500 writes/s, grow 50% every 5 minutes
+DEFAULT_WRITE_RATE = 500
+WRITE_RATE_RAMP_UP = 1.5
+WRITE_RATE_RAMP_INTERVAL = 300
+
+# Firestore allows at most 30 values in an 'in' filter
+MAX_IN_FILTER_VALUES = 30
+
+# Requests the async backend keeps in flight by default
+DEFAULT_ASYNC_CONCURRENCY = 16
+
+# Firestore rejects batches with more than 500 writes or a 10 MiB request;
+# the byte bound leaves headroom for request overhead.
+MAX_BATCH_OPERATIONS = 500
+MAX_BATCH_BYTES = 9 * 1024 * 1024
+
+# google.api_core exception names worth retrying (contention and transient errors)
+RETRYABLE_ERRORS = ("Aborted", "Conflict", "DeadlineExceeded", "InternalServerError",
+                    "ResourceExhausted", "ServiceUnavailable", "TooManyRequests")
+
+
+class DocumentNotFound(Exception):
+    """Raised when an update targets a document that does not exist."""
+
+
+class BatchCommitError(Exception):
+    """Raised when a chunk still fails after all retries.
+
+    ``results`` holds the ``ChunkResult`` of every chunk that was attempted,
+    including the committed ones.
+    """
+
+    def __init__(self, message, results):
+        super().__init__(message)
+        self.results = results
+
+
+class ChunkResult:
+    """Outcome of committing one chunk of a ``BatchWriter``."""
+
+    __slots__ = ("index", "operations", "size", "attempts", "latency", "error")
+
+    def __init__(self, index, operations, size):
+        self.index = index
+        self.operations = operations
+        self.size = size
+        self.attempts = 0
+        self.latency = 0.0
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class RateLimiter:
+    """Token bucket limiting write operations per second across threads.
+
+    The allowed rate starts at ``rate`` and is multiplied by ``ramp_up``
+    every ``ramp_interval`` seconds, following Firestore's guidance for
+    ramping up traffic. A request for more operations than one second's worth
+    waits for a full bucket and then runs, leaving the bucket in debt.
+    """
+
+    def __init__(self, rate=DEFAULT_WRITE_RATE, ramp_up=WRITE_RATE_RAMP_UP,
+                 ramp_interval=WRITE_RATE_RAMP_INTERVAL):
+        self.initial_rate = rate
+        self.ramp_up = ramp_up
+        self.ramp_interval = ramp_interval
+        self._start = self._last = time.monotonic()
+        self._tokens = float(rate)
+        self._lock = threading.Lock()
+
+    def current_rate(self, now=None):
+        now = time.monotonic() if now is None else now
+        steps = int((now - self._start) // self.ramp_interval) if self.ramp_interval else 0
+        return self.initial_rate * (self.ramp_up ** steps)
+
+    def acquire(self, operations=1):
+        """Block until ``operations`` writes may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                rate = self.current_rate(now)
+                self._tokens = min(rate, self._tokens + (now - self._last) * rate)
+                self._last = now
+                needed = min(operations, rate)
+                if self._tokens >= needed:
+                    self._tokens -= operations
+                    return
+                wait = (needed - self._tokens) / rate
+            time.sleep(wait)
+
+
+def is_retryable(exc):
+    """Whether a commit error is contention or a transient backend failure."""
+    return type(exc).__name__ in RETRYABLE_ERRORS
+
+
+def format_timestamp(value):
+    """Return a Firestore timestamp as an RFC 3339 string, keeping nanoseconds if it has them."""
+    rfc3339 = getattr(value, "rfc3339", None)
+    return rfc3339() if rfc3339 is not None else value.isoformat()
+
+
+def estimate_document_size(value):
+    """Approximate Firestore storage size of a value, in bytes.
+
+    Follows Firestore's size rules closely enough to keep batches under the
+    request limit: strings count their UTF-8 length plus one, numbers eight
+    bytes, and map keys are counted like strings.
+    """
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float)):
+        return 8
+    if isinstance(value, dict):
+        return sum(len(k.encode("utf-8")) + 1 + estimate_document_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_document_size(v) for v in value)
+    return 16
+
+
+def operations_digest(operations):
+    """Return a stable digest of a list of queued write operations."""
+    payload = json.dumps(operations, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Watch:
+    """Handle of a running ``DatastoreBackend.watch``."""
+
+    def __init__(self, stop):
+        self._stop = stop
+
+    def stop(self):
+        """Stop delivering changes."""
+        self._stop()
+
+
+class DatastoreBackend:
+    """Interface every merger backend implements.
+
+    Documents are exchanged as ``(doc_id, data)`` tuples where ``data`` is a
+    plain dict owned by the caller, so mutating it never touches the store.
+    """
+
+    name = "abstract"
+    remote = False  # whether writes go over the network and should be rate limited
+    source = None  # identifies the database or export the documents come from
+
+    # Optional callable taking counter keyword arguments (reads, writes, rpcs,
+    # bytes_read, bytes_written), e.g. ``merger_trace.Tracer.count``; called
+    # from any thread as requests are made
+    observer = None
+
+    def _observe(self, **counts):
+        if self.observer is not None:
+            self.observer(**counts)
+
+    def _observe_docs(self, docs):
+        """Pass ``(doc_id, data)`` pairs through, counting each as a document read."""
+        observer = self.observer
+        for doc_id, data in docs:
+            if observer is not None:
+                observer(reads=1, bytes_read=len(doc_id) + estimate_document_size(data))
+            yield doc_id, data
+
+    def stream(self, collection, fields=None, page_size=None):
+        """Yield ``(doc_id, data)`` for every document in a collection.
+
+        If ``fields`` is given, only those top-level fields are returned. If
+        ``page_size`` is given, remote backends read the collection in pages
+        of that many documents, resuming each page from a document cursor.
+        """
+        raise NotImplementedError
+
+    def partition(self, collection, count):
+        """Split a collection into at most ``count`` document ID ranges.
+
+        Returns opaque partitions for ``stream_partition``; together they
+        cover every document exactly once.
+        """
+        return [None]
+
+    def stream_partition(self, collection, partition, fields=None):
+        """Yield ``(doc_id, data)`` for the documents in one partition."""
+        return self.stream(collection, fields)
+
+    def versions(self, collection, page_size=None):
+        """Yield ``(doc_id, version)`` for every document in a collection.
+
+        A document's version changes whenever the document does (on Firestore
+        it is the update time), so a cache can tell which documents to
+        refetch without reading their contents.
+        """
+        raise NotImplementedError
+
+    def get_many(self, collection, doc_ids, fields=None):
+        """Yield ``(doc_id, data)`` for the given document IDs that exist."""
+        raise NotImplementedError
+
+    def query(self, collection, field, value, fields=None):
+        """Yield ``(doc_id, data)`` for documents where ``field == value``."""
+        raise NotImplementedError
+
+    def query_many(self, collection, field, values, fields=None):
+        """Yield ``(doc_id, data)`` for documents where ``field`` is any of ``values``."""
+        for value in values:
+            yield from self.query(collection, field, value, fields)
+
+    def batch(self):
+        """Return a new ``WriteBatch`` bound to this backend."""
+        raise NotImplementedError
+
+    def watch(self, collections, callback, interval=1.0):
+        """Call ``callback(collection, changes)`` whenever documents in ``collections`` change.
+
+        ``changes`` is a list of ``(doc_id, data)`` tuples, with ``data``
+        None for a deleted document. The first call for each collection
+        lists all of its documents, even if there are none. Callbacks come
+        from a background thread. Returns a ``Watch``; backends that poll
+        check every ``interval`` seconds.
+        """
+        raise NotImplementedError(f"the {self.name} backend cannot watch for changes")
+
+    def close(self):
+        """Release resources and persist any pending state."""
+
+
+def is_top_level(doc):
+    """Whether a document snapshot belongs to a top-level collection.
+
+    Collection group queries also return documents of subcollections with
+    the same name, whose parent collection sits under another document.
+    """
+    return doc.reference.parent.parent is None
+
+
+class PartitionStats:
+    """Outcome of reading one partition of a ``PartitionedScan``."""
+
+    __slots__ = ("index", "documents", "seconds", "error")
+
+    def __init__(self, index):
+        self.index = index
+        self.documents = 0
+        self.seconds = 0.0
+        self.error = None
+
+
+class PartitionedScan:
+    """Reads a whole collection as ID-range partitions on a thread pool.
+
+    Iterating yields ``(doc_id, data)`` for every document, in the order the
+    partitions deliver them rather than in ID order. Workers hand documents
+    over in pages of ``page_size`` through a bounded queue, so only a few
+    pages per worker are buffered however large the collection is. If a
+    partition fails, iteration raises its error. Once iteration ends,
+    ``stats`` holds a ``PartitionStats`` per partition; a partition's time
+    includes any wait for the consumer to catch up.
+    """
+
+    def __init__(self, backend, collection, partitions, fields=None, workers=None, page_size=500):
+        self.backend = backend
+        self.collection = collection
+        self.partitions = partitions
+        self.fields = fields
+        self.workers = max(1, workers or partitions)
+        self.page_size = page_size
+        self.stats = []
+
+    def __iter__(self):
+        partitions = self.backend.partition(self.collection, self.partitions)
+        self.stats = [PartitionStats(index) for index in range(len(partitions))]
+        pages = queue.Queue(maxsize=2 * self.workers)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read(index):
+            stats = self.stats[index]
+            start = time.perf_counter()
+            page = []
+            try:
+                for doc in self.backend.stream_partition(self.collection, partitions[index], self.fields):
+                    page.append(doc)
+                    stats.documents += 1
+                    if len(page) >= self.page_size:
+                        if not put(page):
+                            return
+                        page = []
+                if page:
+                    put(page)
+            except Exception as e:
+                stats.error = e
+            finally:
+                stats.seconds = time.perf_counter() - start
+                put(stats)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for index in range(len(partitions)):
+                pool.submit(read, index)
+            try:
+                remaining = len(partitions)
+                while remaining:
+                    item = pages.get()
+                    if isinstance(item, PartitionStats):
+                        remaining -= 1
+                        if item.error is not None:
+                            raise item.error
+                        continue
+                    yield from item
+            finally:
+                stop.set()
+
+
+class WriteBatch:
+    """Collects updates and deletes and applies them together on ``commit``."""
+
+    def __init__(self):
+        self.operations = []
+
+    def update(self, collection, doc_id, data):
+        self.operations.append(("update", collection, doc_id, data))
+
+    def delete(self, collection, doc_id):
+        self.operations.append(("delete", collection, doc_id, None))
+
+    def commit(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self.operations)
+
+
+class BatchWriter:
+    """Queues writes and commits them as bounded chunks on a worker pool.
+
+    Writes are packed into backend batches holding at most ``max_operations``
+    writes and roughly ``max_bytes`` of document data, so any number of writes
+    can be queued and each chunk still commits atomically. On ``commit`` the
+    chunks are sent concurrently by up to ``workers`` threads. Chunks that
+    write a document already written by an earlier chunk wait for it, so the
+    final state matches committing every chunk in queue order. Contention and
+    transient errors are retried with exponential backoff. An optional
+    ``RateLimiter`` caps the write rate across all workers, and an optional
+    ``on_commit`` callback is called with each chunk once it has committed
+    (from the worker thread), e.g. to journal progress.
+    """
+
+    def __init__(self, backend, max_operations=MAX_BATCH_OPERATIONS, max_bytes=MAX_BATCH_BYTES,
+                 workers=4, max_attempts=5, backoff=0.5, max_backoff=8.0, rate_limiter=None,
+                 on_commit=None):
+        self.backend = backend
+        self.rate_limiter = rate_limiter
+        self.on_commit = on_commit
+        self.max_operations = max_operations
+        self.max_bytes = max_bytes
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.batches = []
+        self.batch_sizes = []
+
+    def _current_batch(self, size):
+        if (not self.batches
+                or len(self.batches[-1]) >= self.max_operations
+                or (len(self.batches[-1]) and self.batch_sizes[-1] + size > self.max_bytes)):
+            self.batches.append(self.backend.batch())
+            self.batch_sizes.append(0)
+        self.batch_sizes[-1] += size
+        return self.batches[-1]
+
+    def update(self, collection, doc_id, data):
+        """Queue an update and return the index of the chunk it went into."""
+        size = len(doc_id) + estimate_document_size(data)
+        self._current_batch(size).update(collection, doc_id, data)
+        return len(self.batches) - 1
+
+    def delete(self, collection, doc_id):
+        """Queue a delete and return the index of the chunk it went into."""
+        self._current_batch(len(doc_id)).delete(collection, doc_id)
+        return len(self.batches) - 1
+
+    @property
+    def chunk_count(self):
+        return len(self.batches)
+
+    def discard(self, digests):
+        """Drop queued chunks whose ``operations_digest`` is in ``digests``.
+
+        Chunking is deterministic for the same writes and limits, so this
+        skips chunks a previous run already committed. Returns how many
+        chunks were dropped.
+        """
+        keep = [i for i, batch in enumerate(self.batches)
+                if operations_digest(batch.operations) not in digests]
+        dropped = len(self.batches) - len(keep)
+        self.batches = [self.batches[i] for i in keep]
+        self.batch_sizes = [self.batch_sizes[i] for i in keep]
+        return dropped
+
+    def _waves(self):
+        """Group chunk indexes into waves with no document written twice."""
+        waves = []
+        wave_keys = None
+        for index, batch in enumerate(self.batches):
+            keys = {(collection, doc_id) for _, collection, doc_id, _ in batch.operations}
+            if wave_keys is None or not keys.isdisjoint(wave_keys):
+                waves.append([])
+                wave_keys = set()
+            waves[-1].append(index)
+            wave_keys |= keys
+        return waves
+
+    def _commit_chunk(self, index):
+        result = ChunkResult(index, len(self.batches[index]), self.batch_sizes[index])
+        delay = self.backoff
+        start = time.perf_counter()
+        while True:
+            result.attempts += 1
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(result.operations)
+            self.backend._observe(rpcs=1)
+            try:
+                self.batches[index].commit()
+                self.backend._observe(writes=result.operations, bytes_written=result.size)
+                break
+            except Exception as e:
+                if result.attempts >= self.max_attempts or not is_retryable(e):
+                    result.error = e
+                    break
+                time.sleep(delay * (0.5 + random.random()))
+                delay = min(delay * 2, self.max_backoff)
+        result.latency = time.perf_counter() - start
+        if result.ok and self.on_commit is not None:
+            self.on_commit(self.batches[index])
+        return result
+
+    def commit(self):
+        """Commit all queued chunks and return their ``ChunkResult`` list.
+
+        If a chunk still fails after retrying, the wave it belongs to is
+        finished, later waves are not started and ``BatchCommitError`` is
+        raised. Committed chunks are dropped from the queue; the failed and
+        unstarted ones stay queued so ``commit`` can be called again.
+        """
+        results = []
+        failed = None
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for wave in self._waves():
+                wave_results = list(pool.map(self._commit_chunk, wave))
+                results.extend(wave_results)
+                failed = next((r for r in wave_results if not r.ok), None)
+                if failed:
+                    break
+
+        committed = {r.index for r in results if r.ok}
+        self.batches = [b for i, b in enumerate(self.batches) if i not in committed]
+        self.batch_sizes = [n for i, n in enumerate(self.batch_sizes) if i not in committed]
+
+        if failed:
+            raise BatchCommitError(
+                f"Chunk {failed.index + 1} failed after {failed.attempts} attempt(s): {failed.error}",
+                results)
+        return results
+
+    def __len__(self):
+        return sum(len(batch) for batch in self.batches)
+
+
+class FirestoreWriteBatch(WriteBatch):
+    """Write batch backed by a native Firestore ``WriteBatch``."""
+
+    def __init__(self, db):
+        super().__init__()
+        self._db = db
+
+    def commit(self):
+        batch = self._db.batch()
+        for op, collection, doc_id, data in self.operations:
+            doc_ref = self._db.collection(collection).document(doc_id)
+            if op == "update":
+                batch.update(doc_ref, data)
+            else:
+                batch.delete(doc_ref)
+        return batch.commit()
+
+
+class FirestoreBackend(DatastoreBackend):
+    """Backend that talks to a live Firestore database."""
+
+    name = "firestore"
+    remote = True
+
+    def __init__(self, db):
+        self.db = db
+        self.source = f"firestore:{getattr(db, 'project', '')}"
+
+    def _documents(self, query, page_size):
+        """Yield the document snapshots of a query, in pages of ``page_size`` if given."""
+        if not page_size:
+            self._observe(rpcs=1)
+            yield from query.stream()
+            return
+
+        # Page through the collection in document ID order, resuming after the
+        # last document seen, so no single long-lived stream is held open
+        query = query.order_by("__name__").limit(page_size)
+        last_doc = None
+        while True:
+            page = query.start_after(last_doc) if last_doc is not None else query
+            self._observe(rpcs=1)
+            docs = list(page.stream())
+            yield from docs
+            if len(docs) < page_size:
+                break
+            last_doc = docs[-1]
+
+    def stream(self, collection, fields=None, page_size=None):
+        query = self.db.collection(collection)
+        if fields is not None:
+            query = query.select(list(fields))
+        yield from self._observe_docs((doc.id, doc.to_dict() or {}) for doc in self._documents(query, page_size))
+
+    def partition(self, collection, count):
+        if count <= 1:
+            return [None]
+        # Partition queries are only offered on collection groups, which also
+        # cover subcollections of the same name; stream_partition skips those
+        self._observe(rpcs=1)
+        return list(self.db.collection_group(collection).get_partitions(count)) or [None]
+
+    def stream_partition(self, collection, partition, fields=None):
+        query = partition.query() if partition is not None else self.db.collection(collection)
+        if fields is not None:
+            query = query.select(list(fields))
+        yield from self._observe_docs((doc.id, doc.to_dict() or {}) for doc in self._documents(query, None)
+                                      if is_top_level(doc))
+
+    def versions(self, collection, page_size=None):
+        # Projecting only the document ID returns names and timestamps, no fields
+        # (an empty projection would return every field)
+        query = self.db.collection(collection).select(["__name__"])
+        for doc in self._documents(query, page_size):
+            self._observe(reads=1, bytes_read=len(doc.reference.path))
+            yield doc.id, format_timestamp(doc.update_time)
+
+    def get_many(self, collection, doc_ids, fields=None):
+        refs = [self.db.collection(collection).document(doc_id) for doc_id in doc_ids]
+        field_paths = list(fields) if fields is not None else None
+        for start in range(0, len(refs), MAX_BATCH_OPERATIONS):
+            self._observe(rpcs=1)
+            docs = self.db.get_all(refs[start:start + MAX_BATCH_OPERATIONS], field_paths=field_paths)
+            yield from self._observe_docs((doc.id, doc.to_dict() or {}) for doc in docs if doc.exists)
+
+    def query(self, collection, field, value, fields=None):
+        query = self.db.collection(collection).where(field, "==", value)
+        if fields is not None:
+            query = query.select(list(fields))
+        self._observe(rpcs=1)
+        yield from self._observe_docs((doc.id, doc.to_dict() or {}) for doc in query.stream())
+
+    def query_many(self, collection, field, values, fields=None):
+        # One 'in' query per 30 values instead of one query per value
+        values = list(values)
+        for start in range(0, len(values), MAX_IN_FILTER_VALUES):
+            query = self.db.collection(collection).where(field, "in", values[start:start + MAX_IN_FILTER_VALUES])
+            if fields is not None:
+                query = query.select(list(fields))
+            self._observe(rpcs=1)
+            yield from self._observe_docs((doc.id, doc.to_dict() or {}) for doc in query.stream())
+
+    def batch(self):
+        return FirestoreWriteBatch(self.db)
+
+    def watch(self, collections, callback, interval=1.0):
+        # Snapshot listeners push changes as they happen; interval is not needed
+        def listener(collection):
+            def on_snapshot(docs, changes, read_time):
+                self._observe(reads=len(changes))
+                callback(collection, [(change.document.id,
+                                       None if change.type.name == "REMOVED" else change.document.to_dict() or {})
+                                      for change in changes])
+            return on_snapshot
+
+        watches = [self.db.collection(collection).on_snapshot(listener(collection))
+                   for collection in collections]
+
+        def stop():
+            for collection_watch in watches:
+                collection_watch.unsubscribe()
+
+        return Watch(stop)
+
+
+class AsyncFirestoreWriteBatch(WriteBatch):
+    """Write batch committed through an ``AsyncFirestoreBackend``."""
+
+    def __init__(self, backend):
+        super().__init__()
+        self._backend = backend
+
+    def commit(self):
+        return self._backend.run(self._backend.commit_operations(self.operations))
+
+
+class AsyncFirestoreBackend(DatastoreBackend):
+    """Firestore backend built on the asyncio ``AsyncClient``.
+
+    The merger's control flow (and its confirmation prompts) stays
+    synchronous. This backend runs an event loop on a background thread and
+    every call hands its I/O to that loop, so requests issued together -- the
+    per-value queries of ``query_many``, the ID chunks of ``get_many`` and the
+    batches committed by ``BatchWriter`` worker threads -- are pipelined over
+    the async client with at most ``concurrency`` requests in flight.
+    """
+
+    name = "firestore-async"
+    remote = True
+
+    def __init__(self, db, concurrency=DEFAULT_ASYNC_CONCURRENCY):
+        self.db = db
+        self.source = f"firestore:{getattr(db, 'project', '')}"
+        self.concurrency = concurrency
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="firestore-async", daemon=True)
+        self._thread.start()
+        self._semaphore = self.run(self._create_semaphore())
+
+    async def _create_semaphore(self):
+        return asyncio.Semaphore(self.concurrency)
+
+    def run(self, coro):
+        """Run a coroutine on the backend's event loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _fetch_snapshots(self, query):
+        self._observe(rpcs=1)
+        async with self._semaphore:
+            return [doc async for doc in query.stream()]
+
+    async def _fetch(self, query):
+        return [(doc.id, doc.to_dict() or {}) for doc in await self._fetch_snapshots(query)]
+
+    def _documents(self, query, page_size):
+        """Yield the document snapshots of a query, in pages of ``page_size`` if given."""
+        if not page_size:
+            yield from self.run(self._fetch_snapshots(query))
+            return
+
+        query = query.order_by("__name__").limit(page_size)
+        last_doc = None
+        while True:
+            page = query.start_after(last_doc) if last_doc is not None else query
+            docs = self.run(self._fetch_snapshots(page))
+            yield from docs
+            if len(docs) < page_size:
+                break
+            last_doc = docs[-1]
+
+    def stream(self, collection, fields=None, page_size=None):
+        query = self.db.collection(collection)
+        if fields is not None:
+            query = query.select(list(fields))
+        yield from self._observe_docs((doc.id, doc.to_dict() or {}) for doc in self._documents(query, page_size))
+
+    def partition(self, collection, count):
+        if count <= 1:
+            return [None]
+
+        async def partitions():
+            self._observe(rpcs=1)
+            async with self._semaphore:
+                return [p async for p in self.db.collection_group(collection).get_partitions(count)]
+
+        return self.run(partitions()) or [None]
+
+    def stream_partition(self, collection, partition, fields=None):
+        query = partition.query() if partition is not None else self.db.collection(collection)
+        if fields is not None:
+            query = query.select(list(fields))
+        yield from self._observe_docs((doc.id, doc.to_dict() or {}) for doc in self._documents(query, None)
+                                      if is_top_level(doc))
+
+    def versions(self, collection, page_size=None):
+        query = self.db.collection(collection).select(["__name__"])
+        for doc in self._documents(query, page_size):
+            self._observe(reads=1, bytes_read=len(doc.reference.path))
+            yield doc.id, format_timestamp(doc.update_time)
+
+    async def _get_chunk(self, refs, fields):
+        self._observe(rpcs=1)
+        async with self._semaphore:
+            field_paths = list(fields) if fields is not None else None
+            return [(doc.id, doc.to_dict() or {}) async for doc in self.db.get_all(refs, field_paths=field_paths)
+                    if doc.exists]
+
+    def get_many(self, collection, doc_ids, fields=None):
+        refs = [self.db.collection(collection).document(doc_id) for doc_id in doc_ids]
+        chunks = [refs[start:start + MAX_IN_FILTER_VALUES] for start in range(0, len(refs), MAX_IN_FILTER_VALUES)]
+
+        async def gather():
+            return await asyncio.gather(*(self._get_chunk(chunk, fields) for chunk in chunks))
+
+        for docs in self.run(gather()):
+            yield from self._observe_docs(docs)
+
+    def _query(self, collection, field, value, fields):
+        query = self.db.collection(collection).where(field, "==", value)
+        if fields is not None:
+            query = query.select(list(fields))
+        return query
+
+    def query(self, collection, field, value, fields=None):
+        yield from self._observe_docs(self.run(self._fetch(self._query(collection, field, value, fields))))
+
+    def query_many(self, collection, field, values, fields=None):
+        async def gather():
+            return await asyncio.gather(*(self._fetch(self._query(collection, field, value, fields))
+                                          for value in values))
+
+        for docs in self.run(gather()):
+            yield from self._observe_docs(docs)
+
+    async def commit_operations(self, operations):
+        async with self._semaphore:
+            batch = self.db.batch()
+            for op, collection, doc_id, data in operations:
+                doc_ref = self.db.collection(collection).document(doc_id)
+                if op == "update":
+                    batch.update(doc_ref, data)
+                else:
+                    batch.delete(doc_ref)
+            return await batch.commit()
+
+    def batch(self):
+        return AsyncFirestoreWriteBatch(self)
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+class SnapshotWriteBatch(WriteBatch):
+    """Write batch applied atomically to a ``SnapshotBackend``."""
+
+    def __init__(self, backend):
+        super().__init__()
+        self._backend = backend
+
+    def commit(self):
+        self._backend.apply(self.operations)
+        return []
+
+
+class SnapshotBackend(DatastoreBackend):
+    """In-memory backend loaded from a directory of collection exports.
+
+    The directory holds one file per collection named after it, e.g.
+    ``hostels.json`` and ``roomAllocations.ndjson``. JSON files may contain a
+    list of documents carrying an ``id`` key or an object keyed by document ID;
+    NDJSON/JSONL files hold one document (with ``id``) per line.
+
+    Documents are kept as serialized JSON so every read hands out a fresh copy,
+    matching Firestore semantics where local mutations are invisible until
+    committed. Committed writes stay in memory unless ``output_dir`` is given,
+    in which case the collections are written back as NDJSON on ``close``.
+    For the ``observer``, each read call counts as one RPC, standing in for
+    the request Firestore would get. Without a ``snapshot_dir`` the backend
+    starts out empty. Document versions are digests of their contents.
+    """
+
+    name = "snapshot"
+
+    def __init__(self, snapshot_dir, output_dir=None):
+        self.snapshot_dir = snapshot_dir
+        self.output_dir = output_dir
+        self.collections = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        if snapshot_dir:
+            self.source = f"snapshot:{os.path.abspath(snapshot_dir)}"
+
+        for collection in SNAPSHOT_COLLECTIONS:
+            path = find_snapshot_file(snapshot_dir, collection) if snapshot_dir else None
+            self.collections[collection] = load_snapshot_file(path) if path else {}
+
+    def stream(self, collection, fields=None, page_size=None):
+        # Everything is already in memory, so paging has nothing to save here
+        self._observe(rpcs=1)
+        docs = list(self.collections.get(collection, {}).items())
+        yield from self._observe_docs((doc_id, self._decode(raw, fields)) for doc_id, raw in docs)
+
+    def get_many(self, collection, doc_ids, fields=None):
+        self._observe(rpcs=1)
+        docs = self.collections.get(collection, {})
+        found = ((doc_id, docs.get(doc_id)) for doc_id in doc_ids)
+        yield from self._observe_docs((doc_id, self._decode(raw, fields)) for doc_id, raw in found
+                                      if raw is not None)
+
+    def partition(self, collection, count):
+        # Key ranges [start, end) splitting the sorted document IDs evenly
+        doc_ids = sorted(self.collections.get(collection, {}))
+        count = max(1, min(count, len(doc_ids)))
+        bounds = [doc_ids[len(doc_ids) * i // count] for i in range(1, count)]
+        return list(zip([None] + bounds, bounds + [None]))
+
+    def stream_partition(self, collection, partition, fields=None):
+        start, end = partition
+        self._observe(rpcs=1)
+        docs = [(doc_id, raw) for doc_id, raw in list(self.collections.get(collection, {}).items())
+                if (start is None or doc_id >= start) and (end is None or doc_id < end)]
+        yield from self._observe_docs((doc_id, self._decode(raw, fields)) for doc_id, raw in docs)
+
+    def versions(self, collection, page_size=None):
+        self._observe(rpcs=1)
+        for doc_id, raw in list(self.collections.get(collection, {}).items()):
+            self._observe(reads=1, bytes_read=len(doc_id))
+            yield doc_id, hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _decode(raw, fields):
+        return SnapshotBackend._decode_fields(json.loads(raw), fields)
+
+    @staticmethod
+    def _decode_fields(data, fields):
+        if fields is not None:
+            data = {k: data[k] for k in fields if k in data}
+        return data
+
+    def query(self, collection, field, value, fields=None):
+        return self.query_many(collection, field, [value], fields)
+
+    def query_many(self, collection, field, values, fields=None):
+        values = set(values)
+        self._observe(rpcs=1)
+        yield from self._observe_docs(self._matching(collection, field, values, fields))
+
+    def _matching(self, collection, field, values, fields):
+        for doc_id, raw in list(self.collections.get(collection, {}).items()):
+            data = json.loads(raw)
+            if data.get(field) in values:
+                yield doc_id, self._decode_fields(data, fields)
+
+    def batch(self):
+        return SnapshotWriteBatch(self)
+
+    def watch(self, collections, callback, interval=1.0):
+        # Poll the export files; when one's size or modification time changes,
+        # reload it and report the documents that differ
+        stopped = threading.Event()
+
+        def file_stamp(collection):
+            path = find_snapshot_file(self.snapshot_dir, collection) if self.snapshot_dir else None
+            if path is None:
+                return None, None
+            stat = os.stat(path)
+            return path, (path, stat.st_mtime_ns, stat.st_size)
+
+        def poll():
+            stamps = {}
+            for collection in collections:
+                try:
+                    stamps[collection] = file_stamp(collection)[1]
+                except OSError:
+                    stamps[collection] = None
+                with self._lock:
+                    docs = dict(self.collections.get(collection, {}))
+                callback(collection, [(doc_id, json.loads(raw)) for doc_id, raw in docs.items()])
+
+            while not stopped.wait(interval):
+                for collection in collections:
+                    try:
+                        path, stamp = file_stamp(collection)
+                        if stamp == stamps[collection]:
+                            continue
+                        docs = load_snapshot_file(path) if path else {}
+                    except (OSError, ValueError):
+                        continue  # Removed or caught mid-write; look again next time
+                    stamps[collection] = stamp
+                    with self._lock:
+                        old = self.collections.get(collection, {})
+                        self.collections[collection] = docs
+                    changes = [(doc_id, json.loads(raw)) for doc_id, raw in docs.items() if old.get(doc_id) != raw]
+                    changes += [(doc_id, None) for doc_id in old if doc_id not in docs]
+                    if changes:
+                        self._observe(rpcs=1, reads=len(changes))
+                        callback(collection, changes)
+
+        thread = threading.Thread(target=poll, name="snapshot-watch", daemon=True)
+        thread.start()
+
+        def stop():
+            stopped.set()
+            thread.join()
+
+        return Watch(stop)
+
+    def apply(self, operations):
+        """Apply a list of batch operations all-or-nothing."""
+        with self._lock:
+            self._apply(operations)
+
+    def _apply(self, operations):
+        deleted = set()
+        for op, collection, doc_id, _ in operations:
+            key = (collection, doc_id)
+            if op == "delete":
+                deleted.add(key)
+            elif key in deleted or doc_id not in self.collections.get(collection, {}):
+                raise DocumentNotFound(f"No document to update: {collection}/{doc_id}")
+
+        for op, collection, doc_id, data in operations:
+            docs = self.collections.setdefault(collection, {})
+            if op == "update":
+                current = json.loads(docs[doc_id])
+                current.update(data)
+                docs[doc_id] = json.dumps(current)
+            else:
+                docs.pop(doc_id, None)
+            self._dirty.add(collection)
+
+    def close(self):
+        if not self.output_dir:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        for collection in sorted(self._dirty):
+            write_snapshot_file(os.path.join(self.output_dir, f"{collection}.ndjson"),
+                                self.collections[collection])
+        self._dirty.clear()
+
+
+def find_snapshot_file(snapshot_dir, collection):
+    """Return the export file for a collection, or None if there is none."""
+    for ext in SNAPSHOT_EXTENSIONS:
+        path = os.path.join(snapshot_dir, collection + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def load_snapshot_file(path):
+    """Load an export file into a ``{doc_id: serialized_json}`` mapping."""
+    docs = {}
+
+    def add(doc_id, doc):
+        doc = dict(doc)
+        doc_id = doc.pop("id", doc_id)
+        if doc_id is None:
+            raise ValueError(f"Document without an 'id' in {path}")
+        docs[str(doc_id)] = json.dumps(doc)
+
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            content = json.load(f)
+            if isinstance(content, dict):
+                for doc_id, doc in content.items():
+                    add(doc_id, doc)
+            else:
+                for doc in content:
+                    add(None, doc)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    add(None, json.loads(line))
+
+    return docs
+
+
+def write_snapshot_file(path, docs):
+    """Write a ``{doc_id: serialized_json}`` mapping as NDJSON, atomically."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for doc_id, raw in docs.items():
+            doc = json.loads(raw)
+            doc["id"] = doc_id
+            f.write(json.dumps(doc) + "\n")
+    os.replace(tmp_path, path)
@@ -0,0 +1,266 @@
+"""Benchmarks for merger.py.
+
+Run with ``python merger_bench.py``. Each benchmark prints a small table of
+timings; nothing here touches Firestore.
+
+The pipeline benchmark generates a synthetic campus (hostels with floors and
+rooms, some of them duplicated under the same name, and their room
+allocations), saves it as a snapshot and times a full ``merge`` run, merging
+and validation included, against a ``SnapshotBackend`` at several scales.
+``--save-campus DIR`` writes a generated campus for use with
+``merger.py --snapshot DIR``.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import merger
+from merger import get_occupant_set, merge_room_occupants
+from merger_backends import SnapshotBackend
+from merger_model import Room
+from merger_report import QUIET, reporter
+
+GENDERS = ('Male', 'Female', 'Mixed')
+
+
+def _list_merge(primary_room, room_occupants):
+    """Occupant merge as it was done before sets: list membership per student."""
+    primary_occupants = primary_room.occupants
+    capacity = primary_room.capacity or 0
+
+    if len(primary_occupants) + len(room_occupants) > capacity:
+        return None
+
+    for student in room_occupants:
+        if student not in primary_occupants:
+            primary_occupants.append(student)
+    return primary_occupants
+
+
+def _dormitory_rooms(capacity, sources):
+    """Build a primary room and `sources` secondary rooms that fill it exactly."""
+    per_source = capacity // (sources + 1)
+    primary = Room.from_dict({'number': '001', 'capacity': capacity,
+                              'occupants': [f"P{i:06d}" for i in range(per_source)]})
+    secondary = [[f"S{s:03d}{i:06d}" for i in range(per_source)] for s in range(sources)]
+    return primary, secondary
+
+
+def _time(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_occupant_membership(capacities, sources=4, repeat=5):
+    """Compare list- and set-based occupant merging for large dormitory rooms."""
+    print(f"\n🛏️  Occupant membership: {sources} duplicate rooms merged into one primary room")
+    print("┌────────────┬───────────────┬───────────────┬──────────┐")
+    print("│ Capacity   │ List (ms)     │ Set (ms)      │ Speedup  │")
+    print("├────────────┼───────────────┼───────────────┼──────────┤")
+
+    results = []
+    for capacity in capacities:
+        def run_list():
+            primary, secondary = _dormitory_rooms(capacity, sources)
+            for occupants in secondary:
+                _list_merge(primary, occupants)
+
+        def run_set():
+            primary, secondary = _dormitory_rooms(capacity, sources)
+            occupant_sets = {}
+            for occupants in secondary:
+                merge_room_occupants(primary, occupants, get_occupant_set(occupant_sets, primary))
+
+        # Both timings include building the rooms, so small capacities are noise-dominated
+        list_time = _time(run_list, repeat)
+        set_time = _time(run_set, repeat)
+        speedup = list_time / set_time if set_time else float('inf')
+        results.append({'capacity': capacity, 'list_s': list_time, 'set_s': set_time})
+        print(f"│ {capacity:10} │ {list_time * 1000:13.3f} │ {set_time * 1000:13.3f} │ {speedup:7.1f}x │")
+
+    print("└────────────┴───────────────┴───────────────┴──────────┘")
+    return results
+
+
+def generate_campus(students, floors=3, rooms_per_floor=20, capacities=(1, 2, 4), duplicate_ratio=0.25,
+                    copies=2, occupancy=0.6, stale_ratio=0.02, seed=0):
+    """Generate hostel and roomAllocations documents for a synthetic campus.
+
+    Hostels are added until at least ``students`` students are allocated. A
+    ``duplicate_ratio`` share of hostel names is used by ``copies`` hostels
+    with the same room layout, whose rooms are filled so that the copies
+    together reach ``occupancy`` on average; some rooms overflow when merged.
+    Every student gets an allocation, and a ``stale_ratio`` share of them
+    point at the wrong hostel for validation to fix.
+
+    Returns:
+        tuple: (hostel documents, allocation documents), each carrying 'id'
+    """
+    rng = random.Random(seed)
+    hostels = []
+    allocations = []
+    while len(allocations) < students:
+        name = f"Hostel {len(hostels) + 1:05d}"
+        group_size = copies if rng.random() < duplicate_ratio else 1
+        gender = rng.choice(GENDERS)
+        layout = [[(f"{f}{r + 1:02d}", rng.choice(capacities),
+                    rng.choice(GENDERS[:2]) if gender == 'Mixed' else gender)
+                   for r in range(rooms_per_floor)] for f in range(floors)]
+        group_ids = [f"hostel{len(hostels) + copy:06d}" for copy in range(group_size)]
+
+        for hostel_id in group_ids:
+            hostel_floors = []
+            occupied = 0
+            for f, floor_rooms in enumerate(layout):
+                rooms = []
+                for number, capacity, room_gender in floor_rooms:
+                    room_id = f"{hostel_id}-{number}"
+                    occupants = []
+                    for _ in range(capacity):
+                        if rng.random() < occupancy / group_size:
+                            student = f"R{len(allocations) + 1:07d}"
+                            occupants.append(student)
+                            stale = rng.random() < stale_ratio and len(hostels) > 0
+                            allocations.append({
+                                'id': f"alloc{len(allocations) + 1:07d}",
+                                'studentRegNumber': student,
+                                'roomId': room_id,
+                                'hostelId': rng.choice(hostels)['id'] if stale else hostel_id,
+                                'allocatedAt': '2026-01-15T09:00:00Z',
+                                'paymentStatus': rng.choice(('Pending', 'Paid')),
+                                'paymentDeadline': '2026-02-15T09:00:00Z',
+                                'semester': '1',
+                                'academicYear': '2026',
+                            })
+                    occupied += len(occupants)
+                    rooms.append({
+                        'id': room_id, 'number': number, 'floor': str(f), 'floorName': f"Floor {f}",
+                        'hostelName': name, 'price': 300, 'capacity': capacity, 'occupants': occupants,
+                        'gender': room_gender, 'isReserved': False, 'isAvailable': len(occupants) < capacity,
+                    })
+                hostel_floors.append({'id': f"{hostel_id}-f{f}", 'number': str(f), 'name': f"Floor {f}",
+                                      'rooms': rooms})
+            hostels.append({
+                'id': hostel_id, 'name': name, 'description': "Synthetic benchmark hostel",
+                'totalCapacity': sum(capacity for floor_rooms in layout for _, capacity, _ in floor_rooms),
+                'currentOccupancy': occupied, 'gender': gender, 'floors': hostel_floors,
+                'isActive': True, 'pricePerSemester': 300, 'features': [],
+            })
+    return hostels, allocations
+
+
+def save_campus(directory, hostels, allocations):
+    """Write a generated campus as a snapshot directory of NDJSON files."""
+    os.makedirs(directory, exist_ok=True)
+    for collection, docs in (('hostels', hostels), ('roomAllocations', allocations)):
+        with open(os.path.join(directory, f"{collection}.ndjson"), "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(doc) + "\n" for doc in docs)
+
+
+def run_merge(snapshot_dir, merge_args=(), trace_memory=False):
+    """Run a full `merger.py merge` against a snapshot, with its output suppressed.
+
+    The snapshot is loaded before timing starts, so its load time and its
+    copy of the collections (which stand in for the database) are not
+    counted.
+
+    Returns:
+        tuple: (seconds, peak traced bytes or None)
+    """
+    fix_log = os.path.join(snapshot_dir, "allocation-fixes.jsonl")
+    args = merger.parse_args(['merge', '--snapshot', snapshot_dir, '--yes', '--quiet', '--fix-log', fix_log,
+                              *merge_args])
+    backend = SnapshotBackend(snapshot_dir)
+    reporter.level = QUIET
+    peak = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            merger.merge_command(backend, args, None)
+        finally:
+            seconds = time.perf_counter() - start
+            if trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+    return seconds, peak
+
+
+def bench_merge_pipeline(scales, merge_args=(), repeat=1, seed=0):
+    """Time full merge runs on synthetic campuses and measure their peak memory.
+
+    Each scale is timed ``repeat`` times (best is kept), then run once more
+    under tracemalloc for the peak, since tracing slows the run down.
+    """
+    print("\n🏫 Merge pipeline on synthetic campuses (SnapshotBackend)")
+    print("┌────────────┬──────────┬────────────┬────────────┬──────────────┬────────────┐")
+    print("│ Students   │ Hostels  │ Duplicates │ Time (s)   │ Students/s   │ Peak (MiB) │")
+    print("├────────────┼──────────┼────────────┼────────────┼──────────────┼────────────┤")
+
+    results = []
+    for students in scales:
+        hostels, allocations = generate_campus(students, seed=seed)
+        names = {}
+        for hostel in hostels:
+            names[hostel['name']] = names.get(hostel['name'], 0) + 1
+        duplicates = sum(count for count in names.values() if count > 1)
+        with tempfile.TemporaryDirectory(prefix="merger-bench-") as snapshot_dir:
+            save_campus(snapshot_dir, hostels, allocations)
+            seconds = min(run_merge(snapshot_dir, merge_args)[0] for _ in range(repeat))
+            _, peak = run_merge(snapshot_dir, merge_args, trace_memory=True)
+
+        throughput = len(allocations) / seconds if seconds else float('inf')
+        results.append({'students': len(allocations), 'hostels': len(hostels), 'duplicates': duplicates,
+                         'seconds': seconds, 'students_per_s': throughput, 'peak_bytes': peak})
+        print(f"│ {len(allocations):10} │ {len(hostels):8} │ {duplicates:10} │ {seconds:10.2f} │ "
+              f"{throughput:12.0f} │ {peak / 2**20:10.1f} │")
+
+    print("└────────────┴──────────┴────────────┴────────────┴──────────────┴────────────┘")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark merger.py hot paths.")
+    parser.add_argument("--only", choices=("occupants", "pipeline"),
+                        help="run only this benchmark (default: all)")
+    parser.add_argument("--capacities", type=int, nargs="+", default=[4, 50, 500, 5000],
+                        help="room capacities to benchmark occupant merging at")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (best is kept)")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="students on the synthetic campuses of the pipeline benchmark")
+    parser.add_argument("--pipeline-repeat", type=int, default=1,
+                        help="timed runs per pipeline scale (best is kept)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the campus generator")
+    parser.add_argument("--merge-args", default="",
+                        help="extra merger.py merge options for the pipeline, e.g. \"--workers 4\"")
+    parser.add_argument("--save-campus", metavar="DIR",
+                        help="write a campus with the first --scales size to DIR as a snapshot, then exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.save_campus:
+        hostels, allocations = generate_campus(args.scales[0], seed=args.seed)
+        save_campus(args.save_campus, hostels, allocations)
+        print(f"📂 Wrote {len(hostels)} hostels and {len(allocations)} allocations to {args.save_campus}")
+        return
+    if args.only != "pipeline":
+        bench_occupant_membership(args.capacities, repeat=args.repeat)
+    if args.only != "occupants":
+        bench_merge_pipeline(args.scales, args.merge_args.split(), repeat=args.pipeline_repeat, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
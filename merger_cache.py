@@ -0,0 +1,186 @@
+"""On-disk cache of the merger's collections, kept up to date by delta sync.
+
+``SnapshotCache`` keeps every document of ``hostels`` and ``roomAllocations``
+in a SQLite file together with its version (its update time on Firestore).
+Firestore cannot query documents by update time, so a sync first lists the
+collection projected to the document ID alone, which returns only document
+names and update times. It then fetches just the documents whose version changed and
+drops the ones that no longer exist. The listing is still billed per
+document, but it transfers a small fraction of the bytes, and unchanged
+hostels (the bulk of a run's reads) are not downloaded again.
+
+``CachedBackend`` serves a run's reads from the synced cache and sends its
+writes to the source backend. Committed writes are also applied to the
+in-memory copy, so later reads in the same run see them. The cache file
+itself is not updated; the changed versions make the next sync refetch
+those documents.
+"""
+import json
+import sqlite3
+import time
+
+from merger_backends import SNAPSHOT_COLLECTIONS, DatastoreBackend, SnapshotBackend, WriteBatch
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    version TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, doc_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS syncs (
+    collection TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+# Changed documents fetched and stored per round trip during a sync
+SYNC_FETCH_BATCH = 500
+
+
+class SnapshotCache:
+    """SQLite file holding a versioned copy of each collection."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def versions(self, collection):
+        """Return ``{doc_id: version}`` of the cached documents."""
+        return dict(self.conn.execute(
+            "SELECT doc_id, version FROM documents WHERE collection = ?", (collection,)))
+
+    def last_sync(self, collection):
+        """Return ``(source, synced_at)`` of the last sync, or None."""
+        return self.conn.execute(
+            "SELECT source, synced_at FROM syncs WHERE collection = ?", (collection,)).fetchone()
+
+    def clear(self, collection):
+        with self.conn:
+            self.conn.execute("DELETE FROM documents WHERE collection = ?", (collection,))
+            self.conn.execute("DELETE FROM syncs WHERE collection = ?", (collection,))
+
+    def sync(self, backend, collection, page_size=None):
+        """Bring a collection up to date with ``backend``.
+
+        A cache filled from a different source is emptied first.
+
+        Returns:
+            dict: counts of 'listed', 'fetched', 'deleted' and 'unchanged'
+                documents, and the 'seconds' taken
+        """
+        start = time.perf_counter()
+        previous = self.last_sync(collection)
+        if previous is not None and previous[0] != backend.source:
+            self.clear(collection)
+        cached = self.versions(collection)
+
+        listed = dict(backend.versions(collection, page_size=page_size))
+        changed = [doc_id for doc_id, version in listed.items() if cached.get(doc_id) != version]
+        deleted = [doc_id for doc_id in cached if doc_id not in listed]
+
+        # Versions come from the listing; a document that changes again before
+        # it is fetched keeps the older version and is refetched next time
+        fetched = 0
+        for offset in range(0, len(changed), SYNC_FETCH_BATCH):
+            rows = [(collection, doc_id, listed[doc_id], json.dumps(data))
+                    for doc_id, data in backend.get_many(collection, changed[offset:offset + SYNC_FETCH_BATCH])]
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)", rows)
+            fetched += len(rows)
+
+        with self.conn:
+            self.conn.executemany("DELETE FROM documents WHERE collection = ? AND doc_id = ?",
+                                  [(collection, doc_id) for doc_id in deleted])
+            self.conn.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)",
+                              (collection, backend.source or "", time.time()))
+        return {'listed': len(listed), 'fetched': fetched, 'deleted': len(deleted),
+                'unchanged': len(listed) - len(changed), 'seconds': time.perf_counter() - start}
+
+    def load(self, collection):
+        """Return ``{doc_id: serialized_json}`` for a collection."""
+        return dict(self.conn.execute(
+            "SELECT doc_id, data FROM documents WHERE collection = ?", (collection,)))
+
+    def close(self):
+        self.conn.close()
+
+
+class CachedWriteBatch(WriteBatch):
+    """Write batch committed to a ``CachedBackend``'s source, then to its local copy."""
+
+    def __init__(self, backend):
+        super().__init__()
+        self._backend = backend
+
+    def commit(self):
+        batch = self._backend.source_backend.batch()
+        for op, collection, doc_id, data in self.operations:
+            if op == "update":
+                batch.update(collection, doc_id, data)
+            else:
+                batch.delete(collection, doc_id)
+        result = batch.commit()
+        self._backend.apply_committed(self.operations)
+        return result
+
+
+class CachedBackend(DatastoreBackend):
+    """Backend reading from a synced ``SnapshotCache`` and writing to its source.
+
+    Reads are local and not reported to the ``observer``; the commits
+    ``BatchWriter`` reports are, and the source's own observer sees the
+    sync.
+    """
+
+    def __init__(self, source_backend, cache):
+        self.source_backend = source_backend
+        self.name = f"{source_backend.name}-cached"
+        self.remote = source_backend.remote
+        self.source = source_backend.source
+        self.local = SnapshotBackend(None)
+        for collection in SNAPSHOT_COLLECTIONS:
+            self.local.collections[collection] = cache.load(collection)
+
+    def stream(self, collection, fields=None, page_size=None):
+        return self.local.stream(collection, fields, page_size)
+
+    def partition(self, collection, count):
+        return self.local.partition(collection, count)
+
+    def stream_partition(self, collection, partition, fields=None):
+        return self.local.stream_partition(collection, partition, fields)
+
+    def versions(self, collection, page_size=None):
+        return self.source_backend.versions(collection, page_size)
+
+    def watch(self, collections, callback, interval=1.0):
+        return self.source_backend.watch(collections, callback, interval)
+
+    def get_many(self, collection, doc_ids, fields=None):
+        return self.local.get_many(collection, doc_ids, fields)
+
+    def query(self, collection, field, value, fields=None):
+        return self.local.query(collection, field, value, fields)
+
+    def query_many(self, collection, field, values, fields=None):
+        return self.local.query_many(collection, field, values, fields)
+
+    def batch(self):
+        return CachedWriteBatch(self)
+
+    def apply_committed(self, operations):
+        """Apply writes the source accepted to the local copy.
+
+        Updates of documents created after the sync are left out; the next
+        sync picks them up.
+        """
+        docs = self.local.collections
+        self.local.apply([operation for operation in operations
+                          if operation[0] == "delete" or operation[2] in docs.get(operation[1], {})])
+
+    def close(self):
+        self.source_backend.close()
@@ -0,0 +1,126 @@
+"""Disk-backed student location index for large validations in merger.py.
+
+A full validation needs to know, for every allocation, whether its hostel
+still exists and which room the student actually occupies. Kept in memory,
+that index grows with the whole campus. ``DiskLocationIndex`` keeps it in a
+scratch SQLite file instead. Hostels are added one at a time as they stream
+in, and allocations are resolved a chunk at a time with one join per chunk,
+so memory stays bounded by the chunk size. ``allocation_status`` holds the
+rule every validation applies to an allocation and its student's room.
+"""
+import os
+import sqlite3
+import tempfile
+
+SCHEMA = """
+CREATE TABLE hostels (hostel_id TEXT PRIMARY KEY) WITHOUT ROWID;
+CREATE TABLE locations (
+    student TEXT PRIMARY KEY,
+    hostel_id TEXT NOT NULL,
+    hostel_name TEXT NOT NULL,
+    -- No declared type, so integer room IDs and numbers come back as integers
+    room_id NOT NULL,
+    room_number NOT NULL
+) WITHOUT ROWID;
+CREATE TEMP TABLE chunk (n INTEGER PRIMARY KEY, student TEXT, hostel_id TEXT);
+"""
+
+LOCATION_FIELDS = ('hostel_id', 'hostel_name', 'room_id', 'room_number')
+
+
+def allocation_status(hostel_id, hostel_exists, actual_location):
+    """Classify an allocation against the room its student actually occupies.
+
+    Args:
+        hostel_id: The allocation's hostel ID
+        hostel_exists: Whether that hostel currently exists
+        actual_location: Dict with LOCATION_FIELDS for the room listing the
+            student, or None if no room does
+
+    Returns:
+        None if the allocation is valid, 'needs_fix' if the student is in
+        another hostel, 'found_match' if the allocation's hostel is gone but
+        the student is in a room, or 'no_match' if the hostel is gone and no
+        room lists the student
+    """
+    if hostel_exists:
+        if actual_location and actual_location['hostel_id'] != hostel_id:
+            return 'needs_fix'
+        return None
+    return 'found_match' if actual_location else 'no_match'
+
+
+class DiskLocationIndex:
+    """Hostel IDs and student -> room locations in a scratch SQLite file.
+
+    The file is created in the system temporary directory unless ``path``
+    is given, and removed on ``close``.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="merger-index-", suffix=".sqlite")
+            os.close(fd)
+        elif os.path.exists(path):
+            os.remove(path)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # Scratch data: a crash loses nothing worth keeping
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.executescript(SCHEMA)
+
+    def add_hostel(self, hostel, name):
+        """Index a hostel and every student in its rooms.
+
+        A student found in several rooms keeps the last one, as with the
+        in-memory map.
+        """
+        self.conn.execute("INSERT OR REPLACE INTO hostels VALUES (?)", (hostel.id,))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO locations VALUES (?, ?, ?, ?, ?)",
+            [(student, hostel.id, name,
+              room.id if room.id is not None else '', room.number if room.number is not None else '')
+             for _, room in hostel.rooms() for student in room.occupants])
+
+    def commit(self):
+        self.conn.commit()
+
+    @property
+    def hostel_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM hostels").fetchone()[0]
+
+    @property
+    def student_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0]
+
+    def resolve(self, chunk):
+        """Look up a chunk of allocations.
+
+        Args:
+            chunk: list of (allocation ID, allocation data)
+
+        Returns:
+            list: (allocation ID, allocation data, whether its hostel exists,
+                location dict with LOCATION_FIELDS or None), in chunk order
+        """
+        self.conn.execute("DELETE FROM chunk")
+        self.conn.executemany("INSERT INTO chunk VALUES (?, ?, ?)",
+                              [(n, str(data.get('studentRegNumber', 'N/A')), str(data.get('hostelId', '')))
+                               for n, (_, data) in enumerate(chunk)])
+        rows = self.conn.execute(
+            "SELECT h.hostel_id IS NOT NULL, l.hostel_id, l.hostel_name, l.room_id, l.room_number "
+            "FROM chunk c "
+            "LEFT JOIN hostels h ON h.hostel_id = c.hostel_id "
+            "LEFT JOIN locations l ON l.student = c.student "
+            "ORDER BY c.n")
+        resolved = []
+        for (alloc_id, data), (hostel_exists, *location) in zip(chunk, rows):
+            resolved.append((alloc_id, data, bool(hostel_exists),
+                             dict(zip(LOCATION_FIELDS, location)) if location[0] is not None else None))
+        return resolved
+
+    def close(self):
+        self.conn.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
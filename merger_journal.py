@@ -0,0 +1,120 @@
+"""Checkpoint journal for resumable merger.py runs.
+
+While a plan is being written, the journal records every committed write
+chunk (by ``operations_digest``) and every applied allocation fix (by
+allocation ID) as one JSON line, flushed to disk before the next chunk is
+reported. If the run stops part way, a rerun with the same journal and plan
+skips what was already written instead of starting over.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from merger_backends import operations_digest
+
+
+def file_digest(path):
+    """Return the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CheckpointJournal:
+    """Append-only JSON lines record of the progress of one plan.
+
+    Records are ``start`` (plan path and digest), ``chunk`` (a committed
+    write chunk), ``fixes`` (allocation fixes applied by a committed chunk)
+    and ``finish``. Recording methods may be called from commit worker
+    threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.plan_path = None
+        self.plan_digest = None
+        self.finished = False
+        self.chunks = set()
+        self.fixes = set()
+        self._lock = threading.Lock()
+        self._file = None
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if line_number == len(lines):
+                    break  # Cut off by a crash mid-write; that chunk was not confirmed
+                raise ValueError(f"{self.path}:{line_number}: corrupt journal record")
+            kind = record.get("type")
+            if kind == "start":
+                self.plan_path = record["plan"]
+                self.plan_digest = record["plan_digest"]
+            elif kind == "chunk":
+                self.chunks.add(record["digest"])
+            elif kind == "fixes":
+                self.fixes.update(record["doc_ids"])
+            elif kind == "finish":
+                self.finished = True
+
+    @property
+    def started(self):
+        return self.plan_digest is not None
+
+    def _append(self, record):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def start(self, plan_path, plan_digest):
+        """Begin journaling a new plan, discarding any earlier records.
+
+        The plan path is stored absolute, so a run can be resumed from
+        another working directory.
+        """
+        plan_path = os.path.abspath(plan_path)
+        self.close()
+        with open(self.path, "w", encoding="utf-8"):
+            pass
+        self.plan_path = plan_path
+        self.plan_digest = plan_digest
+        self.finished = False
+        self.chunks = set()
+        self.fixes = set()
+        self._append({"type": "start", "plan": plan_path, "plan_digest": plan_digest})
+
+    def record_chunk(self, batch):
+        """Record a committed write chunk (a BatchWriter ``on_commit`` callback)."""
+        digest = operations_digest(batch.operations)
+        self._append({"type": "chunk", "digest": digest, "operations": len(batch)})
+        self.chunks.add(digest)
+
+    def record_fixes(self, batch):
+        """Record the allocation fixes in a committed chunk (a BatchWriter ``on_commit`` callback)."""
+        doc_ids = [doc_id for _, _, doc_id, _ in batch.operations]
+        self._append({"type": "fixes", "doc_ids": doc_ids})
+        self.fixes.update(doc_ids)
+
+    def finish(self):
+        """Record that the whole plan has been written."""
+        self._append({"type": "finish"})
+        self.finished = True
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,233 @@
+"""Duplicate hostel detection for merger.py.
+
+Names are compared by a normalized key (case, accents, punctuation and
+spacing removed), so "Block A", "block a " and "Block-A" fall together.
+Fuzzy matching goes further and pairs keys whose ``difflib`` similarity
+ratio reaches a threshold. Sibling hostels often differ in a single number
+or word ("Hostel 2" and "Hostel 3", "Chitepo Male" and "Chitepo Female"),
+which scores well above any useful threshold, so keys are only compared
+when their numbers and distinguishing words (see ``name_signature``) are
+the same. Comparing every pair of keys would be quadratic, so candidates
+are found through a trigram index with prefix filtering: each key indexes
+only its rarest trigrams, enough that any two keys whose trigram sets
+overlap by at least ``blocking`` (Jaccard) share one of them. Only those
+candidate pairs are scored. Groups are complete-link: a key joins a group
+only if it matches every key already in it, so a chain of near misses
+(A like B, B like C, A unlike C) is not merged into one group.
+"""
+import difflib
+import math
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+
+DEFAULT_FUZZY_THRESHOLD = 0.9
+
+# Minimum trigram Jaccard overlap for a pair of keys to be scored at all
+BLOCKING_JACCARD = 0.5
+
+# Minimum overlap of room numbers for two hostels to count as the same layout
+DEFAULT_LAYOUT_THRESHOLD = 0.8
+
+# Words that tell sibling hostels apart; names differing in them never match fuzzily
+DISTINGUISHING_WORDS = frozenset({
+    'male', 'female', 'mixed', 'men', 'women', 'boys', 'girls', 'ladies', 'gents',
+    'annex', 'annexe', 'extension', 'new', 'old', 'north', 'south', 'east', 'west', 'upper', 'lower',
+})
+
+_SEPARATORS = re.compile(r"[\W_]+")
+_DIGITS = re.compile(r"\d+")
+# Words followed by a block or wing number, which may be a letter ("Block A")
+# or a Roman numeral ("Wing IV") instead of digits
+UNIT_WORDS = frozenset({'block', 'wing', 'phase', 'house', 'tower', 'court', 'unit', 'section'})
+_UNIT_NUMBER = re.compile(r"[a-z]|(?=[ivx]+$)x{0,3}(ix|iv|v?i{0,3})")
+
+
+def normalize_name(name):
+    """Return the comparison key of a hostel name."""
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_SEPARATORS.sub(" ", text.casefold()).split())
+
+
+def name_signature(key):
+    """Return the numbers and distinguishing words of a key.
+
+    Two keys can only be fuzzy matches if their signatures are equal: the
+    same numbers in the same order (leading zeros ignored) and the same
+    gender, location and block or wing words.
+    """
+    numbers = tuple(str(int(run)) for run in _DIGITS.findall(key))
+    tokens = key.split()
+    words = {word for word in tokens if word in DISTINGUISHING_WORDS}
+    words.update(f"{unit} {word}" for unit, word in zip(tokens, tokens[1:])
+                 if unit in UNIT_WORDS and _UNIT_NUMBER.fullmatch(word))
+    return numbers, frozenset(words)
+
+
+def trigrams(key):
+    """Return the set of character trigrams of a key, ignoring spaces."""
+    padded = f"  {key.replace(' ', '')} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class UnionFind:
+    """Disjoint sets over hashable items."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        while parent != item:
+            grandparent = self.parent[parent]
+            self.parent[item] = grandparent
+            item, parent = parent, grandparent
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+    def groups(self):
+        """Return the sets as lists, in order of each set's first item."""
+        groups = defaultdict(list)
+        for item in list(self.parent):
+            groups[self.find(item)].append(item)
+        return list(groups.values())
+
+
+def find_similar_keys(keys, threshold=DEFAULT_FUZZY_THRESHOLD, blocking=BLOCKING_JACCARD):
+    """Find pairs of keys with the same signature and a similarity ratio of at least ``threshold``.
+
+    Returns:
+        tuple: (list of (i, j) index pairs, stats dict with 'candidate_pairs'
+            found by the trigram index and 'compared' pairs actually scored)
+    """
+    grams = [trigrams(key) for key in keys]
+    signatures = [name_signature(key) for key in keys]
+    lengths = [len(key) for key in keys]
+    frequency = Counter(gram for key_grams in grams for gram in key_grams)
+    index = defaultdict(list)
+    pairs = []
+    stats = {'candidate_pairs': 0, 'compared': 0}
+    # ratio = 2 * matches / (len(a) + len(b)), so lengths this far apart can never match
+    length_bound = threshold / (2 - threshold)
+
+    for i, key_grams in enumerate(grams):
+        # Rarest trigrams first; the prefix is all a matching key must share
+        ordered = sorted(key_grams, key=lambda gram: (frequency[gram], gram))
+        prefix = ordered[:len(ordered) - math.ceil(blocking * len(ordered)) + 1]
+        candidates = set()
+        for gram in prefix:
+            # Indexed per signature, so keys with different numbers or words are never candidates
+            entry = index[signatures[i], gram]
+            candidates.update(entry)
+            entry.append(i)
+
+        stats['candidate_pairs'] += len(candidates)
+        key = keys[i]
+        shortest, longest = lengths[i] * length_bound, lengths[i] / length_bound
+        matcher = difflib.SequenceMatcher(None, b=key)  # caches its analysis of the key
+        for j in candidates:
+            if not shortest <= lengths[j] <= longest:
+                continue
+            shared = len(grams[j] & key_grams)
+            if shared < blocking * (len(grams[j]) + len(key_grams) - shared):
+                continue
+            stats['compared'] += 1
+            matcher.set_seq1(keys[j])
+            if matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold:
+                pairs.append((j, i))
+    return pairs, stats
+
+
+def complete_link_groups(count, pairs):
+    """Group indexes ``0..count-1`` so that every two members of a group are a pair.
+
+    Indexes are placed in order: each joins the earliest group all of whose
+    members it is paired with, or starts a new one.
+
+    Returns:
+        list: index lists, in order of each group's first index
+    """
+    matches = defaultdict(set)
+    for i, j in pairs:
+        matches[i].add(j)
+        matches[j].add(i)
+    groups = []
+    group_of = {}
+    for i in range(count):
+        for g in sorted({group_of[j] for j in matches[i] if j in group_of}):
+            if matches[i].issuperset(groups[g]):
+                break
+        else:
+            g = len(groups)
+            groups.append([])
+        groups[g].append(i)
+        group_of[i] = g
+    return groups
+
+
+def group_names(names, fuzzy=False, threshold=DEFAULT_FUZZY_THRESHOLD):
+    """Group IDs whose names match after normalization, or fuzzily if ``fuzzy``.
+
+    Args:
+        names: Ordered mapping of ID -> name
+        fuzzy: Also join keys with the same signature whose similarity ratio
+            reaches ``threshold`` with every key already in the group
+        threshold: Minimum ``difflib`` ratio for a fuzzy match
+
+    Returns:
+        tuple: (list of ID lists with more than one member, in input order,
+            stats dict with 'names', 'keys', 'candidate_pairs', 'compared',
+            'fuzzy_matches' and 'seconds')
+    """
+    start = time.perf_counter()
+    by_key = defaultdict(list)
+    for item_id, name in names.items():
+        by_key[normalize_name(name)].append(item_id)
+    keys = list(by_key)
+
+    stats = {'names': len(names), 'keys': len(keys), 'candidate_pairs': 0, 'compared': 0, 'fuzzy_matches': 0}
+    pairs = []
+    if fuzzy:
+        pairs, pair_stats = find_similar_keys(keys, threshold)
+        stats.update(pair_stats, fuzzy_matches=len(pairs))
+
+    position = {item_id: n for n, item_id in enumerate(names)}
+    groups = []
+    for key_indexes in complete_link_groups(len(keys), pairs):
+        ids = sorted((item_id for i in key_indexes for item_id in by_key[keys[i]]), key=position.get)
+        if len(ids) > 1:
+            groups.append(ids)
+    groups.sort(key=lambda ids: position[ids[0]])
+    stats['seconds'] = time.perf_counter() - start
+    return groups, stats
+
+
+def room_numbers(hostel):
+    """Return the set of room numbers of a hostel, its layout signature."""
+    return {room.number for _, room in hostel.rooms() if room.number is not None}
+
+
+def split_by_layout(ids, hostels, threshold=DEFAULT_LAYOUT_THRESHOLD):
+    """Split a group of hostels into subgroups that share a room layout.
+
+    Two hostels share a layout if the Jaccard overlap of their room numbers
+    is at least ``threshold``; subgroups are the connected components.
+
+    Returns:
+        list: ID lists with more than one member
+    """
+    layouts = {hostel_id: room_numbers(hostels[hostel_id]) for hostel_id in ids}
+    sets = UnionFind()
+    for n, a in enumerate(ids):
+        sets.find(a)
+        for b in ids[:n]:
+            union = layouts[a] | layouts[b]
+            if not union or len(layouts[a] & layouts[b]) >= threshold * len(union):
+                sets.union(b, a)
+    return [group for group in sets.groups() if len(group) > 1]
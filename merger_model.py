@@ -0,0 +1,186 @@
+"""Compact in-memory model of hostels for merger.py.
+
+Firestore hands the merger nested dicts (hostel -> floors -> rooms ->
+occupants), which costs a full dict with a dozen keys for every room on
+campus. Here hostels, floors and rooms are ``__slots__`` objects holding the
+fields the merger works with as attributes. Every other Firestore field is
+kept as a tuple of values whose key tuple is shared by all objects with the
+same layout. Strings in those fields and registration numbers are interned, so
+a value repeated across rooms (gender, floor name, a student listed twice) is
+stored once. Conversion to and from Firestore dicts happens only when
+documents are read or written.
+"""
+import sys
+from array import array
+
+# Shared key tuples, one per distinct layout of "other" fields
+_layouts = {}
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _split_fields(data, core_keys):
+    """Split a document into its shared key layout and a tuple of values."""
+    keys = tuple(k for k in data if k not in core_keys)
+    keys = _layouts.setdefault(keys, keys)
+    return keys, tuple(_intern(data[k]) for k in keys)
+
+
+class _Record:
+    """Base for model objects that keep their other fields as a shared layout."""
+
+    __slots__ = ()
+
+    def get(self, key, default=None):
+        """Read one of the other (non-attribute) Firestore fields by name."""
+        if key in self.extra_keys:
+            return self.extra_values[self.extra_keys.index(key)]
+        return default
+
+
+class Room(_Record):
+    """A room: number, capacity and occupants, plus its other fields.
+
+    ``dirty`` is set when the merger changes the room and cleared once the
+    change has been queued for writing.
+    """
+
+    __slots__ = ('id', 'number', 'capacity', 'occupants', 'is_available', 'dirty', 'extra_keys', 'extra_values')
+
+    CORE_FIELDS = ('id', 'number', 'capacity', 'occupants', 'isAvailable')
+
+    @classmethod
+    def from_dict(cls, data):
+        room = cls()
+        room.id = data.get('id')
+        room.number = data.get('number')
+        room.capacity = data.get('capacity')
+        room.occupants = [_intern(s) for s in data.get('occupants', [])]
+        room.is_available = data.get('isAvailable')
+        room.dirty = False
+        room.extra_keys, room.extra_values = _split_fields(data, cls.CORE_FIELDS)
+        return room
+
+    def to_dict(self):
+        data = dict(zip(self.extra_keys, self.extra_values))
+        for key, value in (('id', self.id), ('number', self.number), ('capacity', self.capacity)):
+            if value is not None:
+                data[key] = value
+        data['occupants'] = list(self.occupants)
+        if self.is_available is not None:
+            data['isAvailable'] = self.is_available
+        return data
+
+
+class Floor(_Record):
+    """A floor: its rooms plus its other fields (id, number, name, ...)."""
+
+    __slots__ = ('rooms', 'extra_keys', 'extra_values')
+
+    CORE_FIELDS = ('rooms',)
+
+    @classmethod
+    def from_dict(cls, data):
+        floor = cls()
+        floor.rooms = [Room.from_dict(room) for room in data.get('rooms', [])]
+        floor.extra_keys, floor.extra_values = _split_fields(data, cls.CORE_FIELDS)
+        return floor
+
+    def to_dict(self):
+        data = dict(zip(self.extra_keys, self.extra_values))
+        data['rooms'] = [room.to_dict() for room in self.rooms]
+        return data
+
+
+class Hostel(_Record):
+    """A hostel document with its floors and the merger's bookkeeping.
+
+    ``occupant_count`` and ``room_index`` are derived state kept for the
+    merger and are never written back to the database. ``dirty`` is set
+    when any of the hostel's rooms changes (see ``mark_changed``).
+    """
+
+    __slots__ = ('id', 'name', 'floors', 'occupant_count', 'room_index', 'dirty',
+                 'extra_keys', 'extra_values')
+
+    CORE_FIELDS = ('id', 'name', 'floors')
+
+    @classmethod
+    def from_dict(cls, hostel_id, data):
+        hostel = cls()
+        hostel.id = hostel_id
+        hostel.name = data.get('name')
+        hostel.floors = [Floor.from_dict(floor) for floor in data.get('floors', [])]
+        hostel.occupant_count = 0
+        hostel.room_index = None
+        hostel.dirty = False
+        hostel.extra_keys, hostel.extra_values = _split_fields(data, cls.CORE_FIELDS)
+        return hostel
+
+    def to_dict(self):
+        """Return the Firestore document for this hostel (without its ID)."""
+        data = dict(zip(self.extra_keys, self.extra_values))
+        if self.name is not None:
+            data['name'] = self.name
+        data['floors'] = [floor.to_dict() for floor in self.floors]
+        return data
+
+    def to_update(self):
+        """Return the field update that persists this hostel's room changes.
+
+        Rooms live inside the 'floors' array, and Firestore field paths cannot
+        address array elements, so the smallest update is the whole 'floors'
+        field; the hostel's other fields are left alone.
+        """
+        return {'floors': [floor.to_dict() for floor in self.floors]}
+
+    def rooms(self):
+        """Yield (floor, room) for every room, floor by floor."""
+        for floor in self.floors:
+            for room in floor.rooms:
+                yield floor, room
+
+    def mark_changed(self, room):
+        """Record that one of this hostel's rooms was modified."""
+        room.dirty = True
+        self.dirty = True
+
+    def changed_rooms(self):
+        """Return the rooms modified since the last ``clear_changes``."""
+        return [room for _, room in self.rooms() if room.dirty]
+
+    def clear_changes(self):
+        for _, room in self.rooms():
+            room.dirty = False
+        self.dirty = False
+
+
+def capacity_columns(hostels):
+    """Flatten hostels into parallel per-room columns for bulk capacity math.
+
+    Returns:
+        dict: 'hostel', 'floor' and 'room' (indexes into the hostel list,
+            its floors and the floor's rooms), 'capacity' and 'occupants' as
+            ``array`` columns, plus 'hostel_ids' mapping hostel indexes back
+            to IDs
+    """
+    columns = {
+        'hostel': array('i'),
+        'floor': array('i'),
+        'room': array('i'),
+        'capacity': array('i'),
+        'occupants': array('i'),
+        'hostel_ids': [],
+    }
+    for hostel_index, hostel in enumerate(hostels):
+        columns['hostel_ids'].append(hostel.id)
+        for floor_index, floor in enumerate(hostel.floors):
+            for room_index, room in enumerate(floor.rooms):
+                columns['hostel'].append(hostel_index)
+                columns['floor'].append(floor_index)
+                columns['room'].append(room_index)
+                columns['capacity'].append(int(room.capacity or 0))
+                columns['occupants'].append(len(room.occupants))
+    return columns
@@ -0,0 +1,105 @@
+"""Overflow placement for merger.py.
+
+When a secondary hostel's room cannot be merged into the primary's room with
+the same number (it is full, or there is no such room), its students are
+"overflow". ``plan_placements`` packs overflow into the primary's free beds
+instead of leaving the whole room behind. Source rooms are taken largest
+first (first-fit decreasing). For each one, the engine tries to keep the
+roommates together in the best-fitting single room, preferring the room with
+the same number, then the same floor, then any floor. If no single room has
+space, it fills the rooms with the most free beds first, so the group is
+split as little as possible. Reserved rooms are never used. A room only
+takes students from a room of the same gender, unless it is a Mixed room.
+
+Nothing is modified here; the caller applies the returned placements.
+"""
+
+MIXED_GENDER = 'Mixed'
+
+
+def floor_key(floor, index):
+    """Return the key matching a floor across duplicate hostels."""
+    for field in ('number', 'name', 'id'):
+        value = floor.get(field)
+        if value not in (None, ''):
+            return value
+    return index
+
+
+def can_host(target, source):
+    """Whether students from the source room may be placed in the target room."""
+    if target.get('isReserved'):
+        return False
+    target_gender, source_gender = target.get('gender'), source.get('gender')
+    if target_gender is None or source_gender is None:
+        return True
+    return target_gender == source_gender or target_gender == MIXED_GENDER
+
+
+def plan_placements(primary, overflow):
+    """Assign overflow students to free beds in the primary hostel.
+
+    Args:
+        primary: Primary Hostel
+        overflow: list of (floor key, source Room, students) tuples
+
+    Returns:
+        list: for each overflow entry, in input order, a tuple
+            (placements, already_present, unplaced) where placements is a
+            list of (target Room, students) and already_present lists
+            students who are already in the primary hostel
+    """
+    primary_students = set()
+    rooms = []  # (floor key, room)
+    for index, floor in enumerate(primary.floors):
+        key = floor_key(floor, index)
+        for room in floor.rooms:
+            primary_students.update(room.occupants)
+            rooms.append((key, room))
+    spare = {id(room): (room.capacity or 0) - len(room.occupants) for _, room in rooms}
+
+    results = [None] * len(overflow)
+    order = sorted(range(len(overflow)), key=lambda i: -len(overflow[i][2]))
+    for i in order:
+        source_floor, source_room, students = overflow[i]
+        already = [s for s in students if s in primary_students]
+        waiting = [s for s in dict.fromkeys(students) if s not in primary_students]
+
+        # Preference tiers: same room number, same floor, anywhere
+        tiers = ([], [], [])
+        for key, room in rooms:
+            if spare[id(room)] <= 0 or not can_host(room, source_room):
+                continue
+            if room.number == source_room.number:
+                tiers[0].append(room)
+            elif key == source_floor:
+                tiers[1].append(room)
+            else:
+                tiers[2].append(room)
+
+        placements = []
+        # Keep roommates together: best fit in the most preferred tier with space
+        for tier in tiers:
+            fits = [room for room in tier if spare[id(room)] >= len(waiting)]
+            if fits and waiting:
+                target = min(fits, key=lambda room: spare[id(room)])
+                placements.append((target, waiting))
+                spare[id(target)] -= len(waiting)
+                waiting = []
+                break
+
+        # Otherwise split across the roomiest rooms, tier by tier
+        for tier in tiers:
+            for target in sorted(tier, key=lambda room: -spare[id(room)]):
+                if not waiting:
+                    break
+                free = spare[id(target)]
+                if free <= 0:
+                    continue
+                placements.append((target, waiting[:free]))
+                spare[id(target)] -= len(waiting[:free])
+                waiting = waiting[free:]
+
+        primary_students.update(s for _, placed in placements for s in placed)
+        results[i] = (placements, already, waiting)
+    return results
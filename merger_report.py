@@ -0,0 +1,108 @@
+"""Console verbosity and machine-readable run reports for merger.py.
+
+By default merger.py prints aggregated summaries; the per-room and
+per-allocation tables are only printed at verbose level. Every row can also
+be recorded to a report file, JSON lines or CSV depending on its extension.
+Rows are buffered and written in batches. Recording is a no-op when no
+report file is open, so it costs nothing by default.
+"""
+import contextlib
+import csv
+import json
+
+QUIET, NORMAL, VERBOSE = 0, 1, 2
+
+# Columns of CSV reports; JSON lines reports carry the same keys
+REPORT_FIELDS = ('kind', 'hostel_id', 'target_hostel_id', 'room_number', 'target_room',
+                 'allocation_id', 'student', 'count', 'status', 'detail')
+
+# Rows buffered before they are written out
+REPORT_BATCH_ROWS = 1000
+
+
+class Reporter:
+    """Verbosity level plus an optional buffered report file."""
+
+    def __init__(self, level=NORMAL, batch_rows=REPORT_BATCH_ROWS):
+        self.level = level
+        self.batch_rows = batch_rows
+        self.path = None
+        self.rows = []
+        self.rows_written = 0
+        self._capturing = False
+
+    @property
+    def verbose(self):
+        return self.level >= VERBOSE
+
+    @property
+    def quiet(self):
+        return self.level <= QUIET
+
+    @property
+    def recording(self):
+        return self.path is not None or self._capturing
+
+    def detail(self, *args, **kwargs):
+        """Print per-group and per-hostel progress, unless quiet."""
+        if self.level > QUIET:
+            print(*args, **kwargs)
+
+    def open(self, path):
+        """Start a new report file, replacing any existing one."""
+        self.path = path
+        self.rows = []
+        self.rows_written = 0
+        with open(path, "w", encoding="utf-8", newline=""):
+            pass
+
+    def record(self, kind, **fields):
+        """Add a report row; see REPORT_FIELDS for the usual fields."""
+        if not self.recording:
+            return
+        fields['kind'] = kind
+        self.rows.append(fields)
+        if not self._capturing and len(self.rows) >= self.batch_rows:
+            self.flush()
+
+    def extend(self, rows):
+        """Add rows recorded elsewhere (see ``capture``)."""
+        for row in rows:
+            self.record(**row)
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Collect the rows recorded inside the block in a list instead of the file.
+
+        Used by worker processes, which must not write to the parent's
+        report file; the parent adds the captured rows with ``extend``.
+        """
+        saved_rows, saved_capturing = self.rows, self._capturing
+        captured = []
+        self.rows, self._capturing = captured, True
+        try:
+            yield captured
+        finally:
+            self.rows, self._capturing = saved_rows, saved_capturing
+
+    def flush(self):
+        """Write buffered rows to the report file."""
+        if self.path is None or not self.rows or self._capturing:
+            return
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            if self.path.endswith(".csv"):
+                writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+                if self.rows_written == 0:
+                    writer.writeheader()
+                writer.writerows(self.rows)
+            else:
+                f.writelines(json.dumps(row) + "\n" for row in self.rows)
+        self.rows_written += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+
+
+# Shared by merger.py and its helpers; configured from the command line in main()
+reporter = Reporter()
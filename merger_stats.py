@@ -0,0 +1,109 @@
+"""Vectorised occupancy and capacity statistics for `merger.py stats`.
+
+The hostels are flattened into per-room columns (see ``capacity_columns``),
+which NumPy wraps without copying. Each aggregate, per hostel, per floor or
+per duplicate group, is then a single ``bincount`` over a group index, and
+finding over-capacity rooms is a single comparison. Once the hostels have
+been read, summarising the whole campus takes milliseconds. NumPy is only
+needed by this command, so it is imported when the command runs.
+"""
+import time
+
+from merger_model import capacity_columns
+
+# Per-room figures summed for every hostel, floor and duplicate group
+AGGREGATES = ('rooms', 'beds', 'occupants', 'free_beds', 'over_capacity_rooms', 'overflow')
+
+
+def load_numpy():
+    """Import NumPy, or explain how to install it."""
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("`merger.py stats` needs NumPy; install it with: pip install numpy") from e
+    return numpy
+
+
+def _aggregate(np, index, size, room_columns):
+    """Sum each per-room column by ``index``, giving one row per group."""
+    sums = [np.bincount(index, weights=None if column is None else column, minlength=size).astype(np.int64)
+            for column in room_columns]
+    return [dict(zip(AGGREGATES, values)) for values in zip(*(column.tolist() for column in sums))]
+
+
+def campus_stats(hostels, groups=()):
+    """Summarise occupancy and capacity across hostels.
+
+    Args:
+        hostels: list of Hostel
+        groups: lists of indexes into ``hostels``, one per duplicate group
+
+    Returns:
+        dict: 'totals' (AGGREGATES plus 'hostels', 'floors', 'empty_rooms'
+            and 'full_rooms'); 'hostels' and 'floors', one row of AGGREGATES
+            per hostel and per floor, in order (floor rows also have
+            'hostel' and 'floor' indexes); 'over_capacity', the rooms over
+            capacity, most overfull first, with 'hostel', 'floor',
+            'room_number', 'occupants' and 'capacity'; 'groups', one row of
+            AGGREGATES per duplicate group, plus its 'hostels', its
+            'primary' (the hostel with the most occupants, first on ties, as
+            the merge picks it), 'to_move' (occupants of the other hostels)
+            and 'primary_free_beds'; and 'seconds' taken
+    """
+    np = load_numpy()
+    start = time.perf_counter()
+    columns = capacity_columns(hostels)
+    hostel, floor, room, capacity, occupants = (np.frombuffer(columns[name], dtype=np.intc).astype(np.int64)
+                                                for name in ('hostel', 'floor', 'room', 'capacity', 'occupants'))
+    free_beds = np.maximum(capacity - occupants, 0)
+    overflow = np.maximum(occupants - capacity, 0)
+    over = occupants > capacity
+    room_columns = (None, capacity, occupants, free_beds, over, overflow)
+
+    per_hostel = _aggregate(np, hostel, len(hostels), room_columns)
+
+    floor_counts = np.array([len(h.floors) for h in hostels], dtype=np.int64)
+    floor_offsets = np.cumsum(floor_counts) - floor_counts
+    per_floor = _aggregate(np, floor_offsets[hostel] + floor, int(floor_counts.sum()), room_columns)
+    floor_hostels = np.repeat(np.arange(len(hostels)), floor_counts)
+    floor_numbers = np.arange(len(per_floor)) - floor_offsets[floor_hostels]
+    for row, hostel_index, floor_index in zip(per_floor, floor_hostels.tolist(), floor_numbers.tolist()):
+        row.update(hostel=hostel_index, floor=floor_index)
+
+    over_rooms = np.flatnonzero(over)
+    over_rooms = over_rooms[np.argsort(-overflow[over_rooms], kind='stable')]
+    over_capacity = [{'hostel': h, 'floor': f,
+                      'room_number': hostels[h].floors[f].rooms[r].number,
+                      'occupants': o, 'capacity': c}
+                     for h, f, r, o, c in zip(hostel[over_rooms].tolist(), floor[over_rooms].tolist(),
+                                              room[over_rooms].tolist(), occupants[over_rooms].tolist(),
+                                              capacity[over_rooms].tolist())]
+
+    per_group = []
+    if groups:
+        members = np.array([index for group in groups for index in group], dtype=np.int64)
+        member_group = np.repeat(np.arange(len(groups)), [len(group) for group in groups])
+        hostel_group = np.full(len(hostels), -1, dtype=np.int64)
+        hostel_group[members] = member_group
+        room_group = hostel_group[hostel]
+        in_group = room_group >= 0
+        per_group = _aggregate(np, room_group[in_group], len(groups),
+                               [None if column is None else column[in_group] for column in room_columns])
+
+        hostel_occupants = np.array([row['occupants'] for row in per_hostel], dtype=np.int64)
+        hostel_free = np.array([row['free_beds'] for row in per_hostel], dtype=np.int64)
+        # Sort members by group, then most occupants, then position: each group's first is its primary
+        order = np.lexsort((np.arange(len(members)), -hostel_occupants[members], member_group))
+        primaries = members[order][np.searchsorted(member_group[order], np.arange(len(groups)))]
+        for row, group, primary in zip(per_group, groups, primaries.tolist()):
+            row.update(hostels=list(group), primary=primary,
+                       to_move=row['occupants'] - int(hostel_occupants[primary]),
+                       primary_free_beds=int(hostel_free[primary]))
+
+    totals = {name: int(value) for name, value in zip(AGGREGATES, (
+        len(capacity), capacity.sum(), occupants.sum(), free_beds.sum(), over.sum(), overflow.sum()))}
+    totals.update(hostels=len(hostels), floors=len(per_floor),
+                  empty_rooms=int(np.count_nonzero(occupants == 0)),
+                  full_rooms=int(np.count_nonzero((occupants >= capacity) & (capacity > 0))))
+    return {'totals': totals, 'hostels': per_hostel, 'floors': per_floor, 'over_capacity': over_capacity,
+            'groups': per_group, 'seconds': time.perf_counter() - start}
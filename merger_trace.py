@@ -0,0 +1,141 @@
+"""Per-phase timing and request counters for merger.py.
+
+Functions decorated with ``traced`` are phases named after the function.
+For each phase the tracer accumulates wall time, calls and the requests
+made while it ran: documents read and written, RPCs and bytes. The counts
+come from the backends, which report them to ``Tracer.count`` once it is set
+as their ``observer``. Phases may nest; a phase's figures include those of
+the phases inside it.
+
+Tracing is off unless enabled, and then costs one flag check per phase.
+Besides the per-phase totals, every phase call is kept as an event so a run
+can be written out in the Chrome trace event format and opened in
+chrome://tracing or Perfetto.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+COUNTERS = ('reads', 'writes', 'rpcs', 'bytes_read', 'bytes_written')
+
+
+class Tracer:
+    """Accumulates request counters and per-phase statistics."""
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        self.totals = dict.fromkeys(COUNTERS, 0)
+        self.phases = {}  # name -> dict of 'calls', 'seconds' and COUNTERS
+        self.events = []
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self.started = time.time()
+
+    def count(self, **counts):
+        """Add to the request counters (a backend ``observer``). Thread safe."""
+        with self._lock:
+            for key, value in counts.items():
+                self.totals[key] += value
+
+    def _phase_stats(self, name):
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = dict(calls=0, seconds=0.0, **dict.fromkeys(COUNTERS, 0))
+        return stats
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the block as a call of phase ``name``."""
+        if not self.enabled:
+            yield
+            return
+        with self._lock:
+            before = dict(self.totals)
+        wall_start = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                delta = {key: self.totals[key] - before[key] for key in COUNTERS}
+            stats = self._phase_stats(name)
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            for key, value in delta.items():
+                stats[key] += value
+            self.events.append({'name': name, 'start': wall_start, 'seconds': seconds,
+                                'pid': os.getpid(), 'tid': threading.get_ident(), 'counts': delta})
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Collect the phases of the block separately, for a worker process.
+
+        Yields a dict that holds ``phases`` and ``events`` when the block
+        ends; the parent adds them with ``merge``.
+        """
+        saved = self.phases, self.events
+        self.phases, self.events = {}, []
+        captured = {}
+        try:
+            yield captured
+        finally:
+            captured.update(phases=self.phases, events=self.events)
+            self.phases, self.events = saved
+
+    def merge(self, captured):
+        """Add phases captured in another process (see ``capture``)."""
+        for name, other in captured.get('phases', {}).items():
+            stats = self._phase_stats(name)
+            for key, value in other.items():
+                stats[key] += value
+        self.events.extend(captured.get('events', ()))
+
+    def summary(self):
+        """Return per-phase statistics in order of first use."""
+        return [dict(name=name, **stats) for name, stats in self.phases.items()]
+
+    def write(self, path, metadata=None):
+        """Write the run as a JSON trace.
+
+        ``traceEvents`` holds one complete event per phase call in the Chrome
+        trace event format (microsecond timestamps from the start of the
+        run); ``phases`` and ``totals`` hold the aggregated figures.
+        """
+        trace_events = [{
+            'name': event['name'], 'ph': 'X', 'cat': 'phase',
+            'ts': round((event['start'] - self.started) * 1e6),
+            'dur': round(event['seconds'] * 1e6),
+            'pid': event['pid'], 'tid': event['tid'], 'args': event['counts'],
+        } for event in self.events]
+        trace = {
+            'traceEvents': trace_events,
+            'displayTimeUnit': 'ms',
+            'metadata': dict(metadata or {}, started_at=self.started,
+                             seconds=time.time() - self.started),
+            'totals': self.totals,
+            'phases': self.summary(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, indent=1)
+
+
+def traced(function):
+    """Decorator timing every call of ``function`` as a phase of the same name."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not tracer.enabled:
+            return function(*args, **kwargs)
+        with tracer.phase(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+# Shared by merger.py and its helpers; enabled from the command line in main()
+tracer = Tracer()
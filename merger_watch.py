@@ -0,0 +1,148 @@
+"""Incrementally maintained occupancy and allocation indexes for `merger.py watch`.
+
+``OccupancyIndex`` holds, for the whole campus, each hostel's occupant
+count and over-capacity rooms, where each student actually sleeps, and each
+allocation with its current drift status (see ``allocation_status``). It is
+fed document changes as they arrive. A changed hostel only re-checks the
+allocations pointing at it and those of the students who moved in or out of
+it; a changed allocation only re-checks itself. So a change is reported
+within one listener callback, not at the next full audit.
+"""
+from collections import defaultdict
+
+from merger_index import allocation_status
+from merger_model import Hostel
+
+
+class OccupancyIndex:
+    """Live hostel occupancy, student locations and allocation drift."""
+
+    def __init__(self):
+        self.hostel_names = {}
+        self.occupant_counts = {}
+        self.over_capacity = {}  # hostel ID -> {room number: (occupants, capacity)}
+        self.hostel_students = {}  # hostel ID -> set of students in its rooms
+        self.locations = defaultdict(dict)  # student -> {hostel ID: location}, in order added
+        self.allocations = {}  # allocation ID -> (student, hostel ID)
+        self.by_student = defaultdict(set)
+        self.by_hostel = defaultdict(set)
+        self.drift = {}  # allocation ID -> (status, student, hostel ID, location or None)
+
+    @property
+    def student_count(self):
+        return len(self.locations)
+
+    def location(self, student):
+        """Return the location of a student; if several hostels list them, the one indexed last."""
+        found = self.locations.get(student)
+        return next(reversed(found.values())) if found else None
+
+    def _remove_hostel(self, hostel_id):
+        for student in self.hostel_students.pop(hostel_id, ()):
+            found = self.locations[student]
+            found.pop(hostel_id, None)
+            if not found:
+                del self.locations[student]
+        self.hostel_names.pop(hostel_id, None)
+        self.occupant_counts.pop(hostel_id, None)
+        self.over_capacity.pop(hostel_id, None)
+
+    def _add_hostel(self, hostel_id, data):
+        hostel = Hostel.from_dict(hostel_id, data)
+        students = set()
+        over = {}
+        occupants = 0
+        for _, room in hostel.rooms():
+            occupants += len(room.occupants)
+            capacity = room.capacity or 0
+            if len(room.occupants) > capacity:
+                over[room.number] = (len(room.occupants), capacity)
+            for student in room.occupants:
+                students.add(student)
+                self.locations[student][hostel_id] = {
+                    'hostel_id': hostel_id,
+                    'hostel_name': hostel.name if hostel.name is not None else 'Unknown',
+                    'room_id': room.id if room.id is not None else '',
+                    'room_number': room.number if room.number is not None else '',
+                }
+        self.hostel_names[hostel_id] = hostel.name if hostel.name is not None else 'Unnamed'
+        self.occupant_counts[hostel_id] = occupants
+        self.over_capacity[hostel_id] = over
+        self.hostel_students[hostel_id] = students
+
+    def _set_allocation(self, alloc_id, data):
+        old = self.allocations.pop(alloc_id, None)
+        if old is not None:
+            self.by_student[old[0]].discard(alloc_id)
+            self.by_hostel[old[1]].discard(alloc_id)
+        if data is not None:
+            student, hostel_id = data.get('studentRegNumber', 'N/A'), data.get('hostelId', '')
+            self.allocations[alloc_id] = (student, hostel_id)
+            self.by_student[student].add(alloc_id)
+            self.by_hostel[hostel_id].add(alloc_id)
+
+    def apply(self, collection, changes):
+        """Apply a list of ``(doc_id, data)`` changes to a collection (data None when deleted).
+
+        Returns:
+            dict: 'occupancy' list of (hostel ID, name, before, after) for
+                hostels whose occupant count changed (None when added or
+                removed), 'drifted' and 'resolved' lists of allocation IDs
+                whose drift started or ended (or changed status), and
+                'over_capacity' list of (hostel ID, room number, occupants,
+                capacity) for rooms that went over capacity
+        """
+        report = {'occupancy': [], 'drifted': [], 'resolved': [], 'over_capacity': []}
+        recheck = set()
+        for doc_id, data in changes:
+            if collection == 'hostels':
+                before = self.occupant_counts.get(doc_id)
+                name = self.hostel_names.get(doc_id)
+                was_over = self.over_capacity.get(doc_id, {})
+                students = set(self.hostel_students.get(doc_id, ()))
+                self._remove_hostel(doc_id)
+                if data is not None:
+                    self._add_hostel(doc_id, data)
+                    students |= self.hostel_students[doc_id]
+                    name = self.hostel_names[doc_id]
+                    for number, (occupants, capacity) in self.over_capacity[doc_id].items():
+                        if number not in was_over:
+                            report['over_capacity'].append((doc_id, number, occupants, capacity))
+                after = self.occupant_counts.get(doc_id)
+                if before != after:
+                    report['occupancy'].append((doc_id, name, before, after))
+                recheck |= self.by_hostel.get(doc_id, set())
+                for student in students:
+                    recheck |= self.by_student.get(student, set())
+            elif collection == 'roomAllocations':
+                self._set_allocation(doc_id, data)
+                recheck.add(doc_id)
+
+        for alloc_id in sorted(recheck):
+            previous = self.drift.get(alloc_id)
+            current = self._check(alloc_id)
+            if current is None:
+                self.drift.pop(alloc_id, None)
+                if previous is not None:
+                    report['resolved'].append(alloc_id)
+            else:
+                self.drift[alloc_id] = current
+                if previous is None or previous[0] != current[0] or previous[3] != current[3]:
+                    report['drifted'].append(alloc_id)
+        return report
+
+    def _check(self, alloc_id):
+        allocation = self.allocations.get(alloc_id)
+        if allocation is None:
+            return None
+        student, hostel_id = allocation
+        location = self.location(student)
+        status = allocation_status(hostel_id, hostel_id in self.hostel_names, location)
+        return None if status is None else (status, student, hostel_id, location)
+
+    def drift_counts(self):
+        """Return the number of drifted allocations per status."""
+        counts = defaultdict(int)
+        for status, *_ in self.drift.values():
+            counts[status] += 1
+        return dict(counts)
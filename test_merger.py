@@ -0,0 +1,172 @@
+"""End-to-end tests of merger.py commands on small snapshot campuses.
+
+Run with: python -m unittest test_merger
+"""
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import unittest
+
+
+def room(room_id, number, occupants, capacity=2):
+    return {'id': room_id, 'number': number, 'capacity': capacity, 'occupants': occupants}
+
+
+def hostel(hostel_id, name, rooms):
+    return {'id': hostel_id, 'name': name, 'floors': [{'id': 'f0', 'number': '0', 'rooms': rooms}]}
+
+
+def allocation(alloc_id, student, hostel_id, room_id):
+    return {'id': alloc_id, 'studentRegNumber': student, 'hostelId': hostel_id, 'roomId': room_id}
+
+
+def write_snapshot(directory, hostels, allocations):
+    with open(os.path.join(directory, "hostels.json"), "w", encoding="utf-8") as f:
+        json.dump(hostels, f)
+    with open(os.path.join(directory, "roomAllocations.ndjson"), "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(alloc) + "\n" for alloc in allocations)
+
+
+@unittest.skipUnless(importlib.util.find_spec("dotenv"), "merger.py needs python-dotenv")
+class IncrementalValidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # S2 moves from b's Room 101 into a's; their allocation points at a
+        # hostel outside the duplicate group
+        write_snapshot(self.directory.name, [
+            hostel('a', "Block A", [room('a-101', '101', ['S1'])]),
+            hostel('b', "Block A", [room('b-101', '101', ['S2'])]),
+            hostel('o', "Other Hall", [room('o-201', '201', [])]),
+        ], [
+            allocation('x1', 'S1', 'a', 'a-101'),
+            allocation('x2', 'S2', 'o', 'o-201'),
+        ])
+
+    def plan(self, *options):
+        import merger
+        path = os.path.join(self.directory.name, "plan.jsonl")
+        with contextlib.redirect_stdout(io.StringIO()):
+            merger.main(["plan", "--snapshot", self.directory.name, "-o", path, *options])
+        return merger.load_plan(path)
+
+    def test_moved_student_allocation_outside_groups_is_fixed(self):
+        plan = self.plan()
+        self.assertEqual(plan['merge_mapping'], {'b': 'a'})
+        self.assertEqual([(fix['doc_id'], fix['new_hostel_id'], fix['room_id']) for fix in plan['fixes']],
+                         [('x2', 'a', 'a-101')])
+
+    def test_hostels_outside_groups_count_as_existing(self):
+        report = os.path.join(self.directory.name, "report.jsonl")
+        self.plan("--report", report)
+        with open(report, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([(row['allocation_id'], row['status']) for row in rows if row['kind'] == 'validation'],
+                         [('x2', 'needs_fix')])
+
+
+@unittest.skipUnless(importlib.util.find_spec("dotenv"), "merger.py needs python-dotenv")
+class FixLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # The merge rewrites S2's allocation itself, so validation finds nothing to fix
+        write_snapshot(self.directory.name, [
+            hostel('a', "Block A", [room('a-101', '101', ['S1'])]),
+            hostel('b', "Block A", [room('b-101', '101', ['S2'])]),
+        ], [
+            allocation('x1', 'S1', 'a', 'a-101'),
+            allocation('x2', 'S2', 'b', 'b-101'),
+        ])
+        self.fix_log = os.path.join(self.directory.name, "fixes.jsonl")
+        with open(self.fix_log, "w", encoding="utf-8") as f:
+            f.write(json.dumps({'doc_id': 'old', 'student_reg': 'S9', 'old_hostel_id': 'z', 'new_hostel_id': 'y',
+                                'room_id': 'y-1', 'room_number': '1', 'hostel_name': "Old",
+                                'status': 'failed', 'error': "timeout"}) + "\n")
+
+    def run_merger(self, *argv):
+        import merger
+        with contextlib.redirect_stdout(io.StringIO()):
+            merger.main([*argv, "--snapshot", self.directory.name, "-y", "--fix-log", self.fix_log,
+                         "--write-snapshot", os.path.join(self.directory.name, "out")])
+
+    def assert_log_replaced(self):
+        import merger
+        self.assertEqual(merger.load_fix_log(self.fix_log), [])
+
+    def test_merge_without_fixes_replaces_an_older_log(self):
+        self.run_merger("merge")
+        self.assert_log_replaced()
+
+    def test_applying_a_plan_without_fixes_replaces_an_older_log(self):
+        plan = os.path.join(self.directory.name, "plan.jsonl")
+        self.run_merger("plan", "-o", plan)
+        self.run_merger("apply", plan)
+        self.assert_log_replaced()
+
+
+@unittest.skipUnless(importlib.util.find_spec("dotenv"), "merger.py needs python-dotenv")
+class PlanFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # b's only student moves into a's Room 102, so b is deleted
+        write_snapshot(self.directory.name, [
+            hostel('a', "Block A", [room('a-101', '101', ['S1']), room('a-102', '102', [])]),
+            hostel('b', "Block A", [room('b-102', '102', ['S2'])]),
+        ], [
+            allocation('x1', 'S1', 'a', 'a-101'),
+            allocation('x2', 'S2', 'b', 'b-102'),
+        ])
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def run_merger(self, *argv):
+        import merger
+        with contextlib.redirect_stdout(io.StringIO()):
+            merger.main([*argv, "--snapshot", self.directory.name, "-y"])
+
+    def read_collections(self, directory):
+        with open(os.path.join(directory, "hostels.ndjson"), encoding="utf-8") as f:
+            hostels = f.read()
+        with open(os.path.join(directory, "roomAllocations.ndjson"), encoding="utf-8") as f:
+            return hostels, f.read()
+
+    def test_save_and_load_round_trip(self):
+        import merger
+        self.run_merger("plan", "-o", self.path("plan.jsonl"))
+        plan = merger.load_plan(self.path("plan.jsonl"))
+        self.assertEqual(plan['merge_mapping'], {'b': 'a'})
+        self.assertTrue(all(plan[key] for _, key in merger.PLAN_RECORDS if key != 'fixes'))
+
+        merger.save_plan(self.path("copy.jsonl"), plan)
+        self.assertEqual(merger.load_plan(self.path("copy.jsonl")), plan)
+        with open(self.path("plan.jsonl"), encoding="utf-8") as a, open(self.path("copy.jsonl"), encoding="utf-8") as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_applying_a_saved_plan_matches_merging_directly(self):
+        self.run_merger("merge", "--write-snapshot", self.path("merged"))
+        self.run_merger("plan", "-o", self.path("plan.jsonl"))
+        self.run_merger("apply", self.path("plan.jsonl"), "--write-snapshot", self.path("applied"))
+        self.assertEqual(self.read_collections(self.path("applied")), self.read_collections(self.path("merged")))
+
+    def test_unsupported_version_and_unknown_records_are_rejected(self):
+        import merger
+        for lines in ([{'type': 'header', 'version': merger.PLAN_VERSION + 1}],
+                      [{'type': 'header', 'version': merger.PLAN_VERSION}, {'type': 'surprise'}],
+                      [{'type': 'group', 'name': "Block A"}]):
+            with open(self.path("plan.jsonl"), "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(line) + "\n" for line in lines)
+            with self.assertRaises(ValueError):
+                merger.load_plan(self.path("plan.jsonl"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""Tests for chunked, concurrent batch writes (merger_backends.BatchWriter).
+
+Run with: python -m unittest test_merger_backends
+"""
+import json
+import unittest
+
+from merger_backends import BatchCommitError, BatchWriter, SnapshotBackend, operations_digest
+
+
+class Aborted(Exception):
+    """Named like the google.api_core error for transaction contention."""
+
+
+class FlakyBackend(SnapshotBackend):
+    """Snapshot backend whose commits raise ``errors`` one by one before succeeding."""
+
+    def __init__(self, errors=()):
+        super().__init__(None)
+        self.errors = list(errors)
+        self.commits = []
+        self.collections['hostels'] = {f"h{n}": json.dumps({'name': f"Hall {n}"}) for n in range(6)}
+
+    def apply(self, operations):
+        with self._lock:
+            if self.errors:
+                raise self.errors.pop(0)
+            self.commits.append([doc_id for _, _, doc_id, _ in operations])
+        super().apply(operations)
+
+    def names(self):
+        return {doc_id: json.loads(raw)['name'] for doc_id, raw in self.collections['hostels'].items()}
+
+
+def writer(backend, **options):
+    return BatchWriter(backend, max_operations=2, workers=4, backoff=0, **options)
+
+
+class ChunkingTest(unittest.TestCase):
+
+    def test_writes_are_split_into_bounded_chunks(self):
+        backend = FlakyBackend()
+        batches = writer(backend)
+        self.assertEqual([batches.update('hostels', f"h{n}", {'name': "Renamed"}) for n in range(5)], [0, 0, 1, 1, 2])
+        self.assertEqual(batches.delete('hostels', 'h5'), 2)
+        self.assertEqual((batches.chunk_count, len(batches)), (3, 6))
+
+        results = batches.commit()
+        self.assertEqual([(r.index, r.operations, r.attempts) for r in results], [(0, 2, 1), (1, 2, 1), (2, 2, 1)])
+        self.assertEqual(backend.names(), {f"h{n}": "Renamed" for n in range(5)})
+        self.assertEqual(batches.chunk_count, 0)
+
+    def test_byte_limit_starts_a_new_chunk(self):
+        batches = BatchWriter(FlakyBackend(), max_operations=10, max_bytes=40)
+        self.assertEqual([batches.update('hostels', f"h{n}", {'name': "x" * 20}) for n in range(3)], [0, 1, 2])
+
+    def test_chunks_writing_the_same_document_commit_in_queue_order(self):
+        backend = FlakyBackend()
+        batches = writer(backend)
+        for n, name in enumerate(["First", "Other", "Second", "Other", "Third", "Other"]):
+            batches.update('hostels', 'h0' if n % 2 == 0 else f"h{n}", {'name': name})
+
+        self.assertEqual(batches._waves(), [[0], [1], [2]])
+        batches.commit()
+        self.assertEqual(backend.names()['h0'], "Third")
+        self.assertEqual(backend.commits, [['h0', 'h1'], ['h0', 'h3'], ['h0', 'h5']])
+
+    def test_independent_chunks_share_a_wave(self):
+        batches = writer(FlakyBackend())
+        for n in range(6):
+            batches.update('hostels', f"h{n}", {'name': "Renamed"})
+        self.assertEqual(batches._waves(), [[0, 1, 2]])
+
+
+class RetryTest(unittest.TestCase):
+
+    def test_contention_is_retried(self):
+        backend = FlakyBackend([Aborted("contention"), Aborted("contention")])
+        batches = writer(backend)
+        batches.update('hostels', 'h0', {'name': "Renamed"})
+
+        results = batches.commit()
+        self.assertEqual(results[0].attempts, 3)
+        self.assertTrue(results[0].ok)
+        self.assertEqual(backend.names()['h0'], "Renamed")
+
+    def test_gives_up_after_max_attempts(self):
+        batches = writer(FlakyBackend([Aborted("contention")] * 3), max_attempts=3)
+        batches.update('hostels', 'h0', {'name': "Renamed"})
+        with self.assertRaises(BatchCommitError) as caught:
+            batches.commit()
+        self.assertEqual([r.attempts for r in caught.exception.results], [3])
+
+    def test_failed_chunk_stops_later_waves_and_stays_queued(self):
+        backend = FlakyBackend([ValueError("rejected")])
+        batches = writer(backend)
+        for name in ["First", "Second"]:
+            batches.update('hostels', 'h0', {'name': name})
+            batches.update('hostels', 'h1', {'name': name})
+        batches.update('hostels', 'h2', {'name': "Third"})
+
+        # Chunk 0 fails outright (not retryable), so chunk 1 in the next wave never runs
+        with self.assertRaises(BatchCommitError) as caught:
+            batches.commit()
+        self.assertEqual([(r.index, r.attempts, r.ok) for r in caught.exception.results], [(0, 1, False)])
+        self.assertEqual(backend.commits, [])
+        self.assertEqual(batches.chunk_count, 3)
+
+        batches.commit()
+        self.assertEqual((backend.names()['h0'], backend.names()['h2']), ("Second", "Third"))
+        self.assertEqual(batches.chunk_count, 0)
+
+    def test_on_commit_sees_each_committed_chunk(self):
+        committed = []
+        batches = writer(FlakyBackend(), on_commit=lambda batch: committed.append(operations_digest(batch.operations)))
+        for n in range(4):
+            batches.update('hostels', f"h{n}", {'name': "Renamed"})
+        expected = sorted(operations_digest(batch.operations) for batch in batches.batches)
+        batches.commit()
+        self.assertEqual(sorted(committed), expected)
+
+
+class DiscardTest(unittest.TestCase):
+
+    def queue(self, backend):
+        batches = writer(backend)
+        for n in range(5):
+            batches.update('hostels', f"h{n}", {'name': "Renamed"})
+        return batches
+
+    def test_discard_skips_chunks_already_committed(self):
+        # Chunking is deterministic, so a second run queues identical chunks
+        done = {operations_digest(batch.operations) for batch in self.queue(FlakyBackend()).batches[:2]}
+
+        backend = FlakyBackend()
+        batches = self.queue(backend)
+        self.assertEqual(batches.discard(done), 2)
+        self.assertEqual(batches.discard(done), 0)
+        batches.commit()
+        self.assertEqual(backend.commits, [['h4']])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Tests for the SQLite snapshot cache and its delta sync (merger_cache).
+
+Run with: python -m unittest test_merger_cache
+"""
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from merger_backends import FirestoreBackend, SnapshotBackend
+from merger_cache import CachedBackend, SnapshotCache
+
+
+def source_backend(source="snapshot:/campus", hostels=3):
+    backend = SnapshotBackend(None)
+    backend.source = source
+    backend.collections['hostels'] = {f"h{n}": json.dumps({'name': f"Hall {n}"}) for n in range(hostels)}
+    backend.collections['roomAllocations'] = {'x1': json.dumps({'studentRegNumber': 'S1', 'hostelId': 'h0'})}
+    return backend
+
+
+class SnapshotCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SnapshotCache(os.path.join(directory.name, "cache.sqlite"))
+        self.addCleanup(self.cache.close)
+
+    def sync(self, backend, collection='hostels'):
+        result = self.cache.sync(backend, collection)
+        return {key: result[key] for key in ('listed', 'fetched', 'deleted', 'unchanged')}
+
+    def test_only_changed_documents_are_fetched(self):
+        backend = source_backend()
+        self.assertEqual(self.sync(backend), {'listed': 3, 'fetched': 3, 'deleted': 0, 'unchanged': 0})
+        self.assertEqual(self.sync(backend), {'listed': 3, 'fetched': 0, 'deleted': 0, 'unchanged': 3})
+
+        backend.apply([("update", 'hostels', 'h1', {'name': "Hall One"}), ("delete", 'hostels', 'h2', None)])
+        backend.collections['hostels']['h3'] = json.dumps({'name': "Hall 3"})
+        self.assertEqual(self.sync(backend), {'listed': 3, 'fetched': 2, 'deleted': 1, 'unchanged': 1})
+        self.assertEqual({doc_id: json.loads(raw)['name'] for doc_id, raw in self.cache.load('hostels').items()},
+                         {'h0': "Hall 0", 'h1': "Hall One", 'h3': "Hall 3"})
+
+    def test_a_different_source_starts_over(self):
+        self.sync(source_backend())
+        other = source_backend(source="snapshot:/elsewhere", hostels=1)
+        self.assertEqual(self.sync(other), {'listed': 1, 'fetched': 1, 'deleted': 0, 'unchanged': 0})
+        self.assertEqual(list(self.cache.load('hostels')), ['h0'])
+
+    def test_cached_backend_reads_locally_and_writes_through(self):
+        source = source_backend()
+        for collection in ('hostels', 'roomAllocations'):
+            self.sync(source, collection)
+        cached = CachedBackend(source, self.cache)
+
+        batch = cached.batch()
+        batch.update('roomAllocations', 'x1', {'hostelId': 'h1'})
+        batch.commit()
+
+        self.assertEqual(dict(cached.stream('roomAllocations'))['x1']['hostelId'], 'h1')
+        self.assertEqual(json.loads(source.collections['roomAllocations']['x1'])['hostelId'], 'h1')
+        # The cache file itself only catches up on the next sync
+        self.assertEqual(self.sync(source, 'roomAllocations')['fetched'], 1)
+
+
+class FakeCollection:
+    """Records the projection asked of a Firestore collection and returns fixed snapshots."""
+
+    def __init__(self, doc_ids):
+        self.doc_ids = doc_ids
+        self.projection = None
+
+    def select(self, field_paths):
+        self.projection = field_paths
+        return self
+
+    def stream(self):
+        for doc_id in self.doc_ids:
+            yield SimpleNamespace(id=doc_id, reference=SimpleNamespace(path=f"hostels/{doc_id}"),
+                                  update_time=datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+
+class FirestoreVersionsTest(unittest.TestCase):
+
+    def test_listing_projects_to_the_document_id(self):
+        collection = FakeCollection(['h0', 'h1'])
+        backend = FirestoreBackend(SimpleNamespace(collection=lambda name: collection))
+        self.assertEqual([doc_id for doc_id, _ in backend.versions('hostels')], ['h0', 'h1'])
+        # An empty projection would return every field
+        self.assertEqual(collection.projection, ["__name__"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Tests for the disk-backed student location index (merger_index).
+
+Run with: python -m unittest test_merger_index
+"""
+import os
+import unittest
+
+from merger_index import DiskLocationIndex, allocation_status
+from merger_model import Hostel
+
+
+def make_hostel(hostel_id, rooms):
+    return Hostel.from_dict(hostel_id, {'name': hostel_id.upper(), 'floors': [{'rooms': [
+        {'id': room_id, 'number': number, 'capacity': 2, 'occupants': occupants}
+        for room_id, number, occupants in rooms]}]})
+
+
+class DiskLocationIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = DiskLocationIndex()
+        self.addCleanup(self.index.close)
+
+    def add(self, *hostels):
+        for hostel in hostels:
+            self.index.add_hostel(hostel, hostel.name)
+        self.index.commit()
+
+    def test_resolve_keeps_chunk_order(self):
+        self.add(make_hostel('a', [('a-1', '101', ['S1', 'S2'])]), make_hostel('b', [('b-1', '201', ['S3'])]))
+        self.assertEqual((self.index.hostel_count, self.index.student_count), (2, 3))
+        chunk = [('x3', {'studentRegNumber': 'S3', 'hostelId': 'a'}),
+                 ('x9', {'studentRegNumber': 'S9', 'hostelId': 'gone'}),
+                 ('x1', {'studentRegNumber': 'S1', 'hostelId': 'a'})]
+        resolved = self.index.resolve(chunk)
+        self.assertEqual([(alloc_id, exists) for alloc_id, _, exists, _ in resolved],
+                         [('x3', True), ('x9', False), ('x1', True)])
+        self.assertEqual(resolved[0][3], {'hostel_id': 'b', 'hostel_name': 'B', 'room_id': 'b-1', 'room_number': '201'})
+        self.assertIsNone(resolved[1][3])
+
+    def test_integer_room_ids_and_numbers_round_trip(self):
+        self.add(make_hostel('a', [(7, 101, ['S1'])]))
+        location = self.index.resolve([('x1', {'studentRegNumber': 'S1', 'hostelId': 'a'})])[0][3]
+        self.assertEqual(location['room_id'], 7)
+        self.assertEqual(location['room_number'], 101)
+        self.assertIsInstance(location['room_id'], int)
+
+    def test_student_in_several_rooms_keeps_the_last(self):
+        self.add(make_hostel('a', [('a-1', '101', ['S1'])]), make_hostel('b', [('b-1', '201', ['S1'])]))
+        location = self.index.resolve([('x1', {'studentRegNumber': 'S1', 'hostelId': 'a'})])[0][3]
+        self.assertEqual(location['hostel_id'], 'b')
+
+    def test_close_removes_the_file(self):
+        index = DiskLocationIndex()
+        index.close()
+        self.assertFalse(os.path.exists(index.path))
+
+
+class AllocationStatusTest(unittest.TestCase):
+
+    def test_statuses(self):
+        here = {'hostel_id': 'a'}
+        self.assertIsNone(allocation_status('a', True, here))
+        self.assertIsNone(allocation_status('a', True, None))
+        self.assertEqual(allocation_status('b', True, here), 'needs_fix')
+        self.assertEqual(allocation_status('gone', False, here), 'found_match')
+        self.assertEqual(allocation_status('gone', False, None), 'no_match')
+
+
+if __name__ == "__main__":
+    unittest.main()
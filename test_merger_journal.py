@@ -0,0 +1,84 @@
+"""Tests for the checkpoint journal of resumable runs (merger_journal).
+
+Run with: python -m unittest test_merger_journal
+"""
+import os
+import tempfile
+import unittest
+
+from merger_backends import WriteBatch, operations_digest
+from merger_journal import CheckpointJournal, file_digest
+
+
+def write_batch(*doc_ids):
+    batch = WriteBatch()
+    for doc_id in doc_ids:
+        batch.update("roomAllocations", doc_id, {'hostelId': 'a'})
+    return batch
+
+
+class CheckpointJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "merge.journal")
+        self.plan = os.path.join(self.directory.name, "merge.plan.jsonl")
+        with open(self.plan, "w", encoding="utf-8") as f:
+            f.write('{"type": "header"}\n')
+
+    def test_progress_survives_reopening(self):
+        journal = CheckpointJournal(self.path)
+        journal.start(self.plan, file_digest(self.plan))
+        journal.record_chunk(write_batch('x1', 'x2'))
+        journal.record_fixes(write_batch('x3'))
+        journal.close()
+
+        resumed = CheckpointJournal(self.path)
+        self.assertTrue(resumed.started)
+        self.assertFalse(resumed.finished)
+        self.assertEqual(resumed.plan_digest, file_digest(self.plan))
+        self.assertEqual(resumed.chunks, {operations_digest(write_batch('x1', 'x2').operations)})
+        self.assertEqual(resumed.fixes, {'x3'})
+
+        resumed.finish()
+        resumed.close()
+        self.assertTrue(CheckpointJournal(self.path).finished)
+
+    def test_start_discards_earlier_records(self):
+        journal = CheckpointJournal(self.path)
+        journal.start(self.plan, "old")
+        journal.record_fixes(write_batch('x1'))
+        journal.start(self.plan, "new")
+        journal.close()
+        reopened = CheckpointJournal(self.path)
+        self.assertEqual((reopened.plan_digest, reopened.fixes), ("new", set()))
+
+    def test_plan_path_is_stored_absolute(self):
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(self.directory.name)
+        journal = CheckpointJournal(self.path)
+        journal.start(os.path.basename(self.plan), "digest")
+        journal.close()
+        os.chdir(cwd)
+        self.assertEqual(CheckpointJournal(self.path).plan_path, os.path.realpath(self.plan))
+
+    def test_record_cut_off_by_a_crash_is_ignored(self):
+        journal = CheckpointJournal(self.path)
+        journal.start(self.plan, "digest")
+        journal.record_fixes(write_batch('x1'))
+        journal.close()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"type": "fixes", "doc_ids": ["x')
+        self.assertEqual(CheckpointJournal(self.path).fixes, {'x1'})
+
+    def test_corrupt_record_before_the_end_is_an_error(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write('{"type": "start", "plan": "p", "plan_digest": "d"}\nnot json\n{"type": "finish"}\n')
+        with self.assertRaises(ValueError):
+            CheckpointJournal(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Regression tests for duplicate hostel detection (merger_matching and merger.identify_duplicate_hostels).
+
+Run with: python -m unittest test_merger_matching
+"""
+import contextlib
+import importlib.util
+import io
+import unittest
+
+from merger_matching import group_names, name_signature, normalize_name, split_by_layout
+from merger_model import Hostel
+
+
+def make_hostel(hostel_id, name, room_numbers=()):
+    return Hostel.from_dict(hostel_id, {
+        'name': name,
+        'floors': [{'rooms': [{'number': number, 'capacity': 2, 'occupants': []} for number in room_numbers]}],
+    })
+
+
+class NormalizedNameTest(unittest.TestCase):
+
+    def test_case_spacing_and_punctuation_are_ignored(self):
+        self.assertEqual(normalize_name("  Block-A "), normalize_name("block a"))
+        self.assertEqual(normalize_name("Café  Hall"), normalize_name("cafe hall"))
+
+    def test_names_that_only_normalize_differently_group_together(self):
+        names = {'a': "Block A", 'b': "block a ", 'c': "Block-A", 'd': "Café Hall", 'e': "CAFE_hall", 'f': "Block B"}
+        for fuzzy in (False, True):
+            groups, _ = group_names(names, fuzzy=fuzzy)
+            self.assertEqual(groups, [['a', 'b', 'c'], ['d', 'e']])
+
+
+class FuzzyMatchingTest(unittest.TestCase):
+
+    def test_typos_match(self):
+        groups, _ = group_names({'a': "Ndlovu Hall", 'b': "Ndlovu  Hal", 'c': "St John's Hall", 'd': "St Johns Hall"},
+                                fuzzy=True)
+        self.assertEqual(groups, [['a', 'b'], ['c', 'd']])
+
+    def test_numbered_siblings_stay_apart(self):
+        names = {'a': "Hostel 00002", 'b': "Hostel 00003", 'c': "Ruvimbo Hall", 'd': "Ruvimbo Hall 2",
+                 'e': "Block 12", 'f': "Block 13", 'g': "Wing IV Residence", 'h': "Wing V Residence"}
+        groups, stats = group_names(names, fuzzy=True)
+        self.assertEqual(groups, [])
+        self.assertEqual(stats['fuzzy_matches'], 0)
+
+    def test_gendered_siblings_stay_apart(self):
+        groups, _ = group_names({'a': "Chitepo Male Hostel", 'b': "Chitepo Female Hostel",
+                                 'c': "Chitepo Mixed Hostel"}, fuzzy=True, threshold=0.5)
+        self.assertEqual(groups, [])
+
+    def test_leading_zeros_do_not_distinguish(self):
+        self.assertEqual(name_signature(normalize_name("Hostel 002")), name_signature(normalize_name("Hostel 2")))
+
+    def test_chain_of_near_misses_does_not_collapse(self):
+        # a ~ b and b ~ c at 0.96, but a and c are further apart
+        names = {'a': "Mbuya Nehanda Hall", 'b': "Mbuya Nehanda Hal", 'c': "Mbuya Nehanda Ha"}
+        groups, stats = group_names(names, fuzzy=True, threshold=0.96)
+        self.assertEqual(stats['fuzzy_matches'], 2)
+        self.assertEqual(groups, [['a', 'b']])
+
+    def test_numbered_campus_is_not_one_group(self):
+        names = {f"h{n}": f"Hostel {n:05d}" for n in range(1, 200)}
+        names.update({f"d{n}": f"hostel {n:05d}" for n in range(1, 200, 7)})
+        groups, _ = group_names(names, fuzzy=True)
+        self.assertEqual(groups, [[f"h{n}", f"d{n}"] for n in range(1, 200, 7)])
+
+
+class LayoutTest(unittest.TestCase):
+
+    def test_different_layouts_split(self):
+        hostels = {
+            'a': make_hostel('a', "Block A", ['101', '102', '103']),
+            'b': make_hostel('b', "Block A", ['101', '102', '103']),
+            'c': make_hostel('c', "Block A", ['201', '202', '203']),
+        }
+        self.assertEqual(split_by_layout(['a', 'b', 'c'], hostels), [['a', 'b']])
+
+
+@unittest.skipUnless(importlib.util.find_spec("dotenv"), "merger.py needs python-dotenv")
+class IdentifyDuplicateHostelsTest(unittest.TestCase):
+
+    def identify(self, hostels, **options):
+        import merger
+        with contextlib.redirect_stdout(io.StringIO()):
+            return merger.identify_duplicate_hostels({hostel.id: hostel for hostel in hostels}, **options)
+
+    def test_groups_are_named_after_their_first_hostel(self):
+        groups = self.identify([make_hostel('a', "Block A"), make_hostel('b', "block-a"),
+                                make_hostel('c', "Chitepo Male Hostel"), make_hostel('d', "Chitepo Female Hostel"),
+                                make_hostel('e', "Hostel 1"), make_hostel('f', "Hostel 2")], fuzzy=True)
+        self.assertEqual(groups, {'Block A': ['a', 'b']})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Tests for overflow placement in the primary hostel (merger_placement.plan_placements).
+
+Run with: python -m unittest test_merger_placement
+"""
+import unittest
+
+from merger_model import Hostel, Room
+from merger_placement import plan_placements
+
+
+def room(number, capacity=2, occupants=(), **fields):
+    return {'id': f"r{number}", 'number': number, 'capacity': capacity, 'occupants': list(occupants), **fields}
+
+
+def primary(*floors):
+    return Hostel.from_dict('p', {'name': "Block A", 'floors': [
+        {'number': str(index), 'rooms': rooms} for index, rooms in enumerate(floors)]})
+
+
+def source(number, students, **fields):
+    return Room.from_dict(room(number, capacity=len(students), occupants=students, **fields))
+
+
+def placed(result):
+    """Summarise one plan_placements result by target room number."""
+    placements, already, unplaced = result
+    return [(target.number, students) for target, students in placements], already, unplaced
+
+
+class PlanPlacementsTest(unittest.TestCase):
+
+    def test_room_with_the_same_number_comes_first(self):
+        hostel = primary([room('001', capacity=4)], [room('101', capacity=2)])
+        [result] = plan_placements(hostel, [('1', source('101', ['S1', 'S2']), ['S1', 'S2'])])
+        self.assertEqual(placed(result), ([('101', ['S1', 'S2'])], [], []))
+
+    def test_roommates_stay_together_in_the_best_fit_on_their_floor(self):
+        hostel = primary([room('001', capacity=6)],
+                         [room('102', capacity=4), room('103', capacity=3), room('104', capacity=1)])
+        [result] = plan_placements(hostel, [('1', source('101', ['S1', 'S2']), ['S1', 'S2'])])
+        self.assertEqual(placed(result), ([('103', ['S1', 'S2'])], [], []))
+
+    def test_group_is_split_across_the_roomiest_rooms_when_it_does_not_fit(self):
+        hostel = primary([room('001', capacity=1), room('002', capacity=2, occupants=['P1']),
+                          room('003', capacity=3, occupants=['P2'])])
+        students = ['S1', 'S2', 'S3', 'S4']
+        [result] = plan_placements(hostel, [('0', source('009', students), students)])
+        self.assertEqual(placed(result), ([('003', ['S1', 'S2']), ('001', ['S3']), ('002', ['S4'])], [], []))
+
+    def test_students_left_over_are_unplaced(self):
+        hostel = primary([room('001', capacity=1)])
+        [result] = plan_placements(hostel, [('0', source('009', ['S1', 'S2']), ['S1', 'S2'])])
+        self.assertEqual(placed(result), ([('001', ['S1'])], [], ['S2']))
+
+    def test_students_already_in_the_primary_are_not_placed_again(self):
+        hostel = primary([room('001', capacity=2, occupants=['S1']), room('002', capacity=2)])
+        [result] = plan_placements(hostel, [('0', source('009', ['S1', 'S2', 'S2']), ['S1', 'S2', 'S2'])])
+        self.assertEqual(placed(result), ([('001', ['S2'])], ['S1'], []))
+
+    def test_reserved_and_other_gender_rooms_are_skipped(self):
+        hostel = primary([room('001', isReserved=True), room('002', gender='Female'),
+                          room('003', gender='Mixed', capacity=1), room('004', gender='Male', capacity=1)])
+        students = ['S1', 'S2', 'S3']
+        [result] = plan_placements(hostel, [('0', source('009', students, gender='Male'), students)])
+        self.assertEqual(placed(result), ([('003', ['S1']), ('004', ['S2'])], [], ['S3']))
+
+    def test_largest_rooms_are_placed_first_and_results_keep_input_order(self):
+        hostel = primary([room('001', capacity=3)])
+        small = ('0', source('008', ['S1']), ['S1'])
+        large = ('0', source('009', ['S2', 'S3', 'S4']), ['S2', 'S3', 'S4'])
+        results = plan_placements(hostel, [small, large])
+        self.assertEqual([placed(result) for result in results],
+                         [([], [], ['S1']), ([('001', ['S2', 'S3', 'S4'])], [], [])])
+
+    def test_primary_rooms_are_not_modified(self):
+        hostel = primary([room('001', capacity=2)])
+        plan_placements(hostel, [('0', source('009', ['S1']), ['S1'])])
+        self.assertEqual(hostel.floors[0].rooms[0].occupants, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Tests for the live occupancy and drift index behind `merger.py watch` (merger_watch).
+
+Run with: python -m unittest test_merger_watch
+"""
+import unittest
+
+from merger_watch import OccupancyIndex
+
+
+def hostel(name, rooms):
+    return {'name': name, 'floors': [{'number': '0', 'rooms': [
+        {'id': room_id, 'number': room_id[-3:], 'capacity': capacity, 'occupants': list(occupants)}
+        for room_id, capacity, occupants in rooms]}]}
+
+
+def allocation(student, hostel_id):
+    return {'studentRegNumber': student, 'hostelId': hostel_id}
+
+
+class OccupancyIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = OccupancyIndex()
+        self.index.apply('hostels', [('a', hostel("Block A", [('a-101', 2, ['S1'])])),
+                                     ('b', hostel("Block B", [('b-101', 2, ['S2'])]))])
+        self.index.apply('roomAllocations', [('x1', allocation('S1', 'a')), ('x2', allocation('S2', 'b'))])
+
+    def test_initial_load_reports_new_hostels_and_no_drift(self):
+        report = OccupancyIndex().apply('hostels', [('a', hostel("Block A", [('a-101', 2, ['S1'])]))])
+        self.assertEqual(report['occupancy'], [('a', "Block A", None, 1)])
+        self.assertEqual((self.index.student_count, self.index.drift), (2, {}))
+
+    def test_moving_a_student_updates_counts_and_drifts_their_allocation(self):
+        report = self.index.apply('hostels', [('a', hostel("Block A", [('a-101', 2, [])])),
+                                              ('b', hostel("Block B", [('b-101', 2, ['S2', 'S1'])]))])
+        self.assertEqual(report['occupancy'], [('a', "Block A", 1, 0), ('b', "Block B", 1, 2)])
+        self.assertEqual(report['drifted'], ['x1'])
+        self.assertEqual(self.index.drift['x1'][:3], ('needs_fix', 'S1', 'a'))
+        self.assertEqual(self.index.location('S1')['room_id'], 'b-101')
+
+    def test_fixing_the_allocation_resolves_the_drift(self):
+        self.index.apply('hostels', [('a', hostel("Block A", [('a-101', 2, [])])),
+                                     ('b', hostel("Block B", [('b-101', 2, ['S2', 'S1'])]))])
+        report = self.index.apply('roomAllocations', [('x1', allocation('S1', 'b'))])
+        self.assertEqual((report['resolved'], report['drifted']), (['x1'], []))
+        self.assertEqual(self.index.drift_counts(), {})
+
+    def test_deleting_a_hostel_changes_the_drift_status(self):
+        report = self.index.apply('hostels', [('a', None)])
+        self.assertEqual(report['occupancy'], [('a', "Block A", 1, None)])
+        self.assertEqual(self.index.drift['x1'][0], 'no_match')
+
+        # S1 turns up in b: a status change is reported as drift again
+        report = self.index.apply('hostels', [('b', hostel("Block B", [('b-101', 2, ['S2', 'S1'])]))])
+        self.assertEqual(report['drifted'], ['x1'])
+        self.assertEqual(self.index.drift_counts(), {'found_match': 1})
+
+    def test_removed_allocation_is_resolved(self):
+        self.index.apply('hostels', [('a', None)])
+        report = self.index.apply('roomAllocations', [('x1', None)])
+        self.assertEqual(report['resolved'], ['x1'])
+        self.assertNotIn('x1', self.index.allocations)
+
+    def test_room_going_over_capacity_is_reported_once(self):
+        over = hostel("Block A", [('a-101', 2, ['S1', 'S3', 'S4'])])
+        report = self.index.apply('hostels', [('a', over)])
+        self.assertEqual(report['over_capacity'], [('a', '101', 3, 2)])
+        self.assertEqual(self.index.apply('hostels', [('a', over)])['over_capacity'], [])
+
+    def test_unchanged_hostel_reports_nothing(self):
+        report = self.index.apply('hostels', [('a', hostel("Block A", [('a-101', 2, ['S1'])]))])
+        self.assertEqual(report, {'occupancy': [], 'drifted': [], 'resolved': [], 'over_capacity': []})
+
+    def test_student_listed_twice_is_located_in_the_hostel_indexed_last(self):
+        self.index.apply('hostels', [('b', hostel("Block B", [('b-101', 2, ['S2', 'S1'])]))])
+        self.assertEqual(self.index.location('S1')['hostel_id'], 'b')
+        self.index.apply('hostels', [('b', hostel("Block B", [('b-101', 2, ['S2'])]))])
+        self.assertEqual(self.index.location('S1')['hostel_id'], 'a')
+        self.assertEqual(self.index.drift, {})
+
+
+if __name__ == "__main__":
+    unittest.main()